@@ -1,90 +1,274 @@
-import logging
-from flask import Flask, send_from_directory, jsonify, abort, current_app
-from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager
-from routes import bp  # Import blueprint for routing
-from db_config import init_db  # Initialize database config
-
-# Initialize the Flask app
-app = Flask(__name__, static_folder='static/skyway_frontend/browser', static_url_path='/static')
-app.config['LOG_LEVEL'] = 'DEBUG'  # Logging level
-app.config["DEBUG"] = True  # Enable debug mode
-app.config['JWT_SECRET_KEY'] = 'your-jwt-secret-key'  # Secret key for JWT token signing
-app.config['SECRET_KEY'] = 'your-flask-secret-key'  # Secret key for Flask session management
-
-    # Configure logging
-logging.basicConfig(level=logging.DEBUG)  # Set the logging level to DEBUG
-logger = logging.getLogger('werkzeug')  # Grab the Flask/Werkzeug logger
-logger.setLevel(logging.DEBUG)
-
-# Optionally add a custom log format
-formatter = logging.Formatter(
-    '[%(asctime)s] [%(levelname)s] in %(module)s: %(message)s'
-)
-for handler in logger.handlers:
-    handler.setFormatter(formatter)
-
-    app.logger.handlers = logger.handlers
-    app.logger.setLevel(logging.DEBUG)
-
-
-    
-# Initialize the database
-init_db(app)
-
-# Enable Cross-Origin Resource Sharing (CORS)
-CORS(app)
-
-# Set up the JWT Manager
-jwt = JWTManager(app)
-
-# Register the blueprint for API routes
-app.register_blueprint(bp, url_prefix='/api')
-
-# Define the base route to serve the Angular app's 'index.csr.html'
-@app.route('/')
-def serve_index():
-    """
-    Serve the Angular app's index page for the base route.
-    """
-    return send_from_directory(app.static_folder, 'index.csr.html')
+import os
+from datetime import datetime, timedelta
+import click
+from flask import Flask
+from utils.logs.logs import configure_logging  # Non-blocking structured logging
+
 
-# Catch all non-API routes and redirect them to Angular's 'index.csr.html'
-@app.route('/<path:path>')
-def serve_path(path=None):
+def create_app(config=None):
     """
-    Serve the Angular index page for any path that doesn't match API routes.
-    Excludes API paths and serves 'index.csr.html' for others like '/sw/*'.
+    Create and configure the Flask application.
+
+    Creating the app never touches the database: the schema is created with `flask migrate` and
+    the initial data with `flask seed`, both run once per deployment rather than on every boot.
+    Blueprints and the modules behind them are imported here, not when this module is imported.
+
+    Args:
+        config (dict, optional): Config values overriding the defaults below.
+
+    Returns:
+        Flask: The configured application.
     """
-    if path and path.startswith('api/'):
-        return "Not found", 404  # Return 404 for API routes
-    if path and path.startswith('sw/'):
-        return send_from_directory(app.static_folder, 'index.csr.html')
-    return send_from_directory(app.static_folder, path)
-
-# Serve static files from the 'static' folder, excluding API paths
-@app.route('/static/<path:path>')
-def serve_static(path):
+    # Initialize the Flask app
+    app = Flask(__name__, static_folder=None)  # Static files are served by utils/frontend/assets.py
+    app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO')  # Logging level; DEBUG messages are only built when enabled
+    app.config['LOG_FORMAT'] = os.environ.get('LOG_FORMAT', 'text')  # 'text' or 'json'
+    app.config['LOG_DEBUG_SAMPLE_RATE'] = 1  # Keep one in N DEBUG records per message
+    app.config["DEBUG"] = os.environ.get('FLASK_DEBUG', '0').lower() in ('1', 'true')  # Debug mode, for development only
+    app.config['JWT_SECRET_KEY'] = 'your-jwt-secret-key'  # Secret key for JWT token signing
+    app.config['SECRET_KEY'] = 'your-flask-secret-key'  # Secret key for Flask session management
+    app.config['STATIC_ROOT'] = os.path.join(app.root_path, 'static', 'skyway_frontend', 'browser')  # Angular build output
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///skyway_airlines_systems.db'  # Relative to the instance folder
+    app.config['SCHEDULE_HORIZON_DAYS'] = 60  # Days ahead of today that flights are materialized from routes
+    app.config['SEARCH_CONCURRENCY'] = 4 if (os.cpu_count() or 1) > 1 else 0  # Threads per process searching legs in parallel (below 2: sequential)
+    app.config['PREWARM_SEARCHES'] = 50  # Popular searches each server worker replays on startup, in the background (0: off)
+    app.config['PREWARM_BUDGET_SECONDS'] = 5  # Time a worker spends prewarming at most
+    app.config['METRICS_ENABLED'] = True  # Request/SQL instrumentation, exposed at /api/_metrics
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # Bearer token scrapers send to /api/_metrics (None: not served)
+    app.config['METRICS_MULTIPROC_DIR'] = os.environ.get('METRICS_MULTIPROC_DIR')  # Folder server workers write their metrics to, relative to the instance folder (None: per process)
+    app.config['METRICS_SNAPSHOT_SECONDS'] = 5  # Delay between the metrics snapshots a server worker writes
+    app.config['ROLLUP_INTERVAL_SECONDS'] = 300  # Delay between a search and the analytics rollup that aggregates it
+    app.config['ROLLUP_SETTLE_SECONDS'] = 900  # Searches younger than this are left for the next rollup (late writes)
+    app.config['ROLLUP_HOURLY_RETENTION_DAYS'] = 14  # Hourly search rollups kept (None: forever)
+    app.config['ROLLUP_DAILY_RETENTION_DAYS'] = 730  # Daily search rollups and travel-date demand kept (None: forever)
+    app.config['SEARCH_HISTORY_RETENTION_DAYS'] = 90  # Raw searches kept once rolled up (None: forever)
+    app.config['SEARCH_HISTORY_PER_USER'] = 100  # Most recent searches kept per user once rolled up (None: all)
+    app.config['OUTBOX_FILE'] = 'booking_events.ndjson'  # Booking events appended here, relative to the instance folder (None: off)
+    app.config['OUTBOX_JOB'] = None  # Job name booking events are also queued as, for @job consumers (None: off)
+    app.config['OUTBOX_RETENTION_DAYS'] = 7  # Delivered booking events kept in the outbox table (None: forever)
+    app.config['JOBS_RETENTION_DAYS'] = 7  # Finished background jobs kept in the queue, purged by the workers (None: forever)
+    app.config['BOOKING_BATCH_LIMIT'] = 50  # Most bookings GET /api/booking/batch returns in one request
+    app.config['BOOKING_UPDATE_RETRIES'] = 3  # Times an update sent without a version is reapplied after a concurrent change
+    app.config['COMPRESS_MIN_SIZE'] = 500  # Responses smaller than this many bytes are sent uncompressed
+    app.config['COMPRESS_LEVEL'] = 6  # gzip level (1-9)
+    app.config['COMPRESS_BROTLI_QUALITY'] = 4  # brotli quality (0-11), used when the brotli package is installed
+    if config:
+        app.config.update(config)
+
+    # Configure logging once, before anything else logs: records go through a queue to a writer thread
+    configure_logging(app)
+
+    from flask_cors import CORS
+    from flask_jwt_extended import JWTManager
+    from db_config import init_db  # Initialize database config
+    from utils.jobs.queue import init_jobs  # Background job queue
+    from utils.metrics.metrics import init_metrics  # Request and SQL instrumentation
+    from utils.frontend.assets import init_static_assets  # Angular build served from a manifest
+    from utils.http.compression import init_compression  # gzip/brotli API responses
+    from utils.events.outbox import init_outbox  # Booking events for downstream consumers
+    from routes import bp  # Import blueprint for routing
+    import utils.jobs.tasks  # noqa: F401  Register the job handlers, so jobs queued by requests get their retry limits
+
+    # Initialize the background job queue (workers run separately: python -m utils.jobs.worker)
+    init_jobs(app)
+
+    # Initialize the database connection (no tables are created and no data is written here)
+    init_db(app)
+
+    # Record request latency, SQL and cache metrics (exposed at /api/_metrics)
+    init_metrics(app)
+
+    # Compress API responses for clients that accept it
+    init_compression(app)
+
+    # Set up the sinks booking events are delivered to (by the dispatch_outbox job or `flask dispatch-events`)
+    init_outbox(app)
+
+    # Enable Cross-Origin Resource Sharing (CORS)
+    CORS(app)
+
+    # Set up the JWT Manager
+    JWTManager(app)
+
+    # Register the blueprint for API routes
+    app.register_blueprint(bp, url_prefix='/api')
+
+    # Index the Angular build once, with its precompressed variants
+    init_static_assets(app)
+
+    register_frontend_routes(app)
+    register_commands(app)
+    return app
+
+
+def register_frontend_routes(app):
     """
-    Serve static files (images, JS, CSS, etc.) from the 'static' folder.
+    Serve the Angular frontend for every path that isn't an API route.
     """
-    return send_from_directory(app.static_folder, path)
+    assets = app.extensions['static_assets']
+
+    # Define the base route to serve the Angular app's 'index.csr.html'
+    @app.route('/')
+    def serve_index():
+        """
+        Serve the Angular app's index page for the base route, from memory.
+        """
+        return assets.serve_index()
 
-# Configure logging
-def configure_logging(app):
+    # Catch all non-API routes and redirect them to Angular's 'index.csr.html'
+    @app.route('/<path:path>')
+    def serve_path(path=None):
+        """
+        Serve the Angular index page for any path that doesn't match API routes.
+        Excludes API paths and serves 'index.csr.html' for others like '/sw/*' and client-side routes;
+        files of the build (bundles, images, ...) are served as they are.
+        """
+        if path and path.startswith('api/'):
+            return "Not found", 404  # Return 404 for API routes
+        if path and path.startswith('sw/'):
+            return assets.serve_index()
+        return assets.serve(path)
+
+    # Serve static files from the 'static' folder, excluding API paths
+    @app.route('/static/<path:path>')
+    def serve_static(path):
+        """
+        Serve static files (images, JS, CSS, etc.) from the 'static' folder.
+        """
+        return assets.serve(path)
+
+
+def register_commands(app):
     """
-    Configure logging for the Flask application.
+    Register the one-off maintenance commands (`flask migrate`, `flask seed`, ...).
     """
-    handler = logging.StreamHandler()  # Logs to stderr
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
+    # Create missing tables, columns and indexes; run once per deployment, before starting the servers
+    @app.cli.command('migrate')
+    def migrate_command():
+        """
+        Bring the database schema up to date with the models.
+        """
+        from db_config import upgrade_schema
+
+        upgrade_schema()
+        click.echo("Database schema is up to date.")
+
+    # Populate the database with airports, routes and flights; safe to run more than once
+    @app.cli.command('seed')
+    @click.option('--background', is_flag=True, help='Queue the seeding for the job workers instead of running it now.')
+    def seed_command(background):
+        """
+        Seed the database with the initial data.
+        """
+        if background:
+            from utils.jobs.queue import enqueue
+
+            enqueue('seed_database', dedupe_key='seed_database')
+            click.echo("Seeding has been queued.")
+            return
+
+        from seed_data import seed_data
+
+        seed_data()
+        click.echo("Database seeded.")
+
+    # Write .gz/.br variants of the Angular build; run after every frontend build
+    @app.cli.command('precompress-static')
+    def precompress_static_command():
+        """
+        Precompress the frontend build so it can be served without compressing on the fly.
+        """
+        from utils.frontend.assets import brotli, precompress
+
+        written = precompress(app.config['STATIC_ROOT'])
+        click.echo(f"Wrote {written} precompressed files" + ("." if brotli else " (gzip only; install brotli for .br)."))
+
+    # Expand recurring routes into dated flights; meant to run nightly (e.g. from cron)
+    @app.cli.command('materialize-schedules')
+    @click.option('--days', type=int, default=None, help='Days ahead of today to materialize (default: SCHEDULE_HORIZON_DAYS).')
+    @click.option('--chunk-size', type=int, default=None, help='Routes expanded per transaction.')
+    def materialize_schedules_command(days, chunk_size):
+        """
+        Materialize flights for all routes up to the schedule horizon.
+        """
+        from utils.flights.schedules import materialize_schedules
 
-    # Add the handler to Flask's app logger
-    app.logger.addHandler(handler)
-    app.logger.setLevel(getattr(logging, app.config['LOG_LEVEL'], logging.DEBUG))  # Use the log level from config
+        through_date = datetime.utcnow().date() + timedelta(days=days) if days is not None else None
+        options = {'chunk_size': chunk_size} if chunk_size else {}
+        created = materialize_schedules(through_date=through_date, **options)
+        click.echo(f"Materialized {created} flights.")
 
-# Run the Flask app in debug mode for development purposes
+    # Aggregate search history into the analytics tables; the job queue also does this after searches
+    @app.cli.command('rollup-searches')
+    @click.option('--settle-seconds', type=float, default=None, help='Skip searches younger than this (default: ROLLUP_SETTLE_SECONDS).')
+    @click.option('--no-compact', is_flag=True, help='Do not apply the retention policies afterwards.')
+    def rollup_searches_command(settle_seconds, no_compact):
+        """
+        Roll up new searches into the per-route analytics tables.
+        """
+        from utils.analytics.rollups import compact_search_analytics, roll_up_searches
+
+        aggregated = roll_up_searches(settle_seconds=settle_seconds)
+        click.echo(f"Rolled up {aggregated} searches.")
+        if not no_compact:
+            deleted = compact_search_analytics()
+            click.echo("Deleted " + (", ".join(f"{count} {name}" for name, count in deleted.items()) or "nothing") + ".")
+
+    # Deliver booking events to the outbox sinks; with --follow, keep streaming them as they are written
+    @app.cli.command('dispatch-events')
+    @click.option('--follow', is_flag=True, help='Keep dispatching new events until interrupted.')
+    @click.option('--interval', type=float, default=1.0, help='Seconds between checks for new events, with --follow.')
+    def dispatch_events_command(follow, interval):
+        """
+        Dispatch pending booking events to the configured sinks.
+        """
+        from utils.events.outbox import dispatch_events, follow_events
+
+        if follow:
+            click.echo(f"Dispatching booking events every {interval} s; press Ctrl+C to stop.")
+            try:
+                follow_events(poll_interval=interval)
+            except KeyboardInterrupt:
+                pass
+            return
+        delivered = dispatch_events()
+        click.echo("Delivered " + (", ".join(f"{count} events to {name}" for name, count in delivered.items()) or "nothing (no sinks)") + ".")
+
+    # Create user accounts in bulk from a CSV (with a header row) or NDJSON file, e.g. corporate accounts
+    @app.cli.command('import-users')
+    @click.argument('source', type=click.File('r', encoding='utf-8'))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None, help='File format (default: from the extension).')
+    @click.option('--chunk-size', type=int, default=1000, help='Users checked and inserted per transaction.')
+    @click.option('--processes', type=int, default=None, help='Password hashing processes (default: one per CPU).')
+    def import_users_command(source, fmt, chunk_size, processes):
+        """
+        Import users from SOURCE ('-' for stdin); emails already registered are skipped.
+        """
+        from utils.users.bulk import format_for, import_users, read_users
+
+        counts = import_users(read_users(source, fmt or format_for(source.name)), chunk_size=chunk_size,
+                              processes=processes)
+        click.echo(f"Created {counts['created']} users; skipped {counts['existing']} existing, "
+                   f"{counts['duplicate']} duplicate and {counts['invalid']} invalid records.")
+
+    # Write every user to a CSV or NDJSON file, streaming the rows
+    @app.cli.command('export-users')
+    @click.argument('target', type=click.File('w', encoding='utf-8'))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None, help='File format (default: from the extension).')
+    @click.option('--include-deleted', is_flag=True, help='Also export soft-deleted users.')
+    @click.option('--include-password-hashes', is_flag=True, help='Export the password hashes too, for re-import elsewhere.')
+    def export_users_command(target, fmt, include_deleted, include_password_hashes):
+        """
+        Export users to TARGET ('-' for stdout).
+        """
+        from utils.users.bulk import export_users, format_for
+
+        written = export_users(target, fmt or format_for(target.name), include_deleted=include_deleted,
+                               include_password_hashes=include_password_hashes)
+        click.echo(f"Exported {written} users.", err=True)
+
+
+# Run the Flask development server; production uses gunicorn (see wsgi.py and gunicorn.conf.py)
 if __name__ == '__main__':
-    configure_logging(app)
-    app.run(debug=True)
+    app = create_app()
+    app.run(debug=app.config['DEBUG'])
@@ -0,0 +1,75 @@
+"""
+Measure payload size and CPU cost of compressing realistic search responses.
+
+Builds round-trip search responses (outgoing and returning pages serialized exactly as
+`/api/search_flights` sends them, in the full and the compact format) and compresses them with
+gzip and, if installed, brotli at several levels.
+
+Run from the backend directory:
+    python -m benchmarks.bench_compression --flights 20000 --per-page 20 100 500
+"""
+import argparse
+import gzip
+import timeit
+
+from flask import json
+
+from benchmarks.common import create_bench_app, seed_airports, seed_flights
+from utils.flights.flights import get_all_flights, serialize_flights
+from utils.http.compression import brotli
+
+GZIP_LEVELS = (1, 6, 9)
+BROTLI_QUALITIES = (1, 4, 6, 11)
+
+
+def search_response(per_page, compact=False):
+    """
+    Serialize a round-trip search response with `per_page` flights each way.
+    """
+    outgoing = get_all_flights(per_page=per_page)
+    returning = get_all_flights(page=2, per_page=per_page)
+    airports = {} if compact else None
+    response = {
+        'outgoing_flights': serialize_flights(outgoing, airports),
+        'returning_flights': serialize_flights(returning, airports),
+    }
+    if compact:
+        response['airports'] = airports
+    return json.dumps(response).encode()
+
+
+def codecs():
+    for level in GZIP_LEVELS:
+        yield f'gzip-{level}', lambda data, level=level: gzip.compress(data, level)
+    if brotli is not None:
+        for quality in BROTLI_QUALITIES:
+            yield f'br-{quality}', lambda data, quality=quality: brotli.compress(data, quality=quality)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--flights', type=int, default=20000, help='Number of flights to seed')
+    parser.add_argument('--per-page', type=int, nargs='+', default=[20, 100, 500], help='Flights per direction')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of timed runs')
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    with app.app_context():
+        seed_flights(args.flights, seed_airports())
+        payloads = {(per_page, compact): search_response(per_page, compact)
+                    for per_page in args.per_page for compact in (False, True)}
+
+    if brotli is None:
+        print("brotli is not installed; only gzip is measured")
+    for (per_page, compact), data in payloads.items():
+        print(f"\n{per_page} flights each way, {'compact' if compact else 'full'} format: "
+              f"{len(data) / 1024:.1f} KiB raw")
+        for name, compress in codecs():
+            size = len(compress(data))
+            seconds = min(timeit.repeat(lambda: compress(data), number=1, repeat=args.repeat))
+            print(f"  {name:<8} {size / 1024:8.1f} KiB  {len(data) / size:5.1f}x  {seconds * 1000:7.2f} ms  "
+                  f"{len(data) / seconds / 2 ** 20:7.1f} MiB/s")
+
+
+if __name__ == '__main__':
+    main()
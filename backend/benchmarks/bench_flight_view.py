@@ -0,0 +1,68 @@
+"""
+Compare loading search results as ORM `Flight` objects with loading `FlightView` snapshots.
+
+Reports the latency and the peak Python memory of loading and serializing one page of results.
+
+Run from the backend directory:
+    python -m benchmarks.bench_flight_view --flights 100000 --per-page 500
+"""
+import argparse
+import timeit
+import tracemalloc
+
+from models import db, Flight
+from benchmarks.common import create_bench_app, seed_airports, seed_flights
+from utils.flights.flights import get_all_flights, serialize_flights
+
+
+def search_orm(per_page):
+    """
+    Load and serialize a page of flights through the ORM, as search did before `FlightView`.
+    """
+    flights = Flight.query.order_by(Flight.start_date, Flight.id).limit(per_page).all()
+    result = serialize_flights(flights)
+    db.session.expunge_all()  # Drop the identity map, as the end of a request would
+    return result
+
+
+def search_view(per_page):
+    """
+    Load and serialize a page of flights as `FlightView` snapshots.
+    """
+    return serialize_flights(get_all_flights(per_page=per_page))
+
+
+def measure(func, per_page, repeat):
+    latency = min(timeit.repeat(lambda: func(per_page), number=1, repeat=repeat))
+    tracemalloc.start()
+    func(per_page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latency, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--flights', type=int, default=10000, help='Number of flights to seed')
+    parser.add_argument('--per-page', type=int, default=500, help='Number of flights loaded per search')
+    parser.add_argument('--repeat', type=int, default=10, help='Number of timed runs')
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    with app.app_context():
+        seed_flights(args.flights, seed_airports())
+
+        assert search_orm(args.per_page) == search_view(args.per_page)
+
+        orm_latency, orm_peak = measure(search_orm, args.per_page, args.repeat)
+        view_latency, view_peak = measure(search_view, args.per_page, args.repeat)
+
+    print(f"flights: {args.flights}, page size: {args.per_page}")
+    print(f"orm:  {orm_latency * 1000:8.2f} ms  {orm_peak / 1024:8.1f} KiB peak")
+    print(f"view: {view_latency * 1000:8.2f} ms  {view_peak / 1024:8.1f} KiB peak")
+    print(f"latency reduction: {(1 - view_latency / orm_latency) * 100:.0f}%, "
+          f"memory reduction: {(1 - view_peak / orm_peak) * 100:.0f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Microbenchmark comparing per-flight pricing with the batch (NumPy) pricing path.
+
+Run from the backend directory:
+    python -m benchmarks.bench_pricing --flights 1000
+"""
+import argparse
+import random
+import timeit
+from datetime import date, datetime, timedelta
+
+from utils.flights.pricing import flight_cost, flight_duration, parse_time, price_columns
+
+
+def generate_columns(count, seed=42):
+    """
+    Generate a column-oriented set of flights shaped like the seeded schedule.
+    """
+    rng = random.Random(seed)
+    departure_times, arrival_times, start_dates, end_dates = [], [], [], []
+    today = date.today()
+    for _ in range(count):
+        departure_minutes = rng.randint(6 * 60, 21 * 60 + 59)
+        arrival_minutes = (departure_minutes + rng.randint(55, 180)) % 1440
+        start_date = today + timedelta(days=rng.randint(1, 365))
+        departure_times.append(_clock(departure_minutes))
+        arrival_times.append(_clock(arrival_minutes))
+        start_dates.append(start_date)
+        end_dates.append(start_date + timedelta(days=rng.randint(1, 2)))
+    return departure_times, arrival_times, start_dates, end_dates
+
+
+def _clock(minutes):
+    hour, minute = divmod(minutes, 60)
+    return f"{(hour % 12) or 12:02d}:{minute:02d} {'PM' if hour >= 12 else 'AM'}"
+
+
+def price_per_object(departure_times, arrival_times, start_dates, end_dates):
+    """
+    Price flights one at a time, the way `Flight.duration()` and `Flight.cost()` do.
+    """
+    results = []
+    for departure_time, arrival_time, start_date, end_date in zip(departure_times, arrival_times,
+                                                                  start_dates, end_dates):
+        duration = flight_duration(start_date, departure_time, end_date, arrival_time)
+        results.append((duration, flight_cost(duration)))
+    return results
+
+
+def price_baseline(departure_times, arrival_times, start_dates, end_dates):
+    """
+    Price flights the way `Flight.duration()` did before the pricing module, to check fares didn't change.
+    """
+    results = []
+    for departure_time, arrival_time, start_date, end_date in zip(departure_times, arrival_times,
+                                                                  start_dates, end_dates):
+        departure = datetime.combine(start_date, datetime.strptime(departure_time, '%I:%M %p').time())
+        arrival = datetime.combine(end_date, datetime.strptime(arrival_time, '%I:%M %p').time())
+        duration = round((arrival - departure).total_seconds() / 3600, 1)
+        results.append((duration, f'${duration * 47:.2f}'))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--flights', type=int, default=1000, help='Number of flights to price')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of timed runs')
+    args = parser.parse_args()
+
+    columns = generate_columns(args.flights)
+
+    # Both paths must agree, with each other and with the original pricing, before their timings mean anything
+    per_object = price_per_object(*columns)
+    durations, costs = price_columns(*columns)
+    assert per_object == price_baseline(*columns)
+    assert [duration for duration, _ in per_object] == durations.tolist()
+    assert [cost for _, cost in per_object] == [f'${cost:.2f}' for cost in costs.tolist()]
+
+    def run_per_object():
+        parse_time.cache_clear()  # Measure a cold request, as the first search after a deploy would be
+        price_per_object(*columns)
+
+    def run_batch():
+        parse_time.cache_clear()
+        price_columns(*columns)
+
+    per_object_time = min(timeit.repeat(run_per_object, number=1, repeat=args.repeat))
+    batch_time = min(timeit.repeat(run_batch, number=1, repeat=args.repeat))
+
+    print(f"flights:    {args.flights}")
+    print(f"per-object: {per_object_time * 1000:.2f} ms")
+    print(f"batch:      {batch_time * 1000:.2f} ms")
+    print(f"speedup:    {per_object_time / batch_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
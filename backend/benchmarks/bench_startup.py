@@ -0,0 +1,72 @@
+"""
+Check that the application starts within a time budget and without writing to the database.
+
+Each run happens in a fresh interpreter, so module imports are measured cold. Exits with status 1
+if the median startup exceeds the budget or if booting the app created any database file, so it
+can gate CI.
+
+Run from the backend directory:
+    python -m benchmarks.bench_startup --budget-ms 1500 --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Runs in the child interpreter: time the import of the app module and the app factory separately
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + sys.argv[1], 'JOBS_DATABASE': sys.argv[2]})
+created = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_ms': (created - imported) * 1000}))
+"""
+
+
+def measure_once(backend_dir):
+    with tempfile.TemporaryDirectory() as scratch:
+        database = os.path.join(scratch, 'app.db')
+        jobs_database = os.path.join(scratch, 'jobs.db')
+        output = subprocess.run([sys.executable, '-c', PROBE, database, jobs_database], cwd=backend_dir,
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result['files_written'] = sorted(os.listdir(scratch))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold startup time of the SkyWay app.')
+    parser.add_argument('--runs', type=int, default=5, help='Number of fresh interpreters to start')
+    parser.add_argument('--budget-ms', type=float, default=1500, help='Maximum median import + create time')
+    args = parser.parse_args()
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = [measure_once(backend_dir) for _ in range(args.runs)]
+
+    import_ms = statistics.median(result['import_ms'] for result in results)
+    create_ms = statistics.median(result['create_ms'] for result in results)
+    total_ms = statistics.median(result['import_ms'] + result['create_ms'] for result in results)
+    written = sorted({name for result in results for name in result['files_written']})
+
+    print(f"import app:   {import_ms:8.1f} ms (median of {args.runs})")
+    print(f"create_app(): {create_ms:8.1f} ms")
+    print(f"total:        {total_ms:8.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print(f"files written at boot: {', '.join(written) or 'none'}")
+
+    failed = False
+    if total_ms > args.budget_ms:
+        print("FAIL: startup is over budget")
+        failed = True
+    if written:
+        print("FAIL: startup must not write to the database; use `flask migrate` and `flask seed`")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
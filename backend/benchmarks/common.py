@@ -0,0 +1,70 @@
+"""
+Shared helpers for the benchmark scripts: a standalone app and synthetic schedules.
+"""
+import random
+import uuid
+from datetime import date, timedelta
+
+from flask import Flask
+
+from models import db, Airport, Flight
+from seed_data import load_airports_from_json
+
+
+def create_bench_app(database_uri='sqlite://'):
+    """
+    Create a minimal Flask app bound to its own database, without running the seeder.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def seed_airports():
+    """
+    Insert the bundled airports and return them.
+    """
+    for airport in load_airports_from_json('airports.json'):
+        db.session.add(Airport(code=airport['code'], name=airport['name']))
+    db.session.commit()
+    return Airport.query.all()
+
+
+def seed_flights(count, airports, days=30, seed=42, chunk_size=10000):
+    """
+    Bulk insert `count` synthetic flights spread over the next `days` days.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    rows = []
+    for _ in range(count):
+        from_airport, to_airport = rng.sample(airports, 2)
+        departure_minutes = rng.randint(6 * 60, 21 * 60 + 59)
+        arrival_minutes = (departure_minutes + rng.randint(55, 180)) % 1440
+        start_date = today + timedelta(days=rng.randint(1, days))
+        flight_id = str(uuid.uuid4())
+        rows.append({
+            'id': flight_id,
+            'flight_num': f"SKY-{flight_id}",
+            'departure_airport_id': from_airport.id,
+            'arrival_airport_id': to_airport.id,
+            'departure_time': _clock(departure_minutes),
+            'arrival_time': _clock(arrival_minutes),
+            'start_date': start_date,
+            'end_date': start_date + timedelta(days=1 if arrival_minutes < departure_minutes else 0),
+        })
+        if len(rows) >= chunk_size:
+            db.session.execute(Flight.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(Flight.__table__.insert(), rows)
+    db.session.commit()
+
+
+def _clock(minutes):
+    hour, minute = divmod(minutes, 60)
+    return f"{(hour % 12) or 12:02d}:{minute:02d} {'PM' if hour >= 12 else 'AM'}"
@@ -0,0 +1,200 @@
+"""
+Load test the API under different server configurations.
+
+For each configuration the server is started from the backend directory, a test user is logged in
+and every scenario is run with a pool of concurrent clients. Reports requests per second and
+latency percentiles per route.
+
+Run from the backend directory, against a seeded database:
+    python -m benchmarks.load_test --configs flask gunicorn --requests 2000 --concurrency 16
+    python -m benchmarks.load_test --url http://127.0.0.1:8000  # An already running server
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from email.utils import parsedate_to_datetime
+
+# Server command lines (run from the backend directory) and extra environment, per configuration
+CONFIGURATIONS = {
+    'flask-debug': ([sys.executable, '-m', 'flask', '--app', 'app', 'run', '--no-reload', '--port', '{port}'],
+                    {'FLASK_DEBUG': '1'}),
+    'flask': ([sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', '{port}'], {}),
+    'gunicorn-sync': ([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--worker-class', 'sync',
+                       '--bind', '127.0.0.1:{port}', 'wsgi:app'], {}),
+    'gunicorn': ([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                  '--bind', '127.0.0.1:{port}', 'wsgi:app'], {}),
+}
+
+TEST_USER = {'name': 'Load Test', 'email': 'loadtest@skyway.test', 'password': 'load-test-password'}
+
+
+def call(base_url, path, method='GET', body=None, token=None, timeout=30):
+    """
+    Make one request and return `(status, parsed JSON or None)`.
+    """
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method)
+    if data is not None:
+        req.add_header('Content-Type', 'application/json')
+    if token:
+        req.add_header('Authorization', f'Bearer {token}')
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            payload = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        payload = e.read()
+        status = e.code
+    try:
+        return status, json.loads(payload)
+    except ValueError:
+        return status, None
+
+
+def wait_until_ready(base_url, process=None, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'Server exited with code {process.returncode}')
+        try:
+            if call(base_url, '/api/airports', timeout=2)[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f'Server at {base_url} not ready after {timeout}s')
+
+
+def build_scenarios(base_url):
+    """
+    Log in the test user and pick a searchable route. Returns `{name: (path, token)}`.
+    """
+    call(base_url, '/api/register', 'POST', TEST_USER)  # Fails harmlessly if the user already exists
+    status, body = call(base_url, '/api/login', 'POST', {'email': TEST_USER['email'], 'password': TEST_USER['password']})
+    if status != 200:
+        raise RuntimeError(f'Login failed with status {status}')
+    token = body['access_token']
+
+    # Find a route with flights in the next week, so searches return real results
+    depart = date.today() + timedelta(days=1)
+    status, body = call(base_url, f'/api/search_flights?from=ANY&to=ANY&depart={depart}&type=One-way', token=token)
+    flights = (body or {}).get('outgoing_flights') or []
+    if status != 200 or not flights:
+        raise RuntimeError('No flights found; seed the database first')
+    flight = flights[0]
+    flight_date = parse_date(flight['start_date'])
+    route = f"from={flight['departure_airport']['code']}&to={flight['arrival_airport']['code']}&depart={flight_date}"
+    return_date = flight_date + timedelta(days=3)
+
+    return {
+        'airports': ('/api/airports', None),
+        'search_oneway': (f'/api/search_flights?{route}&type=One-way&guests=1', token),
+        'search_roundtrip': (f'/api/search_flights?{route}&return={return_date}&type=Roundtrip&guests=1', token),
+        'search_recent': ('/api/search_flights?recent=1', token),
+    }
+
+
+def parse_date(value):
+    """
+    Parse a date from the API, which serializes dates as ISO strings or HTTP dates.
+    """
+    if value[:4].isdigit():
+        return date.fromisoformat(value[:10])
+    return parsedate_to_datetime(value).date()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_scenario(base_url, path, token, requests, concurrency):
+    """
+    Send `requests` requests with `concurrency` clients and summarize the results.
+    """
+    def one(_):
+        started = time.perf_counter()
+        try:
+            status = call(base_url, path, token=token)[0]
+        except OSError:
+            status = None
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        'requests': requests,
+        'errors': sum(1 for _, status in results if status != 200),
+        'rps': requests / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def run_configuration(name, base_url, args):
+    scenarios = build_scenarios(base_url)
+    results = {}
+    for scenario, (path, token) in scenarios.items():
+        if args.scenarios and scenario not in args.scenarios:
+            continue
+        run_scenario(base_url, path, token, min(args.requests, 50), args.concurrency)  # Warm up
+        results[scenario] = run_scenario(base_url, path, token, args.requests, args.concurrency)
+        result = results[scenario]
+        print(f"{name:<14} {scenario:<18} {result['rps']:>9.1f} req/s   p50 {result['p50_ms']:>7.1f} ms   "
+              f"p99 {result['p99_ms']:>7.1f} ms   errors {result['errors']}")
+    return results
+
+
+def start_server(name, port):
+    command, env = CONFIGURATIONS[name]
+    command = [part.format(port=port) for part in command]
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen(command, cwd=backend_dir, env={**os.environ, **env},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the SkyWay API under different server configurations.')
+    parser.add_argument('--configs', nargs='+', choices=sorted(CONFIGURATIONS), default=['flask', 'gunicorn'])
+    parser.add_argument('--url', help='Test an already running server instead of starting one')
+    parser.add_argument('--port', type=int, default=8765, help='Port for the servers started by the test')
+    parser.add_argument('--scenarios', nargs='+', help='Only run these scenarios')
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    results = {}
+    if args.url:
+        wait_until_ready(args.url)
+        results['external'] = run_configuration('external', args.url.rstrip('/'), args)
+    else:
+        for name in args.configs:
+            base_url = f'http://127.0.0.1:{args.port}'
+            process = start_server(name, args.port)
+            try:
+                wait_until_ready(base_url, process)
+                results[name] = run_configuration(name, base_url, args)
+            finally:
+                process.terminate()
+                process.wait(timeout=60)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""
+Generate realistic load against a running server by replaying recorded searches.
+
+Searches come from the `search_history` table, so the mix of routes, lead times, trip types and
+party sizes (and how skewed they are) matches real traffic. Dates are shifted to keep each
+search's lead time: a search made on May 1st for May 15th is replayed for two weeks from today.
+Searches are mixed with logins, registrations and bookings (a search followed by the booking of
+its first flight), in the proportions given by `--mix`.
+
+Requests are sent open-loop: they are scheduled at the `--rate` arrival rate (Poisson arrivals)
+whether or not earlier ones have finished, and latency is measured from the scheduled start. A
+saturated server therefore shows up as growing latency instead of silently lowering the rate.
+
+Run from the backend directory, against a running server and the database it uses:
+    python -m benchmarks.replay --url http://127.0.0.1:8000 --rate 50 --duration 60 --concurrency 32
+    python -m benchmarks.replay --mode replay --speed 60 --requests 2000  # Recorded order and pacing, 60x faster
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import NamedTuple, Optional
+from urllib.parse import urlencode
+
+from benchmarks.load_test import call, percentile, wait_until_ready
+
+DEFAULT_MIX = 'search=0.85,booking=0.08,login=0.05,register=0.02'
+
+# Statuses that are normal outcomes rather than errors (a search may find no flights)
+EXPECTED_STATUSES = {
+    'search': {200, 304, 404},
+    'booking': {201},
+    'login': {200},
+    'register': {200, 201},
+}
+
+
+class RecordedSearch(NamedTuple):
+    """
+    A row of `search_history`, with its dates shifted to today.
+    """
+    departure_city: str
+    arrival_city: str
+    departure_date: Optional[date]
+    return_date: Optional[date]
+    trip_type: Optional[str]
+    guests: int
+    offset: float  # Seconds since the first replayed search was made
+
+    def query_string(self):
+        params = {'from': self.departure_city, 'to': self.arrival_city, 'guests': self.guests}
+        if self.departure_date:
+            params['depart'] = self.departure_date.isoformat()
+        if self.return_date:
+            params['return'] = self.return_date.isoformat()
+        if self.trip_type:
+            params['type'] = self.trip_type
+        return urlencode(params)
+
+
+def load_searches(database_uri=None, since_days=None, limit=None):
+    """
+    Read the recorded searches, oldest first, with their dates moved to keep the same lead time from today.
+    """
+    from app import create_app
+    from models import SearchHistory
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_uri} if database_uri else None)
+    today = date.today()
+    with app.app_context():
+        query = SearchHistory.query.filter(SearchHistory.departure_city.isnot(None),
+                                           SearchHistory.arrival_city.isnot(None))
+        if since_days:
+            since = date.today() - timedelta(days=since_days)
+            query = query.filter(SearchHistory.searched_at >= since)
+        query = query.order_by(SearchHistory.searched_at)
+        if limit:
+            query = query.limit(limit)
+        rows = query.all()
+
+    searches = []
+    first = rows[0].searched_at if rows else None
+    for row in rows:
+        def shift(value):
+            if value is None:
+                return None
+            lead = (value - row.searched_at.date()).days
+            return today + timedelta(days=max(lead, 1))
+
+        searches.append(RecordedSearch(
+            row.departure_city, row.arrival_city, shift(row.departure_date), shift(row.return_date),
+            row.trip_type, row.guests or 1, (row.searched_at - first).total_seconds(),
+        ))
+    return searches
+
+
+class VirtualUsers:
+    """
+    Registered, logged-in test users whose tokens the generated requests use.
+    """
+
+    def __init__(self, base_url, password='replay-password'):
+        self.base_url = base_url
+        self.password = password
+        self.users = []  # (email, token)
+        self.lock = threading.Lock()
+
+    def register(self):
+        """
+        Register and log in a new user. Returns the status of the first failing step, or of the login.
+        """
+        email = f'replay-{uuid.uuid4().hex[:12]}@skyway.test'
+        status, _ = call(self.base_url, '/api/register', 'POST',
+                         {'name': 'Replay User', 'email': email, 'password': self.password})
+        if status != 201:
+            return status
+        status, body = call(self.base_url, '/api/login', 'POST', {'email': email, 'password': self.password})
+        if status == 200:
+            with self.lock:
+                self.users.append((email, body['access_token']))
+        return status
+
+    def populate(self, count):
+        with ThreadPoolExecutor(max_workers=min(count, 8)) as pool:
+            statuses = list(pool.map(lambda _: self.register(), range(count)))
+        if not self.users:
+            raise RuntimeError(f'Could not register any test user (statuses: {sorted(set(statuses))})')
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.users)
+
+
+class Generator:
+    """
+    Build and run the operations of a load test.
+    """
+
+    def __init__(self, base_url, searches, users, rng):
+        self.base_url = base_url
+        self.searches = searches
+        self.users = users
+        self.rng = rng
+
+    def search(self, recorded, user):
+        _, token = user
+        return call(self.base_url, f'/api/search_flights?{recorded.query_string()}&fields=id', token=token)[0]
+
+    def booking(self, recorded, user):
+        _, token = user
+        status, body = call(self.base_url, f'/api/search_flights?{recorded.query_string()}&fields=id', token=token)
+        flights = (body or {}).get('outgoing_flights') or []
+        if status != 200 or not flights:
+            return 'no_flights'
+        passengers = [{'email': f'guest-{uuid.uuid4().hex[:12]}@skyway.test', 'first_name': 'Replay',
+                       'last_name': f'Guest {i}', 'dob': '1990-01-01'} for i in range(recorded.guests - 1)]
+        status, body = call(self.base_url, '/api/booking', 'POST', {
+            'departing_flight': {'flight_id': flights[0]['id']},
+            'return_date': recorded.return_date.isoformat() if recorded.return_date else None,
+            'passengers': passengers,
+        }, token=token)
+        if status == 400 and 'returning flight' in str((body or {}).get('error', '')):
+            return 'no_flights'  # No return flight near the return date: a normal outcome, not an error
+        return status
+
+    def login(self, _, user):
+        email, _ = user
+        return call(self.base_url, '/api/login', 'POST', {'email': email, 'password': self.users.password})[0]
+
+    def register(self, _, __):
+        return self.users.register()
+
+    def plan(self, args, mix):
+        """
+        Yield `(scheduled offset in seconds, kind, recorded search, user)` for every operation to send.
+
+        All the random choices are made here, on one thread, so a seed gives the same plan every run.
+        Users are picked among those registered before the run, whatever registrations complete meanwhile.
+        """
+        kinds, weights = zip(*mix.items())
+        users = self.users.snapshot()
+        if args.mode == 'replay':
+            searches = itertools.cycle(self.searches)
+        else:
+            searches = (self.rng.choice(self.searches) for _ in itertools.count())
+
+        offset = 0.0
+        span = self.searches[-1].offset + 1  # Seconds covered by the history, plus a gap before it repeats
+        for index in itertools.count():
+            if args.requests and index >= args.requests:
+                return
+            recorded = next(searches)
+            if args.mode == 'replay' and args.speed:
+                # Keep the recorded pacing, sped up; wrap around to the start when the history runs out
+                offset = ((index // len(self.searches)) * span + recorded.offset) / args.speed
+            else:
+                offset += self.rng.expovariate(args.rate)
+            if args.duration and offset > args.duration:
+                return
+            yield offset, self.rng.choices(kinds, weights)[0], recorded, self.rng.choice(users)
+
+    def run(self, args, mix):
+        """
+        Send the planned operations and return `(results, elapsed seconds)`, one result per operation:
+        `(kind, status, latency from the scheduled start, service time, start lag)`.
+        """
+        results = []
+        lock = threading.Lock()
+
+        def execute(kind, recorded, user, scheduled):
+            began = time.perf_counter()
+            try:
+                status = getattr(self, kind)(recorded, user)
+            except OSError:
+                status = None  # Connection refused, reset or timed out
+            ended = time.perf_counter()
+            with lock:
+                results.append((kind, status, ended - scheduled, ended - began, began - scheduled))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for offset, kind, recorded, user in self.plan(args, mix):
+                delay = started + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(execute, kind, recorded, user, started + offset)
+        return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed):
+    """
+    Summarize the results per operation kind and overall.
+    """
+    groups = {}
+    for result in results:
+        groups.setdefault(result[0], []).append(result)
+    groups['all'] = results
+
+    summary = {}
+    for kind, group in groups.items():
+        latencies = sorted(latency for _, _, latency, _, _ in group)
+        services = sorted(service for _, _, _, service, _ in group)
+        lags = sorted(lag for _, _, _, _, lag in group)
+        errors = sum(1 for result_kind, status, *_ in group
+                     if status != 'no_flights' and status not in EXPECTED_STATUSES[result_kind])
+        summary[kind] = {
+            'count': len(group),
+            'errors': errors,
+            'error_rate': errors / len(group) if group else 0.0,
+            'no_flights': sum(1 for _, status, *_ in group if status == 'no_flights'),
+            'throughput_rps': len(group) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p90_ms': percentile(latencies, 0.90) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'service_p50_ms': percentile(services, 0.50) * 1000,
+            'lag_p99_ms': percentile(lags, 0.99) * 1000,
+            'statuses': {str(status): sum(1 for _, s, *_ in group if s == status)
+                         for status in sorted({s for _, s, *_ in group}, key=str)},
+        }
+    return summary
+
+
+def print_summary(summary, elapsed):
+    print(f"{'operation':<10} {'count':>7} {'req/s':>8} {'errors':>7} {'p50 ms':>9} {'p90 ms':>9} "
+          f"{'p99 ms':>9} {'lag p99':>9}")
+    for kind, row in summary.items():
+        print(f"{kind:<10} {row['count']:>7} {row['throughput_rps']:>8.1f} {row['error_rate']:>6.1%} "
+              f"{row['p50_ms']:>9.1f} {row['p90_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['lag_p99_ms']:>9.1f}")
+    print(f"{elapsed:.1f} s elapsed. Latency is measured from each request's scheduled start; "
+          f"a growing lag means the client pool (--concurrency) was saturated.")
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        if kind.strip() not in EXPECTED_STATUSES:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{kind}' (use {', '.join(EXPECTED_STATUSES)})")
+        mix[kind.strip()] = float(weight or 1)
+    return {kind: weight for kind, weight in mix.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded searches (and logins, registrations and bookings) '
+                                                 'against a running SkyWay server.')
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server')
+    parser.add_argument('--database', help='SQLAlchemy URI of the database to read search_history from '
+                                           '(default: the app\'s)')
+    parser.add_argument('--mode', choices=['sample', 'replay'], default='sample',
+                        help='sample: draw searches at random (keeps their skew); replay: in recorded order')
+    parser.add_argument('--rate', type=float, default=20, help='Mean arrival rate, in operations per second')
+    parser.add_argument('--speed', type=float, help='Replay mode: follow the recorded pacing, this many times faster '
+                                                    '(instead of --rate)')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds of traffic to send (0: no limit)')
+    parser.add_argument('--requests', type=int, help='Stop after this many operations')
+    parser.add_argument('--concurrency', type=int, default=32, help='Most operations in flight at once')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'Weights of the operations (default: {DEFAULT_MIX})')
+    parser.add_argument('--users', type=int, default=20, help='Test users to register before starting')
+    parser.add_argument('--since-days', type=int, help='Only use searches made in the last N days')
+    parser.add_argument('--limit', type=int, help='Use at most this many recorded searches')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed, for repeatable runs')
+    parser.add_argument('--json', help='Also write the summary to this file')
+    args = parser.parse_args()
+    if not args.duration and not args.requests:
+        parser.error('set --duration or --requests')
+
+    searches = load_searches(args.database, args.since_days, args.limit)
+    if not searches:
+        raise SystemExit('No recorded searches to replay; search_history is empty.')
+    print(f"Loaded {len(searches)} recorded searches "
+          f"({len({(s.departure_city, s.arrival_city) for s in searches})} distinct routes)")
+
+    base_url = args.url.rstrip('/')
+    wait_until_ready(base_url)
+    users = VirtualUsers(base_url)
+    users.populate(args.users)
+
+    generator = Generator(base_url, searches, users, random.Random(args.seed))
+    results, elapsed = generator.run(args, args.mix)
+    summary = summarize(results, elapsed)
+    print_summary(summary, elapsed)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': {key: value for key, value in vars(args).items() if key != 'mix'},
+                       'mix': args.mix, 'summary': summary}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
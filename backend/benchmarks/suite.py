@@ -0,0 +1,329 @@
+"""
+Benchmark suite for the hot paths, at several schedule sizes, with JSON results that can be
+compared between commits.
+
+Each scale seeds a fresh SQLite database with the bundled airports and synthetic flights (see
+common.py), then times:
+- micro benchmarks: `get_close_flights`, `Flight.to_dict`, `serialize_flights`, `Booking.to_dict`,
+  `create_booking_entry` and the login check (password verification and token);
+- macro benchmarks: the API endpoints, through the Flask test client.
+
+Run from the backend directory:
+    python -m benchmarks.suite run --scales 1k 100k --output bench.json
+    python -m benchmarks.suite compare baseline.json bench.json          # Exits 1 on regressions
+    python -m benchmarks.suite run --scales 1k --baseline baseline.json  # Both at once
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import seed_airports, seed_flights
+
+# Number of flights seeded per scale
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+
+# A benchmark regresses when its median grows by more than this factor...
+DEFAULT_THRESHOLD = 1.25
+# ...except these, which are noisier or dominated by deliberately slow work (bcrypt)
+THRESHOLDS = {
+    'micro.create_booking_entry': 1.5,
+    'micro.login': 1.5,
+    'macro.login': 1.5,
+    'macro.create_booking': 1.5,
+}
+# Differences smaller than this are timer noise, whatever the ratio
+MIN_DELTA_MS = 0.05
+
+# Runs of the benchmarks that hash passwords; bcrypt takes a good fraction of a second per call
+SLOW_REPEAT = 5
+
+BENCH_USER = {'email': 'bench@skyway.test', 'password': 'bench-password'}
+
+
+def time_calls(func, repeat, warmup=1):
+    """
+    Call `func` `warmup` times untimed, then `repeat` times, and return the duration of each timed call.
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'median_ms': statistics.median(samples) * 1000,
+        'p95_ms': samples[min(len(samples) - 1, int(0.95 * len(samples)))] * 1000,
+        'min_ms': samples[0] * 1000,
+        'runs': len(samples),
+    }
+
+
+def create_suite_app(directory):
+    """
+    Create the full application (routes, JWT, job queue) on a fresh database in `directory`.
+    """
+    from app import create_app
+    from db_config import upgrade_schema
+    from utils.flights.airports import reset_airport_registry
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'bench.db'),
+        'JOBS_DATABASE': os.path.join(directory, 'jobs.db'),
+        'LOG_LEVEL': 'WARNING',
+        'METRICS_ENABLED': False,
+    })
+    with app.app_context():
+        upgrade_schema()
+    reset_airport_registry()  # The registry caches the airports of the previous scale's database
+    return app
+
+
+def prepare(flights):
+    """
+    Seed the database and pick the fixtures the benchmarks use. Must run in an app context.
+    """
+    from sqlalchemy import and_
+    from sqlalchemy.orm import aliased
+    from models import Booking, Flight, User, db
+    from utils.bookings.booking import create_booking_entry
+
+    seed_flights(flights, seed_airports())
+
+    user = User(first_name='Bench', last_name='User', email=BENCH_USER['email'])
+    user.set_password(BENCH_USER['password'])
+    db.session.add(user)
+    db.session.commit()
+
+    # A route with flights on a given day and a return flight on a later one
+    returning = aliased(Flight)
+    flight, returning = (db.session.query(Flight, returning)
+                         .join(returning, and_(returning.departure_airport_id == Flight.arrival_airport_id,
+                                               returning.arrival_airport_id == Flight.departure_airport_id,
+                                               returning.start_date > Flight.start_date))
+                         .order_by(Flight.start_date, Flight.id).first())
+    route = (flight.arrival_airport.code, flight.departure_airport.code)
+
+    # A round trip booking with two passengers
+    passengers = [{'email': f'passenger{i}@skyway.test', 'first_name': 'Passenger', 'last_name': str(i),
+                   'dob': '1990-01-01'} for i in range(2)]
+    response = create_booking_entry(user.id, flight.id, returning.id, passengers)
+    booking = db.session.get(Booking, response.json['data']['id'])
+
+    return {
+        'user_id': user.id,
+        'flight_id': flight.id,
+        'route': route,
+        'depart': flight.start_date,
+        'return_date': returning.start_date,
+        'empty_date': flight.start_date - timedelta(days=400),  # No flights near it: the fallback window runs too
+        'booking_id': booking.id,
+        'reference_number': booking.reference_number,
+        'passengers': passengers,
+    }
+
+
+def micro_benchmarks(fixtures):
+    """
+    Return `{name: (function, repeat override or None)}` for the functions behind the endpoints.
+    """
+    from flask_jwt_extended import create_access_token
+    from models import Booking, Flight, User, db
+    from utils.bookings.booking import create_booking_entry
+    from utils.flights.flights import get_close_flights, serialize_flights
+
+    destination, departure = fixtures['route']
+    orm_page = Flight.query.order_by(Flight.start_date, Flight.id).limit(20).all()
+    view_page = get_close_flights(destination, departure, fixtures['depart'])[0]
+
+    def booking_to_dict():
+        db.session.expire_all()  # Load the booking and its relationships again, as a request would
+        db.session.get(Booking, fixtures['booking_id']).to_dict()
+
+    def create_booking():
+        create_booking_entry(fixtures['user_id'], fixtures['flight_id'], None, fixtures['passengers'])
+
+    def login():
+        user = User.query.filter_by(email=BENCH_USER['email']).first()
+        if user.verify_password(BENCH_USER['password']):
+            create_access_token(identity=user.id)
+
+    return {
+        'micro.get_close_flights': (lambda: get_close_flights(destination, departure, fixtures['depart']), None),
+        'micro.get_close_flights_fallback': (
+            lambda: get_close_flights(destination, departure, fixtures['empty_date']), None),
+        'micro.flight_to_dict': (lambda: [flight.to_dict() for flight in orm_page], None),
+        'micro.serialize_flights': (lambda: serialize_flights(view_page), None),
+        'micro.booking_to_dict': (booking_to_dict, None),
+        'micro.create_booking_entry': (create_booking, None),
+        'micro.login': (login, SLOW_REPEAT),
+    }
+
+
+def macro_benchmarks(client, fixtures):
+    """
+    Return `{name: (function, repeat override or None)}` for the API endpoints, called through the test client.
+    """
+    response = client.post('/api/login', json={'email': BENCH_USER['email'], 'password': BENCH_USER['password']})
+    headers = {'Authorization': f"Bearer {response.json['access_token']}", 'Accept-Encoding': 'gzip'}
+    destination, departure = fixtures['route']
+    search = f"/api/search_flights?from={departure}&to={destination}&depart={fixtures['depart']}&guests=1"
+
+    def get(path):
+        def call():
+            response = client.get(path, headers=headers)
+            assert response.status_code == 200, (path, response.status_code)
+        return call
+
+    def create_booking():
+        response = client.post('/api/booking', headers=headers, json={
+            'departing_flight': {'flight_id': fixtures['flight_id']}, 'passengers': fixtures['passengers']})
+        assert response.status_code == 201, response.status_code
+
+    def login():
+        response = client.post('/api/login', json={'email': BENCH_USER['email'], 'password': BENCH_USER['password']})
+        assert response.status_code == 200, response.status_code
+
+    return {
+        'macro.airports': (get('/api/airports'), None),
+        'macro.search_oneway': (get(search + '&type=One-way'), None),
+        'macro.search_roundtrip': (get(search + f"&type=Roundtrip&return={fixtures['return_date']}"), None),
+        'macro.search_recent': (get('/api/search_flights?recent=1'), None),
+        'macro.view_booking': (get(f"/api/booking?reference_number={fixtures['reference_number']}"), None),
+        'macro.view_bookings_batch': (get(f"/api/booking/batch?ids={fixtures['booking_id']}"
+                                          f"&reference_numbers={fixtures['reference_number']}"), None),
+        'macro.create_booking': (create_booking, None),
+        'macro.login': (login, SLOW_REPEAT),
+    }
+
+
+def run_scale(scale, args):
+    """
+    Seed a fresh database at one scale and run every benchmark. Returns `{benchmark: summary}`.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_suite_app(directory)
+        with app.app_context():
+            started = time.perf_counter()
+            fixtures = prepare(SCALES[scale])
+            print(f"[{scale}] seeded {SCALES[scale]} flights in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+
+            benchmarks = micro_benchmarks(fixtures)
+            with app.test_client() as client:
+                benchmarks.update(macro_benchmarks(client, fixtures))
+                results = {}
+                for name, (func, repeat) in benchmarks.items():
+                    if args.only and not any(pattern in name for pattern in args.only):
+                        continue
+                    results[name] = summarize(time_calls(func, min(repeat or args.repeat, args.repeat)))
+                    print(f"[{scale}] {name:<36} {results[name]['median_ms']:9.3f} ms median   "
+                          f"{results[name]['p95_ms']:9.3f} ms p95", file=sys.stderr)
+        from models import db
+        with app.app_context():
+            db.engine.dispose()  # Release the database file before the directory is removed
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two result files. Returns `(rows, regressions)`, each row being
+    `(scale, benchmark, baseline ms, current ms, ratio, regressed)`.
+    """
+    rows = []
+    for scale, benchmarks in current['results'].items():
+        for name, summary in benchmarks.items():
+            before = baseline['results'].get(scale, {}).get(name)
+            if before is None:
+                continue
+            old_ms, new_ms = before['median_ms'], summary['median_ms']
+            ratio = new_ms / old_ms if old_ms else float('inf')
+            regressed = ratio > THRESHOLDS.get(name, threshold) and new_ms - old_ms > MIN_DELTA_MS
+            rows.append((scale, name, old_ms, new_ms, ratio, regressed))
+    return rows, [row for row in rows if row[-1]]
+
+
+def print_comparison(rows):
+    print(f"{'scale':<6} {'benchmark':<36} {'baseline':>11} {'current':>11} {'change':>8}")
+    for scale, name, old_ms, new_ms, ratio, regressed in rows:
+        print(f"{scale:<6} {name:<36} {old_ms:8.3f} ms {new_ms:8.3f} ms {ratio:7.2f}x"
+              + ("  REGRESSION" if regressed else ""))
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the SkyWay hot paths at several schedule sizes.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks and write the results as JSON')
+    run_parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=list(SCALES))
+    run_parser.add_argument('--repeat', type=int, default=50, help='Timed runs per benchmark')
+    run_parser.add_argument('--only', nargs='+', help='Only run benchmarks whose name contains one of these')
+    run_parser.add_argument('--output', help='Write the results to this file (default: stdout)')
+    run_parser.add_argument('--baseline', help='Compare with this result file and exit 1 on regressions')
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='Slowdown factor counted as a regression')
+
+    compare_parser = commands.add_parser('compare', help='Compare two result files; exit 1 on regressions')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help='Slowdown factor counted as a regression')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        current = {
+            'meta': {
+                'commit': git_commit(),
+                'created_at': datetime.utcnow().isoformat(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+                'repeat': args.repeat,
+            },
+            'results': {scale: run_scale(scale, args) for scale in args.scales},
+        }
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(current, f, indent=2)
+        else:
+            json.dump(current, sys.stdout, indent=2)
+            print()
+        if not args.baseline:
+            return
+        baseline = load_results(args.baseline)
+    else:
+        baseline, current = load_results(args.baseline), load_results(args.current)
+
+    rows, regressions = compare(baseline, current, args.threshold)
+    print_comparison(rows)
+    if regressions:
+        print(f"FAIL: {len(regressions)} benchmark(s) regressed")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
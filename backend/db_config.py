@@ -1,5 +1,9 @@
-from seed_data import seed_data  # Import seed data function to populate the database
-from models import db  # Import the db object from your models
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+
+from models import db, OutboxEvent, User  # Import the db object from your models
+import utils.cache.versions  # noqa: F401  Bumps table versions on writes, for HTTP caching
+import utils.users.scoping  # noqa: F401  Leaves soft-deleted users out of queries
 
 
 def init_db(flask_app):
@@ -7,10 +11,11 @@ def init_db(flask_app):
     Initialize the database for the Flask application.
 
     This function:
-        - Configures the SQLAlchemy URI to use SQLite for the database.
+        - Configures the SQLAlchemy URI to use SQLite for the database, unless one is configured.
         - Initializes the database with the Flask app.
-        - Creates all tables defined in the models.
-        - Calls a seed function to populate the database with initial data.
+
+    It doesn't connect to the database: tables are created by `flask migrate` (see `upgrade_schema`)
+    and the initial data is loaded by `flask seed`.
 
     Args:
         flask_app (Flask): The Flask application instance.
@@ -20,7 +25,7 @@ def init_db(flask_app):
     """
     try:
         # Set the URI for SQLite database
-        flask_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///skyway_airlines_systems.db'
+        flask_app.config.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite:///skyway_airlines_systems.db')
 
         # Disable the modification tracking feature (to save resources)
         flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -28,16 +33,80 @@ def init_db(flask_app):
         # Initialize the database with the Flask app
         db.init_app(flask_app)
 
-        # Create all tables defined by models
-        with flask_app.app_context():
-            # db.drop_all()  # Optional: Uncomment to drop all tables before creating them (use with caution)
-            db.create_all()  # Create all tables defined by your models
-
-            # Populate the database with seed data
-            seed_data()
-
-        print("Database initialized and seeded successfully.")
-
     except Exception as e:
         print(f"Error during database initialization: {str(e)}")
         raise e  # Re-raise the exception after logging it
+
+
+def rebuild_table(connection, table):
+    """
+    Recreate a table from its model, copying its rows, to change constraints or options SQLite can't alter.
+
+    Foreign keys pointing to the table refer to it by name, so they keep working once the new table
+    takes its name (foreign key enforcement is off, SQLite's default, while the old one is dropped).
+
+    Args:
+        connection (Connection): A connection in a transaction.
+        table (Table): The model's table.
+    """
+    name = table.name
+    rebuilt = table.to_metadata(db.MetaData(), name=f'_{name}_rebuild')
+    columns = ', '.join(column.name for column in table.columns)
+    connection.execute(CreateTable(rebuilt))
+    connection.execute(text(f'INSERT INTO {rebuilt.name} ({columns}) SELECT {columns} FROM {name}'))
+    connection.execute(text(f'DROP TABLE {name}'))
+    connection.execute(text(f'ALTER TABLE {rebuilt.name} RENAME TO {name}'))
+    for index in table.indexes:
+        index.create(connection)
+
+
+def upgrade_schema():
+    """
+    Bring the database schema up to date with the models.
+
+    `db.create_all()` only creates missing tables. For tables that already exist, this also adds
+    any new columns (nullable, or with a server default) and any missing indexes, so existing databases pick up model changes,
+    and converts values stored in an older format.
+
+    Must be called inside an application context.
+    """
+    db.create_all()
+
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    if column.server_default is not None:
+                        # Existing rows take the default, which also lets a NOT NULL column be added
+                        column_type += f' DEFAULT {column.server_default.arg.text}'
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+
+        # users.email used to be unique across deleted users too; it is now unique among active users,
+        # by a partial index. SQLite can't drop a constraint, so the table is rebuilt without it.
+        if any(constraint['column_names'] == ['email'] for constraint in inspector.get_unique_constraints('users')):
+            rebuild_table(connection, User.__table__)
+
+        # Outbox event IDs used to be plain rowids, which SQLite reuses once the newest rows are deleted.
+        # Rebuild the table with AUTOINCREMENT, and start its sequence past every ID already delivered.
+        outbox_sql = connection.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'outbox_events'")).scalar()
+        if 'AUTOINCREMENT' not in outbox_sql.upper():
+            rebuild_table(connection, OutboxEvent.__table__)
+            connection.execute(text("DELETE FROM sqlite_sequence WHERE name = 'outbox_events'"))
+            connection.execute(text(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT 'outbox_events', max("
+                "(SELECT coalesce(max(id), 0) FROM outbox_events), "
+                "(SELECT coalesce(max(last_event_id), 0) FROM outbox_checkpoints))"))
+
+        # Search dates used to be DateTime columns ('YYYY-MM-DD HH:MM:SS.ffffff'); keep the date part only
+        for column in ('departure_date', 'return_date'):
+            connection.execute(text(
+                f'UPDATE search_history SET {column} = substr({column}, 1, 10) WHERE length({column}) > 10'))
@@ -0,0 +1,101 @@
+"""
+Gunicorn settings for serving SkyWay in production.
+
+Run from the backend directory:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Settings can be overridden with environment variables (below) or on the command line.
+"""
+import multiprocessing
+import os
+
+# Address to listen on
+bind = os.environ.get('SKYWAY_BIND', '127.0.0.1:8000')
+
+# Worker processes; SQLite serializes writes, so more processes than this rarely helps
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+
+# Threaded workers: requests mostly wait on SQLite, so a few threads per process raise throughput
+worker_class = 'gthread'
+threads = int(os.environ.get('SKYWAY_THREADS', 4))
+
+# Import the app (and warm it up, see wsgi.py) once in the master; workers inherit it on fork
+preload_app = True
+
+# Recycle workers after a number of requests to bound memory growth; the jitter staggers restarts
+max_requests = int(os.environ.get('SKYWAY_MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+
+# Kill workers stuck on a request for this many seconds
+timeout = 30
+
+# On shutdown or reload, let in-flight requests finish for up to this many seconds
+graceful_timeout = 30
+
+# Keep idle client connections open briefly (useful behind a reverse proxy)
+keepalive = 5
+
+# PID file, used by `make reload-prod` to signal the master
+pidfile = os.environ.get('SKYWAY_PIDFILE', 'instance/gunicorn.pid')
+
+# Access logging costs a write per request; enable it with SKYWAY_ACCESS_LOG=-
+accesslog = os.environ.get('SKYWAY_ACCESS_LOG')
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+
+# Workers write their metrics to this folder in the instance folder, so scrapes see all of them
+os.environ.setdefault('METRICS_MULTIPROC_DIR', 'metrics')
+
+
+def on_starting(server):
+    """
+    Clear the metrics of a previous run, once when the master starts (a reload keeps them).
+    """
+    from wsgi import app
+    from utils.metrics.multiprocess import get_multiprocess_dir, reset_multiprocess_dir
+
+    directory = get_multiprocess_dir(app)
+    if directory is not None:
+        reset_multiprocess_dir(directory)
+
+
+def post_fork(server, worker):
+    """
+    Give each worker its own database connections instead of the ones inherited from the master,
+    then replay the most popular searches in the background (see utils/flights/prewarm.py).
+    Metrics snapshots start too (see utils/metrics/multiprocess.py).
+    """
+    from wsgi import app
+    from models import db
+    from utils.flights.prewarm import start_prewarm
+    from utils.metrics.multiprocess import start_snapshots
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+    start_snapshots(app)
+    start_prewarm(app)
+
+
+def worker_exit(server, worker):
+    """
+    Flush buffered log records and metrics before a worker exits (after max_requests or a reload).
+    """
+    from wsgi import app
+    from utils.logs.logs import stop_logging
+    from utils.metrics.multiprocess import flush_snapshot
+
+    flush_snapshot(app)
+    stop_logging()
+
+
+def child_exit(server, worker):
+    """
+    Add the metrics of an exited worker to the archive in the master, so counters don't go back
+    when workers are recycled.
+    """
+    from wsgi import app
+    from utils.metrics.multiprocess import archive_worker, get_multiprocess_dir
+
+    directory = get_multiprocess_dir(app)
+    if directory is not None:
+        archive_worker(directory, worker.pid)
@@ -1,9 +1,10 @@
 from datetime import datetime
+import json
 import bcrypt
 from flask_sqlalchemy import SQLAlchemy
 import uuid
 
-from flask import current_app
+from utils.flights.pricing import flight_cost, flight_duration
 
 # Initialize SQLAlchemy instance
 db = SQLAlchemy()
@@ -22,6 +23,52 @@ def default_uuid_generator():
     return str(uuid.uuid4())  # Generate a random UUID and convert it to a string
 
 
+def hash_password(password):
+    """
+    Hash a plain-text password with bcrypt.
+
+    A plain function rather than a `User` method so bulk imports can run it in worker processes.
+
+    Raises:
+        ValueError: If the password is empty.
+    """
+    if not password:
+        raise ValueError("Password cannot be empty")
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+def wants_field(fields, *names):
+    """
+    Check whether any of `names` is among the requested fields (`None` requests them all).
+    """
+    return fields is None or any(name in fields for name in names)
+
+
+def only_fields(data, fields):
+    """
+    Keep the requested fields of a serialized object (all of them if `fields` is None). The ID is always kept.
+    """
+    if fields is None:
+        return data
+    return {key: value for key, value in data.items() if key == 'id' or key in fields}
+
+
+def serialize_flight_airports(departure_airport, arrival_airport, airports=None, fields=None):
+    """
+    Serialize a flight's airports: embedded, or (compact format) as IDs into the `airports` map.
+    Only the airports among the requested `fields` are included.
+    """
+    pairs = [(name, airport) for name, airport in (('departure_airport', departure_airport),
+                                                   ('arrival_airport', arrival_airport))
+             if wants_field(fields, name)]
+    if airports is None:
+        return {name: airport.to_dict() if airport else None for name, airport in pairs}
+    for _, airport in pairs:
+        if airport is not None and airport.id not in airports:
+            airports[airport.id] = airport.to_dict()
+    return {f'{name}_id': airport.id if airport else None for name, airport in pairs}
+
+
 class Airport(db.Model):
     __tablename__ = 'airports'  # Table name in the database
 
@@ -75,11 +122,52 @@ class Airport(db.Model):
         return f'<Airport {self.code}: {self.name} >'
 
 
+class Route(db.Model):
+    __tablename__ = 'routes'
+
+    id = db.Column(db.String(36), primary_key=True, default=default_uuid_generator)  # UUID primary key
+    route_num = db.Column(db.String(10), unique=True, nullable=False)  # Prefix for the flight numbers of its departures
+
+    departure_airport_id = db.Column(db.String(36), db.ForeignKey('airports.id'), nullable=False)
+    arrival_airport_id = db.Column(db.String(36), db.ForeignKey('airports.id'), nullable=False)
+
+    departure_time = db.Column(db.String(10), nullable=False)  # Time stored in 12-hour format
+    arrival_time = db.Column(db.String(10), nullable=False)  # Time stored in 12-hour format
+    arrival_day_offset = db.Column(db.Integer, nullable=False, default=0)  # Days between departure and arrival
+    days_of_week = db.Column(db.String(7), nullable=False, default='1111111')  # Operating days, Monday first
+
+    valid_from = db.Column(db.Date, nullable=False)  # First day the route operates
+    valid_to = db.Column(db.Date, nullable=False)  # Last day the route operates
+    materialized_through = db.Column(db.Date)  # Last day already expanded into flights (watermark)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    departure_airport = db.relationship('Airport', foreign_keys=[departure_airport_id])
+    arrival_airport = db.relationship('Airport', foreign_keys=[arrival_airport_id])
+
+    def operates_on(self, day):
+        """
+        Check whether the route has a departure on the given date.
+        """
+        return self.valid_from <= day <= self.valid_to and self.days_of_week[day.weekday()] == '1'
+
+    def __repr__(self):
+        return f'<Route {self.route_num} {self.departure_time} {self.days_of_week}>'
+
+
 class Flight(db.Model):
     __tablename__ = 'flights'
+    __table_args__ = (
+        # Searches filter on the airport pair and a departure date range
+        db.Index('ix_flights_route_date', 'departure_airport_id', 'arrival_airport_id', 'start_date'),
+        db.Index('ix_flights_start_date', 'start_date'),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=default_uuid_generator)  # UUID primary key
-    flight_num = db.Column(db.String(10), unique=True, nullable=False)
+    # Materialized departures are numbered '<route_num>-YYYYMMDD': up to 10 + 9 characters
+    flight_num = db.Column(db.String(20), unique=True, nullable=False)
+    route_id = db.Column(db.String(36), db.ForeignKey('routes.id'))  # Route this departure was materialized from
 
     departure_airport_id = db.Column(db.String(36), db.ForeignKey('airports.id'),
                                      nullable=False)  # Foreign key adjusted to match UUID type
@@ -101,53 +189,46 @@ class Flight(db.Model):
     arrival_airport = db.relationship('Airport', foreign_keys=[arrival_airport_id], back_populates='arriving_flights')
 
     def duration(self):
-        try:
-            # Combine the start_date and departure_time into a single datetime object
-            departure_datetime = datetime.combine(self.start_date,
-                                                  datetime.strptime(self.departure_time, '%I:%M %p').time())
-            arrival_datetime = datetime.combine(self.end_date, datetime.strptime(self.arrival_time, '%I:%M %p').time())
-
-            # Calculate the duration of the flight in hours
-            duration = (arrival_datetime - departure_datetime).total_seconds() / 3600  # duration in hours
-
-            return round(duration, 1)  # Rounded to two decimal places, or use {:.2g} for significant figures
-
-
-        except Exception as e:
-            current_app.logger.error(e)
-            arrival_time = datetime.strptime(str(self.arrival_time)[:10], "%Y-%m-%d %H:%M:%S")
-            departure_time = datetime.strptime(str(self.departure_time)[:10], "%Y-%m-%d %H:%M:%S")
-
-            # Calculate the difference between the two datetime objects
-            time_difference = arrival_time - departure_time
-            difference_in_hours = time_difference.total_seconds() / 3600
-
-            return difference_in_hours
+        """
+        Get the duration of the flight in hours, rounded to one decimal place.
+        Returns None if the stored times cannot be parsed.
+        """
+        return flight_duration(self.start_date, self.departure_time, self.end_date, self.arrival_time)
 
     def cost(self):
-        try:
-            # Calculate the cost (cost per hour = $180)
-            cost = self.duration() * 47
-
-            # Return the cost as a formatted string with a dollar sign
-            return f'${cost:.2f}'
-
-        except Exception as e:
-            cost = 12 * 47
-            return f'${cost:.2f}'
+        """
+        Get the fare for the flight, formatted with a dollar sign (e.g. '$94.00').
+        """
+        return flight_cost(self.duration())
 
-    def to_dict(self):
+    def to_dict(self, pricing=None, airports=None, fields=None):
+        """
+        Convert the Flight object to a dictionary for easy serialization.
+
+        Args:
+            pricing (tuple, optional): A precomputed `(duration, cost)` pair, as returned by
+                `price_flights`, to avoid pricing the flight again.
+            airports (dict, optional): Compact format: the airports are added to this map, keyed by ID,
+                and the flight references them by ID instead of embedding them.
+            fields (set, optional): Only include these fields (sparse fieldset); the ID is always included.
+        """
+        if pricing is None:
+            pricing = (self.duration(), self.cost()) if wants_field(fields, 'cost', 'duration') else (None, None)
+        duration, cost = pricing
         return {
-            'id': self.id,
-            'flight_num': self.flight_num,
-            'departure_airport': self.departure_airport.to_dict() if self.departure_airport else None,
-            'arrival_airport': self.arrival_airport.to_dict() if self.arrival_airport else None,
-            'departure_time': self.departure_time,
-            'arrival_time': self.arrival_time,
-            'start_date': self.start_date,
-            'end_date': self.end_date,
-            'cost': self.cost(),
-            'duration': self.duration(),
+            **only_fields({
+                'id': self.id,
+                'flight_num': self.flight_num,
+                'departure_time': self.departure_time,
+                'arrival_time': self.arrival_time,
+                'start_date': self.start_date,
+                'end_date': self.end_date,
+                'cost': cost,
+                'duration': duration,
+            }, fields),
+            **serialize_flight_airports(self.departure_airport if wants_field(fields, 'departure_airport') else None,
+                                        self.arrival_airport if wants_field(fields, 'arrival_airport') else None,
+                                        airports, fields),
         }
 
     def __repr__(self):
@@ -156,13 +237,18 @@ class Flight(db.Model):
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Emails are unique among active users only, so a deleted account's email can be registered again.
+        # Queries leave deleted users out (see utils/users/scoping.py), so email lookups use this index.
+        db.Index('uq_users_email_active', 'email', unique=True, sqlite_where=db.text('deleted_at IS NULL')),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=default_uuid_generator)
     password_hash = db.Column(db.String(128))
     first_name = db.Column(db.String(100))
     last_name = db.Column(db.String(100))
     gender = db.Column(db.String(100))
-    email = db.Column(db.String(100), unique=True)
+    email = db.Column(db.String(100))
     dob = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     deleted_at = db.Column(db.DateTime)
@@ -173,10 +259,7 @@ class User(db.Model):
         """
         Set the hashed password for the user.
         """
-        if password:
-            self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        else:
-            raise ValueError("Password cannot be empty")
+        self.password_hash = hash_password(password)
 
     # Method to verify password
     def verify_password(self, password):
@@ -260,6 +343,11 @@ class Booking(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # Timestamp when the booking was created
     completed = db.Column(db.DateTime)  # Timestamp when the booking was completed (nullable)
     payment_received = db.Column(db.DateTime)  # Timestamp when payment was received (nullable)
+    # Incremented by every UPDATE, which only applies if the row still has the version that was read
+    version = db.Column(db.Integer, nullable=False, default=1, server_default=db.text('1'))
+
+    # A concurrent change makes the flush raise StaleDataError instead of overwriting it
+    __mapper_args__ = {'version_id_col': version}
 
     # Relationship to User (owner of the booking)
     owner = db.relationship('User', backref='bookings')  # One-to-many relationship (one User can own multiple bookings)
@@ -308,39 +396,74 @@ class Booking(db.Model):
                 return "past"  # Trip has already passed
         return "unknown"  # If no departure flight date, return unknown status
 
-    def to_dict(self):
+    def to_dict(self, users=None, airports=None, fields=None):
         """
         Convert the Booking instance to a dictionary format for easy serialization.
         Includes details of the owner, flights, trip status, and passengers.
+
+        Args:
+            users (dict, optional): Compact format: the owner and passengers are added to this map,
+                keyed by ID, and referenced as `owner_id` and `passenger_ids`.
+            airports (dict, optional): Compact format for the flights' airports (see `Flight.to_dict`).
+            fields (set, optional): Only include these fields (sparse fieldset); the ID is always included.
+                Relationships that aren't requested are never touched, so they are never loaded.
         """
-        return {
-            "id": self.id,  # Booking ID
-            "reference_number": self.reference_number,  # Booking reference number
-            "owner": self.owner.to_dict() if self.owner else None,  # Convert the owner User to a dict
-            "departure_flight": self.departure_flight.to_dict() if self.departure_flight else None,
+        people = {}
+        if wants_field(fields, 'owner'):
+            if users is None:
+                people["owner"] = self.owner.to_dict() if self.owner else None  # Convert the owner User to a dict
+            else:
+                # Reference people by ID; each is serialized once, in the shared map
+                if self.owner is not None and self.owner.id not in users:
+                    users[self.owner.id] = self.owner.to_dict()
+                people["owner_id"] = self.owner_id
+        if wants_field(fields, 'passengers'):
+            if users is None:
+                people["passengers"] = [p.to_dict() for p in self.passengers]  # Each passenger as a dict
+            else:
+                for person in self.passengers:
+                    if person.id not in users:
+                        users[person.id] = person.to_dict()
+                people["passenger_ids"] = [p.id for p in self.passengers]
+
+        # Only evaluate what was asked for: flights and passengers are relationships, loaded on access
+        fields_data = {
+            "id": lambda: self.id,  # Booking ID
+            "reference_number": lambda: self.reference_number,  # Booking reference number
             # Convert the departure Flight to a dict
-            "returning_flight": self.returning_flight.to_dict() if self.returning_flight else None,
+            "departure_flight": lambda: self.departure_flight.to_dict(airports=airports) if self.departure_flight else None,
             # Convert the returning Flight to a dict (if exists)
-            "created_at": self.created_at.isoformat() if self.created_at else None,  # Creation timestamp in ISO format
-            "completed": self.completed.isoformat() if self.completed else None,
+            "returning_flight": lambda: self.returning_flight.to_dict(airports=airports) if self.returning_flight else None,
+            "created_at": lambda: self.created_at.isoformat() if self.created_at else None,  # Creation timestamp in ISO format
             # Completion timestamp in ISO format (if exists)
-            "payment_received": self.payment_received.isoformat() if self.payment_received else None,
+            "completed": lambda: self.completed.isoformat() if self.completed else None,
             # Payment received timestamp in ISO format (if exists)
-            "is_round_trip": self.is_round_trip(),  # Check if this is a round trip
-            "trip_status": self.get_trip_status(),  # Get the status of the trip (future, current, past, unknown)
-            "passengers": [p.to_dict() for p in self.passengers]  # List of passengers in the booking, each as a dict
+            "payment_received": lambda: self.payment_received.isoformat() if self.payment_received else None,
+            "version": lambda: self.version,  # Sent back with an update to detect concurrent changes
+            "is_round_trip": self.is_round_trip,  # Check if this is a round trip
+            "trip_status": self.get_trip_status,  # Get the status of the trip (future, current, past, unknown)
+        }
+        return {
+            **{name: value() for name, value in fields_data.items() if name == 'id' or wants_field(fields, name)},
+            **people,  # Owner and passengers, embedded or by ID
         }
 
 
 class SearchHistory(db.Model):
     __tablename__ = 'search_history'  # Table name for this model
+    __table_args__ = (
+        # The analytics rollup reads new searches past its (searched_at, id) watermark, and prunes old ones
+        db.Index('ix_search_history_searched_at', 'searched_at', 'id'),
+        # A user's recent searches are read newest first, and pruned beyond SEARCH_HISTORY_PER_USER
+        db.Index('ix_search_history_user_searched_at', 'user_id', 'searched_at'),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=default_uuid_generator)  # Unique ID for each search
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)  # Reference to the user
     departure_city = db.Column(db.String(100)   )  # Departure city
     arrival_city = db.Column(db.String(100)   )  # Arrival city
-    departure_date = db.Column(db.DateTime )  # Departure date
-    return_date = db.Column(db.DateTime )  # Return date (optional)
+    departure_date = db.Column(db.Date)  # Departure date
+    return_date = db.Column(db.Date)  # Return date (optional)
     trip_type = db.Column(db.String(20) )  # Trip type (e.g., "Roundtrip" or "One-way")
     guests = db.Column(db.Integer, nullable=False, default=1)  # Number of guests
     searched_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # Timestamp for the search
@@ -360,4 +483,116 @@ class SearchHistory(db.Model):
         }
 
     def __repr__(self):
-        return f'<SearchHistory {self.departure_city} to {self.arrival_city}>'
\ No newline at end of file
+        return f'<SearchHistory {self.departure_city} to {self.arrival_city}>'
+
+class DataVersion(db.Model):
+    """
+    A counter per table, incremented by every transaction that writes to it (see utils/cache/versions.py).
+    Read-only endpoints build their ETags from these versions.
+    """
+    __tablename__ = 'data_versions'
+
+    name = db.Column(db.String(50), primary_key=True)  # Table name, e.g. 'flights'
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DataVersion {self.name}={self.version}>'
+
+
+class SearchRollup(db.Model):
+    """
+    Number of searches per route in an hour or a day, aggregated from `search_history`
+    (see utils/analytics/rollups.py).
+    """
+    __tablename__ = 'search_rollups'
+
+    granularity = db.Column(db.String(5), primary_key=True)  # 'hour' or 'day'
+    bucket_start = db.Column(db.DateTime, primary_key=True)  # Start of the hour or day the searches were made in
+    departure_city = db.Column(db.String(100), primary_key=True)  # Searched departure code ('ANY' if none)
+    arrival_city = db.Column(db.String(100), primary_key=True)  # Searched arrival code ('ANY' if none)
+    searches = db.Column(db.Integer, nullable=False, default=0)  # Number of searches
+    roundtrip_searches = db.Column(db.Integer, nullable=False, default=0)  # Of which round trips
+    guests = db.Column(db.Integer, nullable=False, default=0)  # Total guests over the searches
+
+    def __repr__(self):
+        return f'<SearchRollup {self.granularity} {self.bucket_start} {self.departure_city}-{self.arrival_city}: {self.searches}>'
+
+
+class DepartureDemand(db.Model):
+    """
+    Number of searches per route and travel date, aggregated from `search_history`
+    (see utils/analytics/rollups.py).
+    """
+    __tablename__ = 'departure_demand'
+
+    departure_city = db.Column(db.String(100), primary_key=True)  # Searched departure code ('ANY' if none)
+    arrival_city = db.Column(db.String(100), primary_key=True)  # Searched arrival code ('ANY' if none)
+    departure_date = db.Column(db.Date, primary_key=True)  # Date the searches were for
+    searches = db.Column(db.Integer, nullable=False, default=0)  # Number of searches
+    guests = db.Column(db.Integer, nullable=False, default=0)  # Total guests over the searches
+
+    def __repr__(self):
+        return f'<DepartureDemand {self.departure_city}-{self.arrival_city} {self.departure_date}: {self.searches}>'
+
+
+class RollupWatermark(db.Model):
+    """
+    How far an incremental rollup has read its source table: everything up to and including
+    `(searched_at, last_id)` has been aggregated.
+    """
+    __tablename__ = 'rollup_watermarks'
+
+    name = db.Column(db.String(50), primary_key=True)  # Rollup name, e.g. 'search_history'
+    searched_at = db.Column(db.DateTime)  # Time of the last aggregated row
+    last_id = db.Column(db.String(36))  # ID of the last aggregated row, to break ties on searched_at
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<RollupWatermark {self.name} at {self.searched_at}>'
+
+
+class OutboxEvent(db.Model):
+    """
+    A change to a booking, written in the same transaction as the change itself and delivered to
+    downstream consumers by the outbox dispatcher (see utils/events/outbox.py).
+    """
+    __tablename__ = 'outbox_events'
+    # Sinks resume after the last ID they received, so IDs must never be reused, even once the
+    # newest events were pruned: without AUTOINCREMENT, SQLite would hand out max(id) + 1 again
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)  # Increasing: events are delivered in this order
+    event_type = db.Column(db.String(50), nullable=False)  # e.g. 'booking.created', 'booking.paid'
+    aggregate_id = db.Column(db.String(36), nullable=False)  # ID of the booking the event is about
+    payload = db.Column(db.Text, nullable=False)  # JSON snapshot of the booking after the change
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        """
+        Convert the event to the dictionary delivered to the sinks.
+        """
+        return {
+            'id': self.id,
+            'type': self.event_type,
+            'booking_id': self.aggregate_id,
+            'created_at': self.created_at.isoformat(),
+            'data': json.loads(self.payload),
+        }
+
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.event_type} {self.aggregate_id}>'
+
+
+class OutboxCheckpoint(db.Model):
+    """
+    The last outbox event delivered to a sink; each sink is delivered independently.
+    """
+    __tablename__ = 'outbox_checkpoints'
+
+    sink = db.Column(db.String(50), primary_key=True)  # Sink name, e.g. 'file'
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)  # Events up to this ID were delivered
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<OutboxCheckpoint {self.sink} at {self.last_event_id}>'
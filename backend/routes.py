@@ -1,17 +1,37 @@
 # routes.py
-from flask import Blueprint, request, jsonify, current_app, abort
-from models import db, Flight, User, SearchHistory
+from flask import Blueprint, Response, request, jsonify, current_app, abort
+from models import db, User
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-import uuid
+import hmac
+import logging
 import random
-from datetime import timedelta  # Add timedelta for time manipulation
-from utils.flights.flights import get_close_flights, get_recent_searches, get_flight_by_id, save_searched_flight
+from utils.flights.flights import get_close_flights, get_recent_searches, get_flight_by_id, save_searched_flight, \
+    serialize_flights
 from utils.flights.airports import get_all_airports
-from utils.bookings.booking import pay_booking, create_booking_entry, get_booking
-from datetime import datetime, date
+from utils.flights.flight_view import FLIGHT_FIELDS
+from utils.flights.search import SearchParams, get_close_flights_concurrently
+from utils.bookings.booking import pay_booking, create_booking_entry, update_booking, find_booking, find_user_bookings, \
+    find_bookings, serialize_bookings, serialize_booking_batch, booking_load_options, BOOKING_FIELDS
+from utils.jobs.queue import enqueue
+from utils.analytics.rollups import GRANULARITIES, get_departure_demand, get_search_volume, get_top_routes, \
+    rolled_up_through
+from utils.metrics.multiprocess import render_metrics
+from utils.logs.logs import log_event
+from utils.cache.conditional import CachePolicy, conditional, utc_hour, utc_today
+from utils.http.formats import wants_compact, requested_fields
+from datetime import datetime, date, timedelta
 
 bp = Blueprint('routes', __name__)
 
+# HTTP caching of read-only endpoints: ETags follow the versions of the tables each response is built from
+AIRPORTS_CACHE = CachePolicy(('airports',), max_age=300)  # Same for everyone, rarely changes
+SEARCH_CACHE = CachePolicy(('airports', 'flights'), private=True, negotiated=True)
+# Bookings carry their trip status, which changes with the date; analytics default to a window ending now
+BOOKINGS_CACHE = CachePolicy(('airports', 'flights', 'users', 'bookings'), private=True, negotiated=True,
+                             key_parts=(utc_today,))
+ANALYTICS_CACHE = CachePolicy(('search_rollups', 'departure_demand'), private=True, max_age=60,
+                              key_parts=(utc_hour,))  # Changes once per rollup, or hour
+
 
 ###################################################
 # Login
@@ -147,6 +167,7 @@ def get_user(user_id):
 ###################################################
 
 @bp.route('/airports', methods=['GET'])
+@conditional(AIRPORTS_CACHE)
 def get_airports():
     """
     Fetches a list of all airports.
@@ -156,6 +177,7 @@ def get_airports():
 
     - Returns a list of all airports in JSON format.
     - Can be accessed via a GET request.
+    - Answers 304 Not Modified when the client's ETag is current.
     """
     # Call the function to fetch all airports and return the result as a JSON response
     return jsonify(get_all_airports())  # Return the list of airports in JSON format
@@ -171,125 +193,107 @@ def search_flights():
     based on the provided search parameters (departure city, arrival city, departure date, etc.).
     The request requires a valid JWT token for authentication.
     """
-    # Retrieve search parameters from query string
-    departure_city = request.args.get('from')  # Departure city (from)
-    arrival_city = request.args.get('to')  # Arrival city (to)
-    departure_date = request.args.get('depart')  # Departure date
-    return_date = request.args.get('return')  # Return date (optional, for round trips)
-    trip_type = request.args.get('type')  # Trip type (e.g., "Roundtrip" or "One-way")
-    guests = request.args.get('guests')  # Number of guests (optional)
-    recent = request.args.get('recent')  # Number of guests (optional)
     user_id = get_jwt_identity()
 
-    def parse_date(date_str):
-        if isinstance(date_str, str):
-            return datetime.strptime(date_str[:10], '%Y-%m-%d').date()
-        elif isinstance(date_str, date):
-            return date_str  # Already a date object
-        return None  # Return None if the date_str is None or invalid
+    # Validate and parse the search parameters (from, to, depart, return, type, guests, recent) once,
+    # rejecting malformed ones before any query runs
+    try:
+        params = SearchParams.from_args(request.args)
+        # Sparse fieldset (?fields=...): only the columns behind the requested flight fields are loaded
+        fields = requested_fields(FLIGHT_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    if recent:
+    if params.recent:
         current_app.logger.debug("returning recently searched flights")
-        return get_search_history(user_id)
+        return get_search_history(user_id, fields)
 
     # Log the search request for debugging or tracking purposes
-    current_app.logger.debug(
-        f"Search request: {departure_city}, {arrival_city}, {departure_date}, {return_date}, {trip_type}, {guests}")
-    # Save the search to the database
-    user_id = get_jwt_identity()
-
-    search = SearchHistory(
-        user_id=user_id,
-        departure_city=departure_city,
-        arrival_city=arrival_city,
-        trip_type=trip_type,
-        guests=guests
-    )
-    if departure_date:
-        search.departure_date = parse_date(departure_date)
-
-    if return_date:
-        search.return_date = parse_date(return_date)
-
-    db.session.add(search)
-    db.session.commit()
+    log_event(current_app.logger, logging.DEBUG, 'search.request', departure_city=params.departure_city,
+              arrival_city=params.arrival_city, departure_date=params.departure_date,
+              return_date=params.return_date, trip_type=params.trip_type, guests=params.guests)
+    # Save the search to the history in the background, so the search itself doesn't wait on the write
+    enqueue('record_search', params.to_history(user_id, datetime.utcnow()))
+
+    # Answer from the client's copy if no flight or airport changed since (the search is still recorded above)
+    etag = SEARCH_CACHE.etag()
+    not_modified = SEARCH_CACHE.not_modified(etag)
+    if not_modified is not None:
+        return not_modified
 
     try:
-        # Fetch the available outgoing flights based on the search parameters
-        outgoing_flights, error_msg, err_code = get_close_flights(
-            destination_airport=arrival_city,
-            departure_airport=departure_city,
-            departure_date=departure_date
-        )
+        # Fetch the flights of every leg at once, so a roundtrip takes about as long as a one-way search
+        leg_results = get_close_flights_concurrently(params.legs(), fields)
 
         # If there is an error fetching outgoing flights, return the error message and code
+        outgoing_flights, error_msg, err_code = leg_results[0]
         if error_msg:
             return error_msg, err_code
 
         returning_flights = []
-        # If the trip is roundtrip, fetch the returning flights as well
-        if trip_type == "Roundtrip":
-            returning_flights, error_msg, err_code = get_close_flights(
-                destination_airport=departure_city,
-                departure_airport=arrival_city,
-                departure_date=return_date
-            )
+        # If the trip is roundtrip, use the returning flights as well
+        if params.roundtrip:
+            returning_flights, error_msg, err_code = leg_results[1]
             # If there is an error fetching returning flights, return the error message and code
             if error_msg:
                 return error_msg, err_code
 
+        # In the compact format, flights reference airports by ID and each airport is sent once
+        airports = {} if wants_compact() else None
+
         # Prepare the response data with the outgoing and returning flights
         response_data = {
-            'outgoing_flights': [flight.to_dict() for flight in outgoing_flights],
+            'outgoing_flights': serialize_flights(outgoing_flights, airports, fields),
             # Convert flight objects to dictionaries
-            'returning_flights': [flight.to_dict() for flight in returning_flights] if trip_type == "Roundtrip" else []
+            'returning_flights': serialize_flights(returning_flights, airports, fields) if params.roundtrip else []
             # Only include returning flights for roundtrips
         }
+        if airports is not None:
+            response_data['airports'] = airports
 
-        # Return the search results as a JSON response
-        return jsonify(response_data)
+        # Return the search results as a JSON response, with the ETag to revalidate them
+        return SEARCH_CACHE.apply(jsonify(response_data), etag)
 
     except Exception as e:
         # Log any exception that occurs during the search process
-        current_app.logger.error(f"Error processing flight search: {str(e)}")
+        current_app.logger.error("Error processing flight search: %s", e)
 
         # Return a 500 Internal Server Error if an exception occurs
         return jsonify({"error": "Error processing flight search"}), 500
 
 
-def get_search_history(user_id):
+def get_search_history(user_id, fields=None):
     """
     Retrieves the search history of the authenticated user along with flight results.
+    Only the requested flight `fields` are loaded and serialized (all of them if None).
     """
     # Get the user ID from the JWT token
     searched = []  # Initialize an empty list for all searches
+    airports = {} if wants_compact() else None  # Compact format: airports sent once, by ID
 
     # Get recent searches from the database
-    searches = get_recent_searches(user_id)
-    current_app.logger.debug(
-        f'found past searches{searches}'
-    )
+    searches = [search for search in get_recent_searches(user_id) if search.arrival_city or search.departure_city]
+    current_app.logger.debug("Found %d past searches", len(searches))
+
+    # Search the flights of all of them at once
+    leg_results = get_close_flights_concurrently(
+        [(search.arrival_city, search.departure_city, search.departure_date) for search in searches], fields)
+
     # Loop through each search record
-    for search in searches:
-        if search.arrival_city or search.departure_city:
-            found_flights, error_msg, err_code = get_close_flights(
-                destination_airport=search.arrival_city,
-                departure_airport=search.departure_city,
-                departure_date=search.departure_date
-            )
-            if error_msg:
-                current_app.logger.error(
-                    f'error found {error_msg}'
-                )
-                continue
+    for search, (found_flights, error_msg, err_code) in zip(searches, leg_results):
+        if error_msg:
+            current_app.logger.debug("No flights found for past search %s (status %s)", search.id, err_code)
+            continue
 
-            # Add the flights to the searched list
-            searched.extend([flight.to_dict() for flight in found_flights])
+        # Add the flights to the searched list
+        searched.extend(serialize_flights(found_flights, airports, fields))
 
     # Prepare the response data
     response_data = {
         'outgoing_flights': searched
     }
+    if airports is not None:
+        response_data['airports'] = airports
 
     return jsonify(response_data)
 
@@ -306,7 +310,7 @@ def create_booking():
     and passengers, and generates a booking record.
 
     - Validates required data from the request.
-    - Retrieves flight details and creates a new return flight if necessary.
+    - Retrieves flight details and finds a scheduled return flight if a return date is given.
     - Calls the `create_booking_entry` helper function to create the booking record.
     - Returns a JSON response with the booking details or an error message.
     """
@@ -333,9 +337,6 @@ def create_booking():
     # Handle round-trip bookings by checking if a return date is provided
     returning_flight = None
     if return_date:
-        # Convert the return date from string to a date object
-        return_date_obj = datetime.strptime(str(return_date)[:10], "%Y-%m-%d").date()
-
         # Attempt to find available return flights for the user
         returning_flights, error_msg, err_code = get_close_flights(
             destination_airport=departure_flight.departure_airport.code,
@@ -343,37 +344,14 @@ def create_booking():
             departure_date=return_date
         )
 
-        # If returning flights exist, select the first one as the return flight
-        if returning_flights:
-            returning_flight = returning_flights[0]
-            current_app.logger.error("Found returning flight:", returning_flights)
-        else:
-            current_app.logger.debug("No returning flight found, creating a new one.")
-            # Create a new return flight if no matching flights are found
-
-            # Create a new Flight object for the return flight
-            f_idd = str(uuid.uuid4())
-            new_flight = Flight(
-                id=f_idd,  # Generate a unique ID for the new flight
-                flight_num=f"RF-{f_idd}",  # Random flight number for return flight
-                departure_airport_id=departure_flight.arrival_airport.id,
-                arrival_airport_id=departure_flight.departure_airport.id,
-                departure_time=(datetime.combine(return_date_obj, datetime.min.time()) + timedelta(hours=1)),
-                arrival_time=(datetime.combine(return_date_obj, datetime.min.time()) + timedelta(hours=3)),
-                start_date=return_date_obj,
-                end_date=(return_date_obj + timedelta(days=1)),  # End date is one day after departure
-                created_at=datetime.utcnow(),
-                updated_at=datetime.utcnow()
-            )
-
-            # Add the new flight to the database session
-            db.session.add(new_flight)
-            db.session.commit()  # Commit to save the new flight to the database
-            db.session.refresh(new_flight)
-            db.session.flush()  # Ensure the session is updated
-
-            # Set the created return flight as the returning flight
-            returning_flight = new_flight
+        # Return flights come from the materialized schedule; without one the booking cannot be made
+        if not returning_flights:
+            current_app.logger.debug("No returning flight found.")
+            return jsonify({"error": "No returning flight available close to the return date"}), 400
+
+        # Select the first available flight as the return flight
+        returning_flight = returning_flights[0]
+        current_app.logger.debug("Found returning flight: %s", returning_flight.flight_num)
 
     # Create the booking entry by calling the helper function
     create_resp = create_booking_entry(
@@ -394,6 +372,7 @@ def create_booking():
 # View Bookings API
 @bp.route('/booking', methods=['GET'])
 @jwt_required()
+@conditional(BOOKINGS_CACHE)
 def view_bookings():
     """
     Retrieves a list of bookings for a user, either by email or reference number.
@@ -403,49 +382,135 @@ def view_bookings():
     - If email is provided, it fetches all bookings for the associated user.
     - If reference number is provided, it fetches the specific booking matching the reference.
     - Returns a list of bookings in JSON format, or an error message if no bookings are found.
+    - `fields` (optional) limits each booking to the listed fields, e.g. `fields=reference_number,created_at`;
+      relationships that aren't listed (flights, passengers, owner) are not loaded at all.
     """
     email = request.args.get('email')
     bookingId = request.args.get('bookingId')
     reference_number = request.args.get('reference_number')
 
-    current_app.logger.debug("Starting view_bookings endpoint")
-    current_app.logger.debug(f"Query parameters received: email={email}, bookingId={bookingId}, reference_number={reference_number}")
+    log_event(current_app.logger, logging.DEBUG, 'view_bookings.request', email=email, booking_id=bookingId,
+              reference_number=reference_number)
 
     # Validate that at least one of the parameters (email, reference number, or bookingId) is provided
     if not email and not reference_number and not bookingId:
         current_app.logger.warning("Missing required parameters: email, bookingId, or reference_number")
         return jsonify({"error": "Email, Booking ID, or Reference Number must be provided"}), 400
 
+    # Sparse fieldset: load only the columns and relationships behind the requested fields
+    try:
+        fields = requested_fields(BOOKING_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    options = booking_load_options(fields)
+
     bookings = []  # List to store the bookings that match the search criteria
 
     # If email is provided, fetch the user and their associated bookings
     if email:
-        current_app.logger.debug(f"Fetching user by email: {email}")
-        user = User.query.filter_by(email=email).first()  # Find the user by email
-        if not user:
-            current_app.logger.warning(f"No user found with email: {email}")
+        current_app.logger.debug("Fetching user by email: %s", email)
+        user_id = User.query.with_entities(User.id).filter_by(email=email).scalar()  # Find the user by email
+        if not user_id:
+            current_app.logger.warning("No user found with email: %s", email)
             return jsonify({"error": "User not found"}), 404  # Return an error if the user is not found
-        bookings = user.bookings  # Retrieve all bookings for the user
-        current_app.logger.debug(f"Bookings retrieved for user {email}: {len(bookings)} bookings found")
+        bookings = find_user_bookings(user_id, options)  # Retrieve all bookings for the user
+        current_app.logger.debug("Bookings retrieved for user %s: %d bookings found", email, len(bookings))
 
     # If bookingId or reference number is provided, fetch the specific booking
     if bookingId or reference_number:
-        current_app.logger.debug(f"Fetching booking with bookingId={bookingId}, reference_number={reference_number}")
-        SearchResultJson = get_booking(bookingId, reference_number=reference_number)  # Retrieve the booking by ID or reference
-        if SearchResultJson.json["status"]=="success":
-            current_app.logger.debug(f"Booking found: {SearchResultJson.json["data"]}")
-            bookings.append(SearchResultJson.json["data"])  # Add the booking to the list
+        current_app.logger.debug("Fetching booking with bookingId=%s, reference_number=%s", bookingId, reference_number)
+        booking = find_booking(bookingId, reference_number=reference_number, options=options)  # Retrieve the booking by ID or reference
+        if booking:
+            current_app.logger.debug("Booking found: %s", booking.reference_number)
+            bookings.append(booking)  # Add the booking to the list
         else:
-            current_app.logger.warning(f"No booking found for bookingId={bookingId} and reference_number={reference_number}")
-            current_app.logger.error(SearchResultJson)
-    # Return the list of bookings in JSON format
+            current_app.logger.warning("No booking found for bookingId=%s and reference_number=%s",
+                                       bookingId, reference_number)
+    # Return the bookings in JSON format (a list, or the compact format's maps)
     if bookings:
-        current_app.logger.info(f"{len(bookings)} booking(s) retrieved successfully")
-        return jsonify([booking for booking in bookings]), 200
+        current_app.logger.info("%d booking(s) retrieved successfully", len(bookings))
+        return jsonify(serialize_bookings(bookings, compact=wants_compact(), fields=fields)), 200
     else:
         current_app.logger.warning("No bookings found matching the criteria")
         return jsonify({"status":"error", "message":"Booking not found"}), 404
 
+
+# Batch Bookings API - Retrieves many bookings in one request
+@bp.route('/booking/batch', methods=['GET'])
+@jwt_required()
+@conditional(BOOKINGS_CACHE)
+def view_bookings_batch():
+    """
+    Retrieves several bookings at once, by ID and/or reference number, with a single query.
+
+    - `ids` and `reference_numbers` are comma-separated (or repeated) query parameters; together
+      they may name at most `BOOKING_BATCH_LIMIT` bookings.
+    - `fields` and the compact format are supported as for `GET /booking`.
+    - Returns the bookings keyed by the identifier they were requested with; identifiers that
+      don't match a booking get an entry in `errors` instead of failing the whole request.
+    - Only the caller's bookings (as owner or passenger) are returned; others are reported as not found.
+    """
+    def list_arg(name):
+        return [value.strip() for raw in request.args.getlist(name) for value in raw.split(',') if value.strip()]
+
+    booking_ids = list(dict.fromkeys(list_arg('ids')))  # De-duplicated, in request order
+    reference_numbers = list(dict.fromkeys(list_arg('reference_numbers')))
+    identifiers = list(dict.fromkeys(booking_ids + reference_numbers))
+
+    log_event(current_app.logger, logging.DEBUG, 'view_bookings_batch.request', ids=len(booking_ids),
+              reference_numbers=len(reference_numbers))
+
+    if not identifiers:
+        return jsonify({"error": "Booking IDs or Reference Numbers must be provided"}), 400
+    limit = current_app.config['BOOKING_BATCH_LIMIT']
+    if len(identifiers) > limit:
+        return jsonify({"error": f"At most {limit} bookings can be requested at once"}), 400
+
+    try:
+        fields = requested_fields(BOOKING_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # One query for all the bookings, with the relationships behind the requested fields loaded eagerly
+    found = find_bookings(booking_ids, reference_numbers, options=booking_load_options(fields),
+                          visible_to=get_jwt_identity())
+    current_app.logger.debug("%d of %d requested bookings found", len(found), len(identifiers))
+    return jsonify(serialize_booking_batch(identifiers, found, compact=wants_compact(), fields=fields)), 200
+
+
+@bp.route('/booking/<booking_id>', methods=['PUT'])
+@jwt_required()
+def change_booking(booking_id):
+    """
+    Changes the flights of a booking of the authenticated user, or adds passengers to it.
+
+    - Requires JWT authentication; only the owner of the booking can change it.
+    - The JSON body may contain `departure_flight_id`, `returning_flight_id` (an empty string makes
+      the booking one-way) and `passengers` (a list of user IDs to add).
+    - `version` (the `version` of the booking as last read) makes the change conditional: if the
+      booking was changed since, nothing is updated and a 409 with the current version is returned.
+    - Returns the updated booking, with its new version.
+    """
+    data = request.get_json(silent=True) or {}
+    passengers = data.get('passengers', [])
+    version = data.get('version')
+
+    # Validate the body before touching the booking
+    if not isinstance(passengers, list) or not all(isinstance(passenger, str) for passenger in passengers):
+        return jsonify({"error": "passengers must be a list of user IDs"}), 400
+    if version is not None and (isinstance(version, bool) or not isinstance(version, int)):
+        return jsonify({"error": "version must be an integer"}), 400
+
+    return update_booking(
+        booking_id,
+        departure_flight_id=data.get('departure_flight_id'),
+        returning_flight_id=data.get('returning_flight_id'),
+        passengers=passengers,
+        expected_version=version,
+        owner_id=get_jwt_identity(),  # Other users' bookings are reported as not found
+    )
+
+
 @bp.route('/booking/confirmation', methods=['POST'])
 @jwt_required()
 def pay_for_booking():
@@ -473,3 +538,99 @@ def pay_for_booking():
     return pay_booking(booking_id)  # Return the result of the payment processing
 
 ###################################################
+
+# Search Analytics API - Reads the search rollups (see utils/analytics/rollups.py), never the raw history
+def analytics_filters():
+    """
+    Parse the route filters and limit shared by the analytics endpoints.
+
+    Returns:
+        tuple: (departure code, arrival code, limit); raises ValueError on an invalid limit.
+    """
+    limit = request.args.get('limit', '10')
+    if not (limit.isascii() and limit.isdecimal()) or not 1 <= int(limit) <= 100:
+        raise ValueError("'limit' must be between 1 and 100")
+    limit = int(limit)
+    return request.args.get('from'), request.args.get('to'), limit
+
+
+@bp.route('/analytics/routes', methods=['GET'])
+@jwt_required()
+@conditional(ANALYTICS_CACHE)
+def search_analytics_routes():
+    """
+    Returns the most searched routes and the search volume over a period.
+
+    - Query parameters: `granularity` ('day' or 'hour'), `since` and `until` (ISO dates or times;
+      default: the last 7 days, or 2 days hourly), `from`/`to` airport codes and `limit` (default 10).
+    - Searches are counted once rolled up, so the most recent minutes are not included yet;
+      `rolled_up_through` is the time of the last search counted.
+    """
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({"error": f"Invalid granularity, expected one of: {', '.join(GRANULARITIES)}"}), 400
+    try:
+        until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else datetime.utcnow()
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') \
+            else until - timedelta(days=7 if granularity == 'day' else 2)
+        if since >= until:
+            raise ValueError("'since' must be before 'until'")
+        departure_city, arrival_city, limit = analytics_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    through = rolled_up_through()
+    return jsonify({
+        "granularity": granularity,
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "rolled_up_through": through.isoformat() if through else None,
+        "top_routes": get_top_routes(since, until, granularity, limit, departure_city, arrival_city),
+        "volume": get_search_volume(since, until, granularity, departure_city, arrival_city),
+    }), 200
+
+
+@bp.route('/analytics/departures', methods=['GET'])
+@jwt_required()
+@conditional(ANALYTICS_CACHE)
+def search_analytics_departures():
+    """
+    Returns the number of searches per route and travel date, most searched first.
+
+    - Query parameters: `start` and `end` travel dates (default: the next 30 days), `from`/`to`
+      airport codes and `limit` (default 10).
+    """
+    try:
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else datetime.utcnow().date()
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else start + timedelta(days=30)
+        if start > end:
+            raise ValueError("'start' must not be after 'end'")
+        departure_city, arrival_city, limit = analytics_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    through = rolled_up_through()
+    return jsonify({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "rolled_up_through": through.isoformat() if through else None,
+        "departures": get_departure_demand(start, end, departure_city, arrival_city, limit),
+    }), 200
+
+###################################################
+
+# Metrics API - Exposes request, SQL, cache and job metrics for Prometheus
+@bp.route('/_metrics', methods=['GET'])
+def metrics():
+    """
+    Returns the metrics collected by all server workers (see utils/metrics/multiprocess.py) in the Prometheus text format.
+
+    - Only served to scrapers sending `Authorization: Bearer <METRICS_TOKEN>`; without a configured
+      token the endpoint doesn't exist (404).
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({"error": "Invalid metrics token"}), 401
+    return Response(render_metrics(current_app), mimetype='text/plain; version=0.0.4')
@@ -3,12 +3,14 @@ import json
 import os
 import random
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 
 from flask import current_app
 from sqlalchemy.exc import IntegrityError
 
-from models import db, Flight, Airport  # Ensure you have imported your models
+from models import db, Route, Airport  # Ensure you have imported your models
+from utils.flights.schedules import materialize_schedules
+from utils.flights.airports import reset_airport_registry
 
 
 def load_airports_from_json(json_file_path):
@@ -40,12 +42,12 @@ def load_airports_from_json(json_file_path):
 
     except FileNotFoundError as e:
         # Log error if the file is not found
-        current_app.logger.error(f"File not found: {json_file_path}")
+        current_app.logger.error("File not found: %s", json_file_path)
         raise e
 
     except json.JSONDecodeError as e:
         # Log error if the file content is not valid JSON
-        current_app.logger.error(f"Invalid JSON format in file: {json_file_path}")
+        current_app.logger.error("Invalid JSON format in file: %s", json_file_path)
         raise e
 
 
@@ -57,7 +59,8 @@ def seed_data():
         - Loads airport data from a JSON file.
         - Inserts the airport data into the database.
         - Retrieves the list of airports from the database.
-        - Adds flight data for each airport into the database.
+        - Adds a recurring route for each airport pair into the database.
+        - Expands the routes into dated flights.
 
     Logs:
         - Errors if loading data or inserting records fails.
@@ -68,17 +71,22 @@ def seed_data():
 
         # Insert the airport data into the database
         create_airports(airports_data)
+        reset_airport_registry()  # Pick up the new airports on the next lookup
 
         # Retrieve all airports from the database
         airports = Airport.query.all()
 
-        # Add flight data for each airport to the database
-        add_flight_data_to_db(airports)
+        # Add a recurring route for each airport pair to the database
+        add_routes_to_db(airports)
+
+        # Expand the routes into dated flights up to the schedule horizon
+        created = materialize_schedules()
+        current_app.logger.info("Materialized %s flights from routes.", created)
 
         current_app.logger.info("Database seeded successfully with airport and flight data.")
 
     except Exception as e:
-        current_app.logger.error(f"Error while seeding database: {str(e)}")
+        current_app.logger.error("Error while seeding database: %s", e)
         raise e  # Re-raise the exception after logging it
 
 
@@ -87,8 +95,8 @@ def create_airports(entries):
     Function to insert airport entries into the database.
 
     This function iterates over a list of dictionaries containing airport data and inserts each entry
-    into the database. It handles integrity errors, such as duplicate airport codes, and commits the
-    changes to the database.
+    that isn't in the database yet, so seeding can be run again safely. It handles integrity errors,
+    such as duplicate airport codes, and commits the changes to the database.
 
     Args:
         entries (list of dict): A list of dictionaries where each dictionary contains the airport's
@@ -100,6 +108,10 @@ def create_airports(entries):
     Logs:
         - Errors encountered during insertion or commit operations.
     """
+    # Airports already in the database, so running the seed again doesn't duplicate them
+    existing = set(db.session.query(Airport.code, Airport.name).all())
+    entries = [airport for airport in entries if (airport['code'], airport['name']) not in existing]
+
     for airport in entries:
         try:
             # Create a new Airport object for each entry
@@ -124,13 +136,13 @@ def create_airports(entries):
         print(f"Error committing to the database: {e}")
 
 
-def add_flight_data_to_db(airports):
+def add_routes_to_db(airports):
     """
-    Generate and insert flight data for all unique combinations of airports.
+    Generate and insert a recurring route for all unique combinations of airports.
 
-    This function generates flight details such as flight number, departure and arrival times,
-    flight duration, start and end dates for flights between all airport pairs. It adds these
-    flight records to the database.
+    This function generates route details such as departure and arrival times, operating days
+    and the validity period for every airport pair. The routes are later expanded into dated
+    flights by `materialize_schedules`.
 
     Args:
         airports (list): A list of airport records from the database, each containing 'id' and 'code'.
@@ -139,9 +151,14 @@ def add_flight_data_to_db(airports):
         None
 
     Logs:
-        - Prints success or failure messages for flight insertion.
+        - Prints success or failure messages for route insertion.
     """
-    flight_num_counter = random.randint(100, 900)  # Starting flight number (BW101)
+    # Routes are only seeded once; later runs just extend the materialized schedule
+    if Route.query.first() is not None:
+        print("Routes already seeded, skipping.")
+        return
+
+    route_count = 0
 
     # Generate all unique airport code pairs using permutations (from_airport -> to_airport)
     airport_pairs = list(itertools.permutations(airports, 2))
@@ -150,72 +167,44 @@ def add_flight_data_to_db(airports):
         # Generate a random departure time between 6:00 AM and 9:00 PM
         random_hour = random.randint(6, 21)  # Random hour between 6 AM and 9 PM
         random_minute = random.randint(0, 59)  # Random minute between 0 and 59
-
-        # Adjust time format to 12-hour AM/PM (e.g., 6 AM or 6 PM)
-        if random_hour == 12:
-            hour_12 = 12
-            am_pm = 'PM'
-        elif random_hour > 12:
-            hour_12 = random_hour - 12
-            am_pm = 'PM'
-        else:
-            hour_12 = random_hour
-            am_pm = 'AM'
-
-        # Construct the time string (e.g., '06:45 AM')
-        departure_time_str = f"{hour_12:02d}:{random_minute:02d} {am_pm}"
-
-        # Convert to a datetime object using 12-hour format
-        try:
-            departure_time = datetime.strptime(str(departure_time_str)[:10], "%I:%M %p")
-        except ValueError as ve:
-            # Handle invalid time format and skip this flight
-            print(f"Error parsing time '{departure_time_str}': {ve}")
-            continue  # Skip to the next flight if there's an error in time format
+        departure_time = datetime.combine(datetime.utcnow().date(), time(random_hour, random_minute))
 
         # Generate a random flight duration between 55 minutes and 3 hours
-        flight_duration_minutes = random.randint(55, 180)  # Random duration in minutes
-        flight_duration = timedelta(minutes=flight_duration_minutes)
+        flight_duration = timedelta(minutes=random.randint(55, 180))
 
         # Calculate arrival time by adding flight duration to departure time
         arrival_time = departure_time + flight_duration
 
-        # Generate a random start date (1 to 365 days from today)
-        today = datetime.utcnow()
-        random_days_ahead = random.randint(1, 365)  # Random number of days in the future
-        start_date = today + timedelta(days=random_days_ahead)
-
-        # Ensure that the end date is after the start date (1 to 2 days after)
-        added_days = random.randint(1, 2)
-        if arrival_time < departure_time and added_days < 1:
-            added_days = 1  # Ensure at least 1 day gap between start and end date
-
-        end_date = start_date + timedelta(days=added_days)  # Random end date (1 to 2 days after start)
-        id = str(uuid.uuid4())
-        # Create a new Flight entry
-        new_flight = Flight(
-            id=id,  # Generate a unique UUID for the flight
-            flight_num=f"SKY-{id}",  # Flight number in the format BW101, BW102, etc.
+        # Operate between 3 and 7 days a week, starting tomorrow for one year
+        operating_days = set(random.sample(range(7), random.randint(3, 7)))
+        days_of_week = ''.join('1' if day in operating_days else '0' for day in range(7))
+        valid_from = datetime.utcnow().date() + timedelta(days=1)
+
+        route_count += 1
+        new_route = Route(
+            id=str(uuid.uuid4()),  # Generate a unique UUID for the route
+            route_num=f"SKY{route_count:04d}",  # Route number in the format SKY0001, SKY0002, etc.
             departure_airport_id=from_airport.id,  # From airport ID
-            arrival_airport_id=to_airport.id,     # To airport ID
+            arrival_airport_id=to_airport.id,  # To airport ID
             departure_time=departure_time.strftime("%I:%M %p"),  # Format as 12-hour time (AM/PM)
             arrival_time=arrival_time.strftime("%I:%M %p"),
-            start_date=start_date,
-            end_date=end_date,
+            arrival_day_offset=(arrival_time.date() - departure_time.date()).days,  # Overnight flights land the next day
+            days_of_week=days_of_week,
+            valid_from=valid_from,
+            valid_to=valid_from + timedelta(days=365),
             created_at=datetime.utcnow(),
             updated_at=datetime.utcnow()
         )
 
-        # Add the new flight object to the session for insertion
-        db.session.add(new_flight)
-        flight_num_counter += 1  # Increment the flight number for the next flight
+        # Add the new route object to the session for insertion
+        db.session.add(new_route)
 
     try:
-        # Commit all the generated flight records to the database
+        # Commit all the generated route records to the database
         db.session.commit()
-        print(f"Successfully inserted {flight_num_counter - 101} flights into the database.")
+        print(f"Successfully inserted {route_count} routes into the database.")
 
     except Exception as e:
         # Rollback the session if there's an error during commit
         db.session.rollback()
-        print(f"Error committing flights to the database: {e}")
\ No newline at end of file
+        print(f"Error committing routes to the database: {e}")
@@ -0,0 +1,347 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import DepartureDemand, RollupWatermark, SearchHistory, SearchRollup, db
+from utils.cache.versions import bump_data_version
+
+# Name of the watermark of the search history rollup
+WATERMARK = 'search_history'
+
+# Searches aggregated and committed together
+DEFAULT_BATCH_SIZE = 5000
+
+# Searches younger than this many seconds are left for a later run: search history is written by a
+# background job, so a search can be inserted a little after later ones and must not fall behind the watermark
+DEFAULT_SETTLE_SECONDS = 15 * 60
+
+# Stand-in for a missing departure or arrival code, matching what the search form sends
+ANY_AIRPORT = 'ANY'
+
+GRANULARITIES = ('hour', 'day')
+
+
+def bucket_start(moment, granularity):
+    """
+    Truncate a datetime to the start of its hour or day.
+    """
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def roll_up_searches(batch_size=DEFAULT_BATCH_SIZE, settle_seconds=None, now=None):
+    """
+    Aggregate the searches recorded since the last run into `search_rollups` (per route and hour,
+    and per route and day) and `departure_demand` (per route and travel date).
+
+    Searches are read in `(searched_at, id)` order past the watermark, in batches. Each batch's
+    counts are added to the rollup tables and the watermark is advanced in the same transaction,
+    so every search is counted exactly once even if a run is interrupted.
+
+    Args:
+        batch_size (int): Number of searches aggregated per transaction.
+        settle_seconds (float, optional): Only aggregate searches older than this; defaults to
+            `ROLLUP_SETTLE_SECONDS` (or `DEFAULT_SETTLE_SECONDS`).
+        now (datetime, optional): The current time, for tests and backfills.
+
+    Returns:
+        int: The number of searches aggregated.
+    """
+    if settle_seconds is None:
+        settle_seconds = current_app.config.get('ROLLUP_SETTLE_SECONDS', DEFAULT_SETTLE_SECONDS)
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=settle_seconds)
+
+    watermark = db.session.get(RollupWatermark, WATERMARK)
+    if watermark is None:
+        watermark = RollupWatermark(name=WATERMARK)
+        db.session.add(watermark)
+
+    history = SearchHistory.__table__
+    aggregated = 0
+    while True:
+        query = (
+            select(history.c.id, history.c.searched_at, history.c.departure_city, history.c.arrival_city,
+                   history.c.departure_date, history.c.trip_type, history.c.guests)
+            .where(history.c.searched_at < cutoff)
+            .order_by(history.c.searched_at, history.c.id)
+            .limit(batch_size)
+        )
+        if watermark.searched_at is not None:
+            query = query.where(or_(history.c.searched_at > watermark.searched_at,
+                                    and_(history.c.searched_at == watermark.searched_at,
+                                         history.c.id > watermark.last_id)))
+        rows = db.session.execute(query).all()
+        if not rows:
+            db.session.commit()  # Persist a new watermark row, if any
+            break
+
+        try:
+            _add_counts(rows)
+            watermark.searched_at, watermark.last_id = rows[-1].searched_at, rows[-1].id
+            watermark.updated_at = datetime.utcnow()
+            bump_data_version('search_rollups', 'departure_demand')  # Upserts bypass the flush-time tracking
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        aggregated += len(rows)
+        current_app.logger.info("Rolled up %s searches (through %s)", len(rows), rows[-1].searched_at)
+        if len(rows) < batch_size:
+            break
+    return aggregated
+
+
+def _add_counts(rows):
+    """
+    Add a batch of searches to the rollup tables, in the current transaction.
+    """
+    rollups, demand = {}, {}
+    for row in rows:
+        route = (row.departure_city or ANY_AIRPORT, row.arrival_city or ANY_AIRPORT)
+        guests = row.guests or 1
+        roundtrip = 1 if row.trip_type == 'Roundtrip' else 0
+        for granularity in GRANULARITIES:
+            counts = rollups.setdefault((granularity, bucket_start(row.searched_at, granularity)) + route, [0, 0, 0])
+            counts[0] += 1
+            counts[1] += roundtrip
+            counts[2] += guests
+        if row.departure_date is not None:
+            counts = demand.setdefault(route + (row.departure_date,), [0, 0])
+            counts[0] += 1
+            counts[1] += guests
+
+    if rollups:
+        statement = insert(SearchRollup)
+        excluded = statement.excluded
+        table = SearchRollup.__table__
+        db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=['granularity', 'bucket_start', 'departure_city', 'arrival_city'],
+                set_={'searches': table.c.searches + excluded.searches,
+                      'roundtrip_searches': table.c.roundtrip_searches + excluded.roundtrip_searches,
+                      'guests': table.c.guests + excluded.guests},
+            ),
+            [{'granularity': granularity, 'bucket_start': start, 'departure_city': departure_city,
+              'arrival_city': arrival_city, 'searches': searches, 'roundtrip_searches': roundtrips, 'guests': guests}
+             for (granularity, start, departure_city, arrival_city), (searches, roundtrips, guests) in rollups.items()],
+        )
+    if demand:
+        statement = insert(DepartureDemand)
+        excluded = statement.excluded
+        table = DepartureDemand.__table__
+        db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=['departure_city', 'arrival_city', 'departure_date'],
+                set_={'searches': table.c.searches + excluded.searches, 'guests': table.c.guests + excluded.guests},
+            ),
+            [{'departure_city': departure_city, 'arrival_city': arrival_city, 'departure_date': departure_date,
+              'searches': searches, 'guests': guests}
+             for (departure_city, arrival_city, departure_date), (searches, guests) in demand.items()],
+        )
+
+
+def compact_search_analytics(now=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Apply the retention policies of the search analytics:
+
+    - hourly rollups older than `ROLLUP_HOURLY_RETENTION_DAYS` are deleted (their daily rollups remain);
+    - daily rollups and travel-date demand older than `ROLLUP_DAILY_RETENTION_DAYS` are deleted;
+    - raw searches older than `SEARCH_HISTORY_RETENTION_DAYS` are deleted, in batches, but only once
+      they have been rolled up;
+    - so are each user's searches beyond their `SEARCH_HISTORY_PER_USER` most recent ones.
+
+    A retention setting of None keeps that data forever.
+
+    Returns:
+        dict: The number of rows deleted per table.
+    """
+    now = now or datetime.utcnow()
+    config = current_app.config
+    deleted = {}
+
+    def older_than(days):
+        return now - timedelta(days=days) if days is not None else None
+
+    try:
+        hourly_cutoff = older_than(config.get('ROLLUP_HOURLY_RETENTION_DAYS'))
+        if hourly_cutoff:
+            deleted['search_rollups.hour'] = db.session.execute(
+                delete(SearchRollup).where(SearchRollup.granularity == 'hour',
+                                           SearchRollup.bucket_start < bucket_start(hourly_cutoff, 'hour'))
+            ).rowcount
+        daily_cutoff = older_than(config.get('ROLLUP_DAILY_RETENTION_DAYS'))
+        if daily_cutoff:
+            deleted['search_rollups.day'] = db.session.execute(
+                delete(SearchRollup).where(SearchRollup.granularity == 'day',
+                                           SearchRollup.bucket_start < bucket_start(daily_cutoff, 'day'))
+            ).rowcount
+            deleted['departure_demand'] = db.session.execute(
+                delete(DepartureDemand).where(DepartureDemand.departure_date < daily_cutoff.date())
+            ).rowcount
+        if any(deleted.values()):
+            bump_data_version('search_rollups', 'departure_demand')
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    # Never delete searches the rollup hasn't read yet
+    rolled_up = rolled_up_through()
+    if rolled_up is not None:
+        raw_cutoff = older_than(config.get('SEARCH_HISTORY_RETENTION_DAYS'))
+        if raw_cutoff:
+            deleted['search_history'] = _delete_searches(SearchHistory.searched_at < min(raw_cutoff, rolled_up),
+                                                         batch_size)
+        per_user = config.get('SEARCH_HISTORY_PER_USER')
+        if per_user:
+            deleted['search_history.per_user'] = prune_user_searches(per_user, rolled_up, batch_size)
+
+    current_app.logger.info("Compacted search analytics: %s", deleted)
+    return deleted
+
+
+def prune_user_searches(keep, before, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Delete each user's searches beyond their `keep` most recent ones, if they were made before `before`.
+
+    Users over the limit are found with one pass over the (user_id, searched_at) index, and each
+    one's surplus is then deleted in batches through the same index.
+
+    Returns:
+        int: The number of searches deleted.
+    """
+    over_limit = (
+        select(SearchHistory.user_id)
+        .group_by(SearchHistory.user_id)
+        .having(func.count() > keep)
+    )
+    deleted = 0
+    for user_id in db.session.execute(over_limit).scalars().all():
+        # Time of the user's keep-th most recent search: everything before it goes
+        oldest_kept = db.session.execute(
+            select(SearchHistory.searched_at)
+            .where(SearchHistory.user_id == user_id)
+            .order_by(SearchHistory.searched_at.desc())
+            .offset(keep - 1)
+            .limit(1)
+        ).scalar()
+        if oldest_kept is None:
+            continue
+        deleted += _delete_searches(and_(SearchHistory.user_id == user_id,
+                                         SearchHistory.searched_at < min(oldest_kept, before)), batch_size)
+    return deleted
+
+
+def _delete_searches(condition, batch_size):
+    """
+    Delete the searches matching a condition, committing every `batch_size` rows so writers aren't blocked for long.
+    """
+    deleted = 0
+    while True:
+        batch = select(SearchHistory.id).where(condition).limit(batch_size)
+        try:
+            count = db.session.execute(delete(SearchHistory).where(SearchHistory.id.in_(batch))).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def rolled_up_through():
+    """
+    Get the time of the last search included in the rollups, or None if nothing was rolled up yet.
+    """
+    watermark = db.session.get(RollupWatermark, WATERMARK)
+    return watermark.searched_at if watermark else None
+
+
+def get_top_routes(since, until, granularity='day', limit=10, departure_city=None, arrival_city=None):
+    """
+    Get the most searched routes between two times, from the rollups.
+
+    Args:
+        since (datetime): Start of the period (inclusive).
+        until (datetime): End of the period (exclusive).
+        granularity (str): 'hour' to count hour by hour (recent periods only, see retention) or 'day'.
+        limit (int): Number of routes to return.
+        departure_city (str, optional): Only routes from this airport code.
+        arrival_city (str, optional): Only routes to this airport code.
+
+    Returns:
+        list of dict: Routes with their number of searches, round trips and guests, most searched first.
+    """
+    searches = func.sum(SearchRollup.searches)
+    query = (
+        db.session.query(SearchRollup.departure_city, SearchRollup.arrival_city, searches,
+                         func.sum(SearchRollup.roundtrip_searches), func.sum(SearchRollup.guests))
+        .filter(SearchRollup.granularity == granularity,
+                SearchRollup.bucket_start >= bucket_start(since, granularity),
+                SearchRollup.bucket_start < until)
+        .group_by(SearchRollup.departure_city, SearchRollup.arrival_city)
+        .order_by(searches.desc(), SearchRollup.departure_city, SearchRollup.arrival_city)
+    )
+    if departure_city:
+        query = query.filter(SearchRollup.departure_city == departure_city)
+    if arrival_city:
+        query = query.filter(SearchRollup.arrival_city == arrival_city)
+    return [
+        {'departure_city': departure, 'arrival_city': arrival, 'searches': count,
+         'roundtrip_searches': roundtrips, 'guests': guests, 'average_guests': round(guests / count, 2)}
+        for departure, arrival, count, roundtrips, guests in query.limit(limit)
+    ]
+
+
+def get_search_volume(since, until, granularity='day', departure_city=None, arrival_city=None):
+    """
+    Get the number of searches (and guests) per hour or day between two times, from the rollups.
+    """
+    query = (
+        db.session.query(SearchRollup.bucket_start, func.sum(SearchRollup.searches), func.sum(SearchRollup.guests))
+        .filter(SearchRollup.granularity == granularity,
+                SearchRollup.bucket_start >= bucket_start(since, granularity),
+                SearchRollup.bucket_start < until)
+        .group_by(SearchRollup.bucket_start)
+        .order_by(SearchRollup.bucket_start)
+    )
+    if departure_city:
+        query = query.filter(SearchRollup.departure_city == departure_city)
+    if arrival_city:
+        query = query.filter(SearchRollup.arrival_city == arrival_city)
+    return [{'bucket_start': start.isoformat(), 'searches': count, 'guests': guests} for start, count, guests in query]
+
+
+def get_departure_demand(start_date, end_date, departure_city=None, arrival_city=None, limit=100):
+    """
+    Get the number of searches per route and travel date, for travel dates in a range.
+
+    Args:
+        start_date (date): First travel date (inclusive).
+        end_date (date): Last travel date (inclusive).
+        departure_city (str, optional): Only routes from this airport code.
+        arrival_city (str, optional): Only routes to this airport code.
+        limit (int): Number of rows to return, most searched first.
+
+    Returns:
+        list of dict: Route, travel date, searches and guests.
+    """
+    query = (
+        DepartureDemand.query
+        .filter(DepartureDemand.departure_date >= start_date, DepartureDemand.departure_date <= end_date)
+        .order_by(DepartureDemand.searches.desc(), DepartureDemand.departure_date)
+    )
+    if departure_city:
+        query = query.filter(DepartureDemand.departure_city == departure_city)
+    if arrival_city:
+        query = query.filter(DepartureDemand.arrival_city == arrival_city)
+    return [
+        {'departure_city': row.departure_city, 'arrival_city': row.arrival_city,
+         'departure_date': row.departure_date.isoformat(), 'searches': row.searches, 'guests': row.guests}
+        for row in query.limit(limit)
+    ]
@@ -1,10 +1,26 @@
+import logging
+import random
+import time
 from datetime import datetime
+from sqlalchemy import or_, select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, load_only, selectinload
+from sqlalchemy.orm.exc import StaleDataError
 from utils.users.users import get_user_by_email
-from models import Booking, db, User
+from models import Booking, Flight, booking_passenger, db, User, wants_field
+from utils.jobs.queue import enqueue
+from utils.events.outbox import notify_dispatcher, record_booking_event
+from utils.logs.logs import log_event
 import uuid
 from flask import jsonify, current_app 
 
+# Fields of a serialized booking that clients can select with `fields=`
+BOOKING_FIELDS = ('id', 'reference_number', 'owner', 'departure_flight', 'returning_flight', 'created_at',
+                  'completed', 'payment_received', 'is_round_trip', 'trip_status', 'passengers', 'version')
+
+# Longest pause before the first retry of an update that lost a race; doubled for each further retry
+RETRY_BACKOFF_SECONDS = 0.01
+
 
 def create_booking_entry(owner_id, departure_flight, returning_flight=None, passengers=[]):
     """
@@ -16,11 +32,8 @@ def create_booking_entry(owner_id, departure_flight, returning_flight=None, pass
     :param passengers: List of user data dictionaries for passengers (can be empty for just the owner).
     :return: Newly created booking object or an error message.
     """
-    current_app.logger.debug("Starting create_booking_entry")
-    current_app.logger.debug(
-        f"Parameters received: owner_id={owner_id}, departure_flight={departure_flight}, "
-        f"returning_flight={returning_flight}, passengers={len(passengers)}"
-    )
+    log_event(current_app.logger, logging.DEBUG, 'create_booking_entry.start', owner_id=owner_id,
+              departure_flight=departure_flight, returning_flight=returning_flight, passengers=len(passengers))
 
     try:
         # Create a new booking instance
@@ -32,22 +45,22 @@ def create_booking_entry(owner_id, departure_flight, returning_flight=None, pass
             returning_flight_id=returning_flight,
             created_at=datetime.utcnow(),
         )
-        current_app.logger.debug(f"Booking instance created with reference_number={reference_number}")
+        current_app.logger.debug("Booking instance created with reference_number=%s", reference_number)
 
         # Process each passenger in the list
         for index, passenger in enumerate(passengers):
-            current_app.logger.debug(f"Processing passenger {index + 1}/{len(passengers)}: {passenger}")
+            current_app.logger.debug("Processing passenger %d/%d", index + 1, len(passengers))
 
             email = passenger.get("email")
             if email:
-                current_app.logger.debug(f"Looking up user by email: {email}")
+                current_app.logger.debug("Looking up user by email: %s", email)
                 # Check if the passenger already exists
                 existing_passenger = get_user_by_email(email)
                 if existing_passenger:
-                    current_app.logger.debug(f"Existing passenger found: {existing_passenger.email}")
+                    current_app.logger.debug("Existing passenger found: %s", existing_passenger.email)
                     booking.passengers.append(existing_passenger)
                 else:
-                    current_app.logger.debug(f"No existing passenger found for email: {email}, creating new user")
+                    current_app.logger.debug("No existing passenger found for email: %s, creating new user", email)
 
                     dob_str = passenger.get("dob")
                     dob = datetime.strptime(str(dob_str)[:10], '%Y-%m-%d').date() if dob_str else None
@@ -62,78 +75,131 @@ def create_booking_entry(owner_id, departure_flight, returning_flight=None, pass
                     )
                     db.session.add(new_user)
                     db.session.flush()  # Ensure new_user ID is generated before associating
-                    current_app.logger.debug(f"New user created with email: {email}")
+                    current_app.logger.debug("New user created with email: %s", email)
                     booking.passengers.append(new_user)
 
-        # Add and commit the booking to the session
+        # Add and commit the booking to the session, with its event for downstream consumers
         db.session.add(booking)
+        db.session.flush()  # Generate the booking ID for the event
+        record_booking_event('booking.created', booking)
         db.session.commit()
         db.session.refresh(booking)
-        current_app.logger.info(f"Booking successfully created with reference_number={reference_number}")
+        notify_dispatcher()
+        current_app.logger.info("Booking successfully created with reference_number=%s", reference_number)
 
         return jsonify({"status": "success", "message": f"Booking successfully created with reference_number={reference_number}", "data": booking.to_dict()})
 
     except IntegrityError as e:
         db.session.rollback()
-        current_app.logger.error(f"IntegrityError during booking creation: {e}")
+        current_app.logger.error("IntegrityError during booking creation: %s", e)
         return jsonify({"status": "error", "message": "Booking creation failed due to integrity error.", "data": None})
 
     except Exception as e:
         db.session.rollback()
-        current_app.logger.error(f"Unexpected error during booking creation: {e}")
+        current_app.logger.error("Unexpected error during booking creation: %s", e)
         return jsonify({"status": "error", "message": "An unexpected error occurred during booking creation.", "data": None})
 
 
-def update_booking(booking_id, departure_flight_id=None, returning_flight_id=None, passengers=[]):
+def update_booking(booking_id, departure_flight_id=None, returning_flight_id=None, passengers=(),
+                   expected_version=None, owner_id=None):
     """
-    Update an existing booking by changing the flight or adding/removing passengers.
+    Update an existing booking by changing the flights or adding passengers.
+
+    Bookings are versioned: the UPDATE only applies if the booking still has the version it was read
+    with. With `expected_version` (the version the client last saw), a booking changed since then is
+    left alone and a 409 returned, so the client can reload it instead of overwriting the change.
+    Without it, the update is reapplied to the current booking, up to `BOOKING_UPDATE_RETRIES` times.
+    The session is always rolled back on failure.
 
     :param booking_id: ID of the booking to be updated.
     :param departure_flight_id: New departure flight ID (nullable).
-    :param returning_flight_id: New returning flight ID (nullable).
-    :param passengers: List of user IDs for passengers to be added/removed.
-    :return: Updated booking object or an error message.
+    :param returning_flight_id: New returning flight ID (nullable; '' removes the return flight).
+    :param passengers: List of user IDs of the passengers to add.
+    :param expected_version: The version of the booking the change was based on (nullable).
+    :param owner_id: Only update the booking if this user owns it (nullable).
+    :return: A (response, status code) tuple, with the updated booking or an error message.
     """
-
-    current_app.logger.info("Starting update_booking function.")
-    current_app.logger.debug(f"Received parameters: booking_id={booking_id}, departure_flight_id={departure_flight_id}, returning_flight_id={returning_flight_id}, passengers={passengers}")
-    try:
-        if not booking_id:
-            current_app.logger.error("Booking ID is required but was not provided.")
-            raise ValueError("Booking ID is required.")
-    
-        booking = Booking.query.get(booking_id)
-
-        if not booking:
-            current_app.logger.error("Booking ID is required but was not provided.")
-            return jsonify({"status": "error", "message":"Booking not found.", "data": None})
-
-    
-        current_app.logger.info(f"Updating booking with ID: {booking_id}")
-
-        if departure_flight_id:
-            current_app.logger.debug(f"Updating departure flight to {departure_flight_id} for booking {booking_id}.")
-            booking.departure_flight_id = departure_flight_id
-        if returning_flight_id is not None:
-            current_app.logger.debug(f"Updating returning flight to {returning_flight_id} for booking {booking_id}.")
-            booking.returning_flight_id = returning_flight_id
-
-        # Update passengers list
-        for passenger_id in passengers:
-            current_app.logger.debug(f"Updating passengers for booking {booking_id}: {passengers}.")
-
-            user = User.query.get(passenger_id)
-            if user and user not in booking.passengers:
-                booking.passengers.append(user)
-
-        db.session.commit()
-        db.session.refresh(booking)
-        current_app.logger.info(f"Successfully updated booking with ID: {booking_id}")
-    
-        return jsonify({"status": "success", "message": "Booking updated successfully", "data": booking.to_dict()})
-    except Exception as e:
-        current_app.logger.error(f"An error occurred while updating booking {booking_id}: {e}", exc_info=True)
-        return jsonify({"status": "error", "message": str(e), "data":None})
+    log_event(current_app.logger, logging.DEBUG, 'update_booking.start', booking_id=booking_id,
+              departure_flight_id=departure_flight_id, returning_flight_id=returning_flight_id,
+              passengers=len(passengers), expected_version=expected_version)
+    if not booking_id:
+        current_app.logger.error("Booking ID is required but was not provided.")
+        return jsonify({"status": "error", "message": "Booking ID is required.", "data": None}), 400
+
+    if departure_flight_id == '':
+        return jsonify({"status": "error", "message": "The departure flight can't be removed.", "data": None}), 400
+    clear_return = returning_flight_id == ''  # Makes the booking one-way
+    if clear_return:
+        returning_flight_id = None
+
+    passenger_ids = list(dict.fromkeys(passengers))  # Unique, in order
+    retries = current_app.config.get('BOOKING_UPDATE_RETRIES', 3)
+    for attempt in range(retries + 1):
+        try:
+            booking = find_booking(booking_id, options=[selectinload(Booking.passengers)])
+            if not booking or (owner_id is not None and booking.owner_id != owner_id):
+                db.session.rollback()
+                return jsonify({"status": "error", "message": "Booking not found.", "data": None}), 404
+            if expected_version is not None and booking.version != expected_version:
+                db.session.rollback()
+                return _booking_conflict(booking_id, booking.version)
+
+            for flight_id in (departure_flight_id, returning_flight_id):
+                if flight_id is not None and db.session.get(Flight, flight_id) is None:
+                    db.session.rollback()
+                    return jsonify({"status": "error", "message": f"Flight {flight_id} not found.", "data": None}), 400
+
+            # The new passengers, in one query
+            current_ids = {passenger.id for passenger in booking.passengers}
+            new_ids = [passenger_id for passenger_id in passenger_ids if passenger_id not in current_ids]
+            users = {user.id: user for user in User.query.filter(User.id.in_(new_ids))} if new_ids else {}
+            unknown = [passenger_id for passenger_id in new_ids if passenger_id not in users]
+            if unknown:
+                db.session.rollback()
+                return jsonify({"status": "error", "message": f"Unknown passengers: {', '.join(unknown)}",
+                                "data": None}), 400
+
+            if departure_flight_id is not None:
+                current_app.logger.debug("Updating departure flight to %s for booking %s.", departure_flight_id, booking_id)
+                booking.departure_flight_id = departure_flight_id
+            if returning_flight_id is not None or clear_return:
+                current_app.logger.debug("Updating returning flight to %s for booking %s.", returning_flight_id, booking_id)
+                booking.returning_flight_id = returning_flight_id
+            booking.passengers.extend(users[passenger_id] for passenger_id in new_ids)
+
+            # Passengers are rows of the association table, which don't update the booking: bump the
+            # version explicitly, so every change is checked against (and seen by) concurrent ones
+            booking.version = booking.version + 1
+            record_booking_event('booking.updated', booking)
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            if expected_version is not None or attempt == retries:
+                current = db.session.get(Booking, booking_id)
+                return _booking_conflict(booking_id, current.version if current else None)
+            current_app.logger.info("Booking %s changed concurrently, retrying the update (%d/%d)",
+                                    booking_id, attempt + 1, retries)
+            # A short random pause, so updates racing for the same booking don't collide again
+            time.sleep(random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** attempt))
+            continue
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error("An error occurred while updating booking %s: %s", booking_id, e, exc_info=True)
+            return jsonify({"status": "error", "message": "An unexpected error occurred while updating the booking.",
+                            "data": None}), 500
+
+        notify_dispatcher()
+        current_app.logger.info("Successfully updated booking with ID: %s to version %s", booking_id, booking.version)
+        return jsonify({"status": "success", "message": "Booking updated successfully", "data": booking.to_dict()}), 200
+
+
+def _booking_conflict(booking_id, current_version):
+    """
+    The 409 response for an update based on an outdated version of a booking.
+    """
+    current_app.logger.info("Rejected a stale update of booking %s (now at version %s)", booking_id, current_version)
+    return jsonify({"status": "error", "message": "The booking was changed by someone else; reload it and try again.",
+                    "data": {"version": current_version}}), 409
 
 
 def pay_booking(booking_id):
@@ -155,8 +221,21 @@ def pay_booking(booking_id):
     booking.payment_received = datetime.utcnow()
     booking.completed = datetime.utcnow()
 
-    db.session.commit()
+    record_booking_event('booking.paid', booking)
+    try:
+        db.session.commit()
+    except StaleDataError:
+        # Paid or changed concurrently: the version check keeps it from being paid twice
+        db.session.rollback()
+        return jsonify({"status": "error", "message":  "This booking was changed meanwhile; reload it and try again.", "data": None, "code": 409})
+    except Exception:
+        db.session.rollback()
+        raise
     db.session.refresh(booking)
+    notify_dispatcher()
+
+    # Send the confirmation in the background
+    enqueue('send_booking_confirmation', {'booking_id': booking.id})
 
     return jsonify({"status": "success", "message":  "This booking has been paid for successfully.", "data": {
         'reference_number': booking.reference_number,
@@ -164,6 +243,114 @@ def pay_booking(booking_id):
         'payment_received': booking.payment_received
     }, "code": 200})
 
+def booking_load_options(fields=None):
+    """
+    Build the loader options to serialize bookings with the given fields.
+
+    Only the columns the fields are built from are loaded; the requested relationships (owner,
+    flights with their airports, passengers) are loaded eagerly, in a fixed number of queries
+    whatever the number of bookings, and the others are never loaded.
+
+    :param fields: The requested fields (None for all of them, see `BOOKING_FIELDS`).
+    :return: A list of options for `Query.options`.
+    """
+    columns = [Booking.id]
+    options = []
+    if wants_field(fields, 'reference_number'):
+        columns.append(Booking.reference_number)
+    if wants_field(fields, 'owner'):
+        columns.append(Booking.owner_id)
+        options.append(joinedload(Booking.owner))
+    if wants_field(fields, 'departure_flight'):
+        columns.append(Booking.departure_flight_id)
+        options.append(joinedload(Booking.departure_flight).options(
+            joinedload(Flight.departure_airport), joinedload(Flight.arrival_airport)))
+    elif wants_field(fields, 'trip_status'):
+        # The trip status only needs the departure date
+        columns.append(Booking.departure_flight_id)
+        options.append(joinedload(Booking.departure_flight).load_only(Flight.start_date))
+    if wants_field(fields, 'returning_flight', 'is_round_trip'):
+        columns.append(Booking.returning_flight_id)
+    if wants_field(fields, 'returning_flight'):
+        options.append(joinedload(Booking.returning_flight).options(
+            joinedload(Flight.departure_airport), joinedload(Flight.arrival_airport)))
+    for name in ('created_at', 'completed', 'payment_received', 'version'):
+        if wants_field(fields, name):
+            columns.append(getattr(Booking, name))
+    if wants_field(fields, 'passengers'):
+        options.append(selectinload(Booking.passengers))
+    return [load_only(*columns), *options]
+
+
+def find_booking(booking_id=None, reference_number=None, options=()):
+    """
+    Find a booking by its ID or, failing that, its reference number.
+
+    :param booking_id: ID of the booking (nullable).
+    :param reference_number: Reference number of the booking (nullable).
+    :param options: Loader options, e.g. from `booking_load_options`.
+    :return: The Booking, or None if not found.
+    """
+    if booking_id:
+        booking = db.session.get(Booking, booking_id, options=options)  # Retrieve booking by ID
+        if booking:
+            return booking
+        current_app.logger.debug("Booking not found from booking id %s", booking_id)
+
+    if reference_number:
+        booking = Booking.query.options(*options).filter_by(reference_number=reference_number).first()  # Retrieve booking by reference number
+        if booking:
+            return booking
+        current_app.logger.debug("Booking not found from reference_number %s", reference_number)
+    return None
+
+
+def find_bookings(booking_ids=(), reference_numbers=(), options=(), visible_to=None):
+    """
+    Find many bookings by ID and/or reference number in a single query.
+
+    :param booking_ids: IDs of the bookings.
+    :param reference_numbers: Reference numbers of the bookings.
+    :param options: Loader options, e.g. from `booking_load_options`.
+    :param visible_to: Only find the bookings this user ID owns or travels on (nullable: all).
+    :return: A dict mapping each requested identifier that was found to its Booking.
+    """
+    booking_ids, reference_numbers = set(booking_ids), set(reference_numbers)
+    conditions = []
+    if booking_ids:
+        conditions.append(Booking.id.in_(booking_ids))
+    if reference_numbers:
+        conditions.append(Booking.reference_number.in_(reference_numbers))
+    if not conditions:
+        return {}
+
+    query = Booking.query.options(*options).filter(or_(*conditions))
+    if visible_to is not None:
+        query = query.filter(or_(
+            Booking.owner_id == visible_to,
+            Booking.id.in_(select(booking_passenger.c.booking_id).where(booking_passenger.c.user_id == visible_to)),
+        ))
+
+    found = {}
+    for booking in query:
+        if booking.id in booking_ids:
+            found[booking.id] = booking
+        if booking.reference_number in reference_numbers:
+            found[booking.reference_number] = booking
+    return found
+
+
+def find_user_bookings(owner_id, options=()):
+    """
+    Get all the bookings owned by a user.
+
+    :param owner_id: ID of the owner.
+    :param options: Loader options, e.g. from `booking_load_options`.
+    :return: A list of Bookings.
+    """
+    return Booking.query.options(*options).filter_by(owner_id=owner_id).all()
+
+
 def get_booking(booking_id=None, reference_number=None):
     """
     Retrieve a booking by its ID or reference number.
@@ -172,26 +359,63 @@ def get_booking(booking_id=None, reference_number=None):
     :param reference_number: Reference number of the booking (nullable).
     :return: Booking object or None if not found.
     """
-    current_app.logger.debug(f"starting get_booking with booking_id{booking_id}, reference_number: {reference_number}")
+    current_app.logger.debug("Starting get_booking with booking_id=%s, reference_number=%s", booking_id, reference_number)
     try:
-        if booking_id:
-            booking = Booking.query.get(booking_id)  # Retrieve booking by ID
-            if booking:
-                return jsonify({"status": "success", "message":  "booking data successfully retrieved", "data": booking.to_dict(), "code": 200})
-            else:
-                current_app.logger.debug(f"booking not found from booking id {booking_id}")
-
-        if reference_number:
-            booking = Booking.query.filter_by(reference_number=reference_number).first()  # Retrieve booking by reference number
-            if booking:
-                return jsonify({"status": "success", "message":  "booking data successfully retrieved", "data": booking.to_dict(), "code": 200})
-            else:
-                current_app.logger.debug(f"booking not found from reference_number {reference_number}")
+        booking = find_booking(booking_id, reference_number)
+        if booking:
+            return jsonify({"status": "success", "message":  "booking data successfully retrieved", "data": booking.to_dict(), "code": 200})
 
         return jsonify({"status": "error", "message":  "booking data not found" , "data": None, "code": 404})
     except Exception as e:
-        current_app.logger.error(f"Error occurred in get_booking: {e}")  # Print the error for debugging
+        current_app.logger.error("Error occurred in get_booking: %s", e)  # Print the error for debugging
         return jsonify({"status": "error", "message":  f"booking data not found: {e}" , "data": None, "code": 500})
 
+
+def serialize_bookings(bookings, compact=False, fields=None):
+    """
+    Convert bookings to dictionaries.
+
+    :param bookings: The bookings to serialize.
+    :param compact: Use the compact format: people and airports are sent once, in `users` and
+        `airports` maps keyed by ID, and the bookings reference them by ID.
+    :param fields: Only include these fields of each booking (None for all of them).
+    :return: A list of bookings, or in the compact format a dict with `bookings`, `users` and `airports`.
+    """
+    if not compact:
+        return [booking.to_dict(fields=fields) for booking in bookings]
+    users, airports = {}, {}
+    data = [booking.to_dict(users=users, airports=airports, fields=fields) for booking in bookings]
+    return {"bookings": data, "users": users, "airports": airports}
+
+
+def serialize_booking_batch(identifiers, found, compact=False, fields=None):
+    """
+    Convert the result of a batch lookup to a dictionary keyed by the requested identifiers.
+
+    :param identifiers: The requested booking IDs and reference numbers, in request order.
+    :param found: The bookings found, keyed by identifier (see `find_bookings`).
+    :param compact: Use the compact format (see `serialize_bookings`).
+    :param fields: Only include these fields of each booking (None for all of them).
+    :return: A dict with the `bookings` found and an `errors` entry for each identifier that wasn't,
+        plus the `users` and `airports` maps in the compact format.
+    """
+    users, airports = ({}, {}) if compact else (None, None)
+    serialized = {}  # By booking ID, so a booking requested by ID and by reference is serialized once
+    bookings, errors = {}, {}
+    for identifier in identifiers:
+        booking = found.get(identifier)
+        if booking is None:
+            errors[identifier] = {"code": 404, "message": "Booking not found"}
+            continue
+        if booking.id not in serialized:
+            serialized[booking.id] = booking.to_dict(users=users, airports=airports, fields=fields)
+        bookings[identifier] = serialized[booking.id]
+
+    result = {"bookings": bookings, "errors": errors}
+    if compact:
+        result.update(users=users, airports=airports)
+    return result
+
+
 def generate_reference_number():
     return f"SKY-{uuid.uuid4()}"
@@ -0,0 +1,103 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import Response, make_response, request
+from flask_jwt_extended import get_jwt_identity
+
+from utils.cache.versions import get_data_versions
+from utils.http.compression import encoded_etags
+from utils.metrics.metrics import record_cache
+
+
+def utc_today():
+    """
+    ETag part for responses computed from the current date (UTC), e.g. trip statuses.
+    """
+    return datetime.utcnow().date().isoformat()
+
+
+def utc_hour():
+    """
+    ETag part for responses over a window ending now, in hourly or daily buckets.
+    """
+    return datetime.utcnow().strftime('%Y-%m-%dT%H')
+
+
+class CachePolicy:
+    """
+    HTTP caching rules for a read-only endpoint.
+
+    The ETag is derived from the versions of the tables the response is built from, the endpoint
+    and its query string (and, for private responses, the caller's identity), so it can be checked
+    against `If-None-Match` before any query runs.
+
+    Args:
+        tables (tuple of str): Tables the response depends on (see utils/cache/versions.py).
+        max_age (int): Seconds clients may reuse the response without revalidating (0: always revalidate).
+        private (bool): The response depends on the Authorization header; shared caches must not store it.
+        negotiated (bool): The response format depends on the Accept header (see utils/http/formats.py).
+        key_parts (tuple of callable): Functions whose results are added to the ETag, for responses
+            that depend on more than the tables, e.g. `utc_today` for ones computed from the date.
+    """
+
+    def __init__(self, tables, max_age=0, private=False, negotiated=False, key_parts=()):
+        self.tables = tuple(tables)
+        self.private = private
+        self.negotiated = negotiated
+        self.key_parts = tuple(key_parts)
+        self.cache_control = ', '.join(
+            ['private' if private else 'public', f'max-age={max_age}' if max_age else 'no-cache'])
+
+    def etag(self):
+        """
+        Compute the ETag of the current request.
+        """
+        parts = [request.endpoint, sorted(request.args.items(multi=True)), get_data_versions(self.tables)]
+        if self.private:
+            parts.append(get_jwt_identity())
+        if self.negotiated:
+            parts.append(request.headers.get('Accept'))
+        parts.extend(part() for part in self.key_parts)
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def not_modified(self, etag):
+        """
+        Return a 304 response if the client already has this version, None otherwise.
+        """
+        # The client may hold a compressed representation, whose ETag carries the coding
+        matched = next((candidate for candidate in encoded_etags(etag) if candidate in request.if_none_match), None)
+        record_cache('http_etag', matched is not None)
+        if matched is not None:
+            return self.apply(Response(status=304), matched)
+        return None
+
+    def apply(self, response, etag):
+        """
+        Add the ETag and caching headers to a response. Only successful responses are cacheable.
+        """
+        if response.status_code in (200, 304):
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = self.cache_control
+            if self.private:
+                response.vary.add('Authorization')
+            if self.negotiated:
+                response.vary.add('Accept')
+        return response
+
+
+def conditional(policy):
+    """
+    Decorate a GET view so it answers 304 Not Modified, without running, when the client's ETag
+    is current. Place it below `@jwt_required()` for private policies.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = policy.etag()
+            not_modified = policy.not_modified(etag)
+            if not_modified is not None:
+                return not_modified
+            return policy.apply(make_response(view(*args, **kwargs)), etag)
+        return wrapper
+    return decorator
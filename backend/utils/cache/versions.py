@@ -0,0 +1,97 @@
+import itertools
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, insert, select, update
+
+from models import db, DataVersion
+from utils.metrics.metrics import record_cache
+
+# Tables whose changes invalidate cached responses; a write to any of them bumps its version
+VERSIONED_TABLES = frozenset({'airports', 'routes', 'flights', 'users', 'bookings', 'search_rollups', 'departure_demand'})
+
+# Seconds the versions read from the database are reused before being read again
+DEFAULT_TTL = 1.0
+
+_versions = {}
+_loaded_at = float('-inf')
+
+
+def bump_data_version(*names):
+    """
+    Increment the version of each named table, in the current transaction.
+
+    ORM writes to `VERSIONED_TABLES` are tracked automatically on flush; call this after bulk
+    (Core) inserts or updates, before committing.
+
+    Args:
+        *names (str): Table names, e.g. 'flights'.
+    """
+    connection = db.session.connection()
+    table = DataVersion.__table__
+    now = datetime.utcnow()
+    for name in names:
+        result = connection.execute(
+            update(table).where(table.c.name == name).values(version=table.c.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(name=name, version=1, updated_at=now))
+    db.session.info.setdefault('bumped_versions', set()).update(names)
+
+
+def get_data_versions(names):
+    """
+    Get the current versions of the named tables.
+
+    All versions are read with one query and reused for `DATA_VERSION_TTL` seconds (default 1),
+    so a change made by another process is seen within that time. Changes committed by this
+    process are seen immediately.
+
+    Args:
+        names (iterable of str): Table names.
+
+    Returns:
+        tuple of int: The versions, in the same order (0 for tables never written).
+    """
+    global _versions, _loaded_at
+    now = time.monotonic()
+    fresh = now - _loaded_at <= current_app.config.get('DATA_VERSION_TTL', DEFAULT_TTL)
+    record_cache('data_versions', fresh)
+    if not fresh:
+        table = DataVersion.__table__
+        _versions = dict(db.session.execute(select(table.c.name, table.c.version)).all())
+        _loaded_at = now
+    return tuple(_versions.get(name, 0) for name in names)
+
+
+def _track_writes(session, flush_context, instances):
+    """
+    Bump the versions of the tables written by this flush.
+    """
+    tables = set()
+    for instance in itertools.chain(session.new, session.deleted, session.dirty):
+        table = getattr(instance, '__tablename__', None)
+        if table in VERSIONED_TABLES and table not in tables and (
+                instance not in session.dirty or session.is_modified(instance)):
+            tables.add(table)
+    if tables:
+        bump_data_version(*sorted(tables))
+
+
+def _forget_versions(session):
+    """
+    After a commit that bumped versions, make the next read go to the database.
+    """
+    global _loaded_at
+    if session.info.pop('bumped_versions', None):
+        _loaded_at = float('-inf')
+
+
+def _discard_bumps(session):
+    session.info.pop('bumped_versions', None)
+
+
+event.listen(db.session, 'before_flush', _track_writes)
+event.listen(db.session, 'after_commit', _forget_versions)
+event.listen(db.session, 'after_rollback', _discard_bumps)
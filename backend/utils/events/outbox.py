@@ -0,0 +1,253 @@
+"""
+Transactional outbox of booking events.
+
+Booking writes add an `OutboxEvent` in the same transaction as the change, so an event exists if
+and only if the change was committed. The dispatcher then delivers the events, in order, to each
+registered sink (an NDJSON file, the job queue, ...) and records how far each sink got, so
+consumers follow the events instead of polling the bookings table.
+
+Delivery is at least once: a sink may see an event again if the dispatcher stops between writing
+it and saving the checkpoint, so consumers should skip event IDs they have already handled.
+"""
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from models import OutboxCheckpoint, OutboxEvent, db
+from utils.jobs.queue import enqueue
+
+# Events delivered to a sink per transaction
+DEFAULT_BATCH_SIZE = 500
+
+
+def booking_snapshot(booking):
+    """
+    Serialize the state of a booking carried by its events: IDs and timestamps only, so consumers
+    don't depend on the API's response format.
+    """
+    def iso(value):
+        return value.isoformat() if value else None
+
+    return {
+        'reference_number': booking.reference_number,
+        'owner_id': booking.owner_id,
+        'departure_flight_id': booking.departure_flight_id,
+        'returning_flight_id': booking.returning_flight_id,
+        'passenger_ids': [passenger.id for passenger in booking.passengers],
+        'created_at': iso(booking.created_at),
+        'payment_received': iso(booking.payment_received),
+        'completed': iso(booking.completed),
+    }
+
+
+def record_booking_event(event_type, booking):
+    """
+    Add an event about a booking to the outbox, in the current transaction (commit it with the change).
+
+    Args:
+        event_type (str): 'booking.created', 'booking.updated' or 'booking.paid'.
+        booking (Booking): The booking, after the change; it must have an ID (flush a new one first).
+
+    Returns:
+        OutboxEvent: The pending event.
+    """
+    event = OutboxEvent(event_type=event_type, aggregate_id=booking.id, payload=json.dumps(booking_snapshot(booking)))
+    db.session.add(event)
+    return event
+
+
+def notify_dispatcher():
+    """
+    Queue a dispatch after events were committed. Best effort: undelivered events are also picked
+    up by the next dispatch, whatever triggers it.
+
+    At most one dispatch waits in the queue: it delivers every event committed until it starts. One
+    that is already running may have read past the new events, so another one is still queued then.
+    """
+    try:
+        enqueue('dispatch_outbox', dedupe_key='dispatch_outbox', dedupe_running=False)
+    except Exception as e:
+        current_app.logger.warning("Could not queue the outbox dispatch: %s", e)
+
+
+class FileSink:
+    """
+    Appends events to a local NDJSON file, one JSON object per line, synced to disk after each batch.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, events):
+        with open(self.path, 'a', encoding='utf-8') as stream:
+            stream.writelines(json.dumps(event) + '\n' for event in events)
+            stream.flush()
+            os.fsync(stream.fileno())
+
+
+class JobSink:
+    """
+    Queues each event as a job on the local job queue, for consumers written as `@job` handlers.
+    """
+
+    def __init__(self, job_name):
+        self.job_name = job_name
+
+    def write(self, events):
+        for event in events:
+            # Deduplicated while queued, in case a batch is delivered again
+            enqueue(self.job_name, {'event': event}, dedupe_key=f"{self.job_name}:{event['id']}")
+
+
+def init_outbox(flask_app):
+    """
+    Set up the outbox sinks of the application, in `app.extensions['outbox_sinks']`.
+
+    The `OUTBOX_FILE` config value (relative to the instance folder) adds a `FileSink`, and
+    `OUTBOX_JOB` a `JobSink`. Other sinks (any object with a `write(events)` method) can be added
+    with `register_sink`.
+    """
+    sinks = flask_app.extensions.setdefault('outbox_sinks', {})
+    if flask_app.config.get('OUTBOX_FILE'):
+        sinks['file'] = FileSink(os.path.join(flask_app.instance_path, flask_app.config['OUTBOX_FILE']))
+    if flask_app.config.get('OUTBOX_JOB'):
+        sinks['job'] = JobSink(flask_app.config['OUTBOX_JOB'])
+    return sinks
+
+
+def register_sink(flask_app, name, sink):
+    """
+    Add a sink; it first receives every event still in the outbox, then new ones as they come.
+    """
+    flask_app.extensions.setdefault('outbox_sinks', {})[name] = sink
+
+
+@contextmanager
+def _sink_lock(name):
+    """
+    Hold a sink's dispatch lock: an exclusive lock on a file in the instance folder, so two
+    dispatchers (e.g. on different job workers) deliver one after the other, never the same events
+    twice. It is separate from the database's write lock, which booking writes need meanwhile.
+    """
+    os.makedirs(current_app.instance_path, exist_ok=True)
+    with open(os.path.join(current_app.instance_path, f'outbox-{name}.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_checkpoint(name):
+    """
+    Get the ID of the last event a sink received, creating its checkpoint on its first dispatch.
+    """
+    last_event_id = db.session.execute(
+        select(OutboxCheckpoint.last_event_id).where(OutboxCheckpoint.sink == name)).scalar()
+    if last_event_id is None:
+        db.session.execute(insert(OutboxCheckpoint).values(sink=name, last_event_id=0, updated_at=datetime.utcnow())
+                           .on_conflict_do_nothing(index_elements=['sink']))
+        db.session.commit()
+        last_event_id = 0
+    return last_event_id
+
+
+def dispatch_events(sinks=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Deliver the events each sink hasn't received yet, in order.
+
+    Events are read by ID past the sink's checkpoint, `batch_size` at a time. Each batch is read,
+    the read transaction ended, and only then written to the sink (a file sink syncs it to disk), so
+    no database lock is held while the sink works. The checkpoint is then advanced, if no one else
+    moved it meanwhile. Dispatchers take turns per sink (see `_sink_lock`). If a sink fails, the
+    error is raised (the job is retried) and its checkpoint stays at the last batch it received.
+
+    Args:
+        sinks (dict, optional): Sinks by name (default: the application's).
+        batch_size (int): Events per batch.
+
+    Returns:
+        dict: The number of events delivered per sink.
+    """
+    sinks = current_app.extensions.get('outbox_sinks', {}) if sinks is None else sinks
+    delivered = {}
+    for name, sink in sinks.items():
+        delivered[name] = 0
+        with _sink_lock(name):
+            while True:
+                try:
+                    last_event_id = _read_checkpoint(name)
+                    events = [event.to_dict() for event in OutboxEvent.query.filter(OutboxEvent.id > last_event_id)
+                              .order_by(OutboxEvent.id).limit(batch_size)]
+                    db.session.rollback()  # End the read transaction before the sink runs
+                    if not events:
+                        break
+                    sink.write(events)
+                    advanced = db.session.execute(
+                        update(OutboxCheckpoint)
+                        .where(OutboxCheckpoint.sink == name, OutboxCheckpoint.last_event_id == last_event_id)
+                        .values(last_event_id=events[-1]['id'], updated_at=datetime.utcnow())
+                    ).rowcount
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+                if not advanced:
+                    current_app.logger.warning("Checkpoint of outbox sink %s moved during a dispatch", name)
+                    continue
+                delivered[name] += len(events)
+                if len(events) < batch_size:
+                    break
+
+    if any(delivered.values()):
+        current_app.logger.info("Dispatched outbox events: %s", delivered)
+    return delivered
+
+
+def prune_events(sinks=None, now=None):
+    """
+    Delete the events older than `OUTBOX_RETENTION_DAYS` that every sink has received.
+
+    Returns:
+        int: The number of events deleted.
+    """
+    days = current_app.config.get('OUTBOX_RETENTION_DAYS')
+    if days is None:
+        return 0
+    sinks = current_app.extensions.get('outbox_sinks', {}) if sinks is None else sinks
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    condition = OutboxEvent.created_at < cutoff
+    if sinks:
+        delivered_to_all = db.session.execute(
+            select(func.min(OutboxCheckpoint.last_event_id)).where(OutboxCheckpoint.sink.in_(list(sinks)))
+        ).scalar()
+        checkpoints = db.session.query(OutboxCheckpoint).filter(OutboxCheckpoint.sink.in_(list(sinks))).count()
+        if checkpoints < len(sinks):
+            return 0  # A sink hasn't been dispatched to yet
+        condition = condition & (OutboxEvent.id <= delivered_to_all)
+    try:
+        deleted = db.session.execute(delete(OutboxEvent).where(condition)).rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return deleted
+
+
+def follow_events(poll_interval=1.0, stop_event=None):
+    """
+    Dispatch events continuously, checking for new ones every `poll_interval` seconds (e.g. from
+    `flask dispatch-events --follow`) until `stop_event` is set.
+    """
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        dispatch_events()
+        db.session.remove()  # Release the connection between polls
+        stop_event.wait(poll_interval)
@@ -1,14 +1,111 @@
 # Function to get a list of all airports
-from models import Airport, Flight
+import threading
+import time
+
+from sqlalchemy import select
+
+from models import Airport, Flight, db
+from utils.flights.flight_view import AirportView
+from utils.metrics.metrics import record_cache
+
+# Minimum seconds between reloads triggered by a lookup miss (e.g. an unknown airport code)
+REGISTRY_RELOAD_INTERVAL = 30
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+class AirportRegistry:
+    """
+    Read-only, in-process index of every airport.
+
+    Airports change only when the database is seeded, so they are loaded once per process (before
+    the server forks its workers, when preloading) and shared by all requests. Search uses it to
+    resolve airport codes to IDs and to attach airports to flights without joining the airports table.
+    """
+
+    def __init__(self, airports):
+        self.loaded_at = time.monotonic()
+        self.by_id = {airport.id: airport for airport in airports}
+        self.by_code = {}  # Codes are not guaranteed unique, so each maps to a tuple of IDs
+        for airport in airports:
+            self.by_code[airport.code] = self.by_code.get(airport.code, ()) + (airport.id,)
+        self.dicts = tuple(airport.to_dict() for airport in airports)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def ids_for_code(self, code):
+        """
+        Get the IDs of the airports with the given code (an empty tuple if there are none).
+        """
+        return self.by_code.get(code, ())
+
+
+def load_airport_registry():
+    """
+    Load all airports from the database into a new `AirportRegistry` and make it the current one.
+    """
+    global _registry
+    table = Airport.__table__
+    rows = db.session.execute(select(table.c.id, table.c.code, table.c.name)).all()
+    registry = AirportRegistry([AirportView(*row) for row in rows])
+    with _registry_lock:
+        _registry = registry
+    return registry
+
+
+def get_airport_registry(refresh=False):
+    """
+    Get the airport registry, loading it on first use.
+
+    Args:
+        refresh (bool): Reload the registry if it is older than `REGISTRY_RELOAD_INTERVAL`. Callers
+            pass this after a lookup miss, so airports seeded after startup are picked up.
+
+    Returns:
+        AirportRegistry: The current registry.
+    """
+    registry = _registry
+    stale = registry is None or ((refresh or not registry)
+                                 and time.monotonic() - registry.loaded_at > REGISTRY_RELOAD_INTERVAL)
+    record_cache('airports', not stale)
+    if stale:
+        registry = load_airport_registry()
+    return registry
+
+
+def reset_airport_registry():
+    """
+    Drop the loaded registry so the next lookup reads the airports again (e.g. after seeding).
+    """
+    global _registry
+    with _registry_lock:
+        _registry = None
+
+
+def resolve_airport_ids(code):
+    """
+    Resolve an airport code to the IDs of the matching airports.
+
+    Args:
+        code (str): The airport code, e.g. 'KIN'.
+
+    Returns:
+        tuple: The matching airport IDs, empty if the code is unknown.
+    """
+    ids = get_airport_registry().ids_for_code(code)
+    if not ids:
+        ids = get_airport_registry(refresh=True).ids_for_code(code)
+    return ids
 
 
 def get_all_airports():
     """
     Get a list of all airports in the system.
-    Excludes any soft-deleted airports and returns the data in a dictionary format.
+    Returns the data in a dictionary format, served from the in-process airport registry.
     """
-    airports = Airport.query.all()  # Exclude soft-deleted airports
-    return [airport.to_dict() for airport in airports]
+    return list(get_airport_registry().dicts)
 
 
 def get_airport_by_id(airport_id):
@@ -0,0 +1,137 @@
+from typing import NamedTuple, Optional
+from datetime import date
+
+from sqlalchemy import null, select
+
+from models import Flight, only_fields, serialize_flight_airports, wants_field
+from utils.flights.pricing import flight_cost, flight_duration
+
+
+# Table columns each serialized flight field is built from; cost and duration are computed from the schedule
+SCHEDULE_COLUMNS = ('departure_time', 'arrival_time', 'start_date', 'end_date')
+FLIGHT_FIELD_COLUMNS = {
+    'id': ('id',),
+    'flight_num': ('flight_num',),
+    'departure_airport': ('departure_airport_id',),
+    'arrival_airport': ('arrival_airport_id',),
+    'departure_time': ('departure_time',),
+    'arrival_time': ('arrival_time',),
+    'start_date': ('start_date',),
+    'end_date': ('end_date',),
+    'cost': SCHEDULE_COLUMNS,
+    'duration': SCHEDULE_COLUMNS,
+}
+FLIGHT_FIELDS = tuple(FLIGHT_FIELD_COLUMNS)  # Fields clients can select with `fields=`
+
+# Columns of a `flight_view_select` row, in order
+VIEW_COLUMNS = ('id', 'flight_num', 'departure_time', 'arrival_time', 'start_date', 'end_date',
+                'departure_airport_id', 'arrival_airport_id')
+
+
+class AirportView(NamedTuple):
+    """
+    Read-only snapshot of an airport, as embedded in search results.
+    """
+    id: str
+    code: str
+    name: str
+
+    def to_dict(self):
+        """
+        Convert the airport to a dictionary, matching `Airport.to_dict`.
+        """
+        return {
+            'id': self.id,
+            'name': self.name,
+            'code': self.code
+        }
+
+
+class FlightView(NamedTuple):
+    """
+    Read-only snapshot of a flight used on the search hot path.
+
+    Unlike the ORM `Flight`, a view is an immutable tuple with no instance dict, no identity-map
+    entry and no lazy loaders: it is built straight from the rows of a Core `select`, with its
+    airports taken from the in-process airport registry.
+    """
+    id: str
+    flight_num: str
+    departure_time: str
+    arrival_time: str
+    start_date: date
+    end_date: date
+    departure_airport: Optional[AirportView]
+    arrival_airport: Optional[AirportView]
+
+    @classmethod
+    def from_row(cls, row, airports):
+        """
+        Build a view from a row selected with `flight_view_select`.
+
+        Args:
+            row (Row): The selected flight columns followed by both airport IDs.
+            airports (dict): `AirportView` snapshots keyed by airport ID.
+        """
+        (flight_id, flight_num, departure_time, arrival_time, start_date, end_date,
+         departure_id, arrival_id) = row
+        return cls(
+            flight_id, flight_num, departure_time, arrival_time, start_date, end_date,
+            airports.get(departure_id), airports.get(arrival_id),
+        )
+
+    def duration(self):
+        """
+        Get the duration of the flight in hours, matching `Flight.duration()`.
+        """
+        return flight_duration(self.start_date, self.departure_time, self.end_date, self.arrival_time)
+
+    def cost(self):
+        """
+        Get the fare for the flight, matching `Flight.cost()`.
+        """
+        return flight_cost(self.duration())
+
+    def to_dict(self, pricing=None, airports=None, fields=None):
+        """
+        Convert the view to a dictionary, matching `Flight.to_dict`.
+
+        Args:
+            pricing (tuple, optional): A precomputed `(duration, cost)` pair, as returned by `price_flights`.
+            airports (dict, optional): Compact format: collects the airports by ID, see `Flight.to_dict`.
+            fields (set, optional): Only include these fields; the view must have been selected with them.
+        """
+        if pricing is None:
+            pricing = (self.duration(), self.cost()) if wants_field(fields, 'cost', 'duration') else (None, None)
+        duration, cost = pricing
+        return {
+            **only_fields({
+                'id': self.id,
+                'flight_num': self.flight_num,
+                'departure_time': self.departure_time,
+                'arrival_time': self.arrival_time,
+                'start_date': self.start_date,
+                'end_date': self.end_date,
+                'cost': cost,
+                'duration': duration,
+            }, fields),
+            **serialize_flight_airports(self.departure_airport, self.arrival_airport, airports, fields),
+        }
+
+
+def flight_view_select(fields=None):
+    """
+    Build the Core `select` producing `FlightView` rows: the flight columns plus both airport IDs.
+    Airports are resolved from the airport registry, so no join is needed.
+    Callers add their own filters, ordering and limits.
+
+    Args:
+        fields (set, optional): Only read the columns these fields are built from (see
+            `FLIGHT_FIELD_COLUMNS`); the others are selected as NULL so rows keep their shape.
+    """
+    flights = Flight.__table__
+    if fields is None:
+        return select(*(flights.c[name] for name in VIEW_COLUMNS))
+    needed = {column for field in fields for column in FLIGHT_FIELD_COLUMNS[field]}
+    return select(*(flights.c[name] if name == 'id' or name in needed else null().label(name)
+                    for name in VIEW_COLUMNS))
@@ -1,7 +1,10 @@
 from flask import jsonify, current_app
-from datetime import datetime, timedelta
-from models import Flight, Airport, SearchHistory, db
+from datetime import date, datetime, timedelta
+from models import Flight, SearchHistory, db, wants_field
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from utils.flights.pricing import price_flights
+from utils.flights.flight_view import FlightView, flight_view_select
+from utils.flights.airports import get_airport_registry, resolve_airport_ids
 
 
 def get_flight_by_id(flight_id):
@@ -39,52 +42,76 @@ def save_searched_flight(user_id, flight_id):
 
     except IntegrityError as e:
         db.session.rollback()
-        current_app.logging.error(
-            f"IntegrityError while saving search history for user {user_id} and flight {flight_id}: {e}")
+        current_app.logger.error(
+            "IntegrityError while saving search history for user %s and flight %s: %s", user_id, flight_id, e)
         return jsonify({"error": "An integrity error occurred while saving search history."}), 500
     except SQLAlchemyError as e:
         db.session.rollback()
-        current_app.logging.error(
-            f"SQLAlchemyError while saving search history for user {user_id} and flight {flight_id}: {e}")
+        current_app.logger.error(
+            "SQLAlchemyError while saving search history for user %s and flight %s: %s", user_id, flight_id, e)
         return jsonify({"error": "A database error occurred while saving search history."}), 500
     except Exception as e:
-        current_app.logging.error(
-            f"Unexpected error while saving search history for user {user_id} and flight {flight_id}: {e}")
+        current_app.logger.error(
+            "Unexpected error while saving search history for user %s and flight %s: %s", user_id, flight_id, e)
         return jsonify({"error": "An unexpected error occurred while saving search history."}), 500
 
 
-def get_close_flights(destination_airport=None, departure_airport=None, departure_date=None):
-    # Initial search for exact departure date
+# Days either side of the requested date searched when no flight leaves on the date itself
+CLOSE_DATE_RANGE_DAYS = 3
 
-    if departure_date:
 
-        departure_date = datetime.strptime(str(departure_date)[:10], '%Y-%m-%d')
+def close_date_windows(departure_date):
+    """
+    Get the date ranges searched for flights close to a date: the date itself, then the fallback
+    window of `CLOSE_DATE_RANGE_DAYS` either side of it.
 
-    flights = get_all_flights(destination_airport, departure_airport, departure_date, departure_date)
+    Args:
+        departure_date (date | str | None): The requested date (see `SearchParams`); without one, every
+            date is searched.
 
-    if flights:
-        return flights, None, None
+    Returns:
+        tuple: `((start, end), (start, end) or None)`, the exact range and the fallback window.
+
+    Raises:
+        ValueError: If a date string isn't in the YYYY-MM-DD format.
+    """
+    if not departure_date:
+        return (None, None), None
+    if isinstance(departure_date, str):
+        day = datetime.strptime(departure_date[:10], '%Y-%m-%d').date()
     else:
-        # Set the range for "close" dates (e.g., ±3 days)
-        date_range_days = 3
+        day = _as_date(departure_date)
+    window = timedelta(days=CLOSE_DATE_RANGE_DAYS)
+    return (day, day), (day - window, day + window)
+
+
+def get_close_flights(destination_airport=None, departure_airport=None, departure_date=None, fields=None):
+    """
+    Search flights on a date or, if there are none, within a few days of it.
 
-        # Parse the departure date and calculate the date range
-        try:
-            departure_date_obj = datetime.strptime(str(departure_date)[:10], '%Y-%m-%d')
-            start_date = departure_date_obj - timedelta(days=date_range_days)
-            end_date = departure_date_obj + timedelta(days=date_range_days)
-        except ValueError:
-            return None, jsonify({"message": "Invalid date format. Use YYYY-MM-DD."}), 400
+    `fields` limits the columns loaded (see `get_all_flights`). See utils/flights/search.py to search
+    several legs at once.
 
+    Returns:
+        tuple: `(flights, None, None)`, or `(None, error response, status code)` if nothing was found.
+    """
+    try:
+        exact, window = close_date_windows(departure_date)
+    except ValueError:
+        return None, jsonify({"message": "Invalid date format. Use YYYY-MM-DD."}), 400
+
+    # Initial search for exact departure date
+    flights = get_all_flights(destination_airport, departure_airport, *exact, fields=fields)
+    if not flights and window:
         # Search for flights within the date range
-        flights = get_all_flights(destination_airport, departure_airport, start_date, end_date)
+        flights = get_all_flights(destination_airport, departure_airport, *window, fields=fields)
 
-        if flights:
-            return flights, None, None
-        return None, jsonify({"message": "No flights found close to the specified date."}), 404
+    if flights:
+        return flights, None, None
+    return None, jsonify({"message": "No flights found close to the specified date."}), 404
 
 
-def get_all_flights(to=None, from_airport=None, start_date=None, end_date=None, page=1, per_page=20):
+def get_all_flights(to=None, from_airport=None, start_date=None, end_date=None, page=1, per_page=20, fields=None):
     """
     Get a list of flights with optional filters.
     Filters are:
@@ -92,38 +119,98 @@ def get_all_flights(to=None, from_airport=None, start_date=None, end_date=None,
     - from_airport: departure airport code (optional)
     - start_date: start date for the flight (these are for searching flights within a range)
     - end_date: end date for the flight (these are for searching flights within a range)
+    - fields: only load the columns needed for these serialized fields (optional, see `FLIGHT_FIELDS`)
 
-    Returns a filtered list of flights based on the provided parameters.
+    Returns a filtered list of read-only `FlightView` snapshots, loaded with a single Core query
+    instead of materializing ORM objects. Airport codes are resolved to IDs through the airport
+    registry, so the filters hit the (departure, arrival, date) index without joining airports.
     """
-    query = Flight.query
+    flights = Flight.__table__
+    query = flight_view_select(fields)
 
     # Filter by 'to' (arrival airport)
-    if to:
-        if to != "ANY":
-            arrival_airport = Airport.query.filter(Airport.code == to).first()
-            if not arrival_airport:
-                return []  # Return empty if no arrival airport found
-            query = query.filter(Flight.arrival_airport_id == arrival_airport.id)
+    if to and to != "ANY":
+        airport_ids = resolve_airport_ids(to)
+        if not airport_ids:
+            return []  # Unknown airport: no flights can match
+        query = query.where(flights.c.arrival_airport_id.in_(airport_ids))
 
     # Filter by 'from_airport' (departure airport)
-    if from_airport:
-        if from_airport != "ANY":
-            departure_airport = Airport.query.filter(Airport.code == from_airport).first()
-            if not departure_airport:
-                return []  # Return empty if no departure airport found
-            query = query.filter(Flight.departure_airport_id == departure_airport.id)
-
-    # Filter by 'start_date' and 'end_date'
+    if from_airport and from_airport != "ANY":
+        airport_ids = resolve_airport_ids(from_airport)
+        if not airport_ids:
+            return []
+        query = query.where(flights.c.departure_airport_id.in_(airport_ids))
+
+    # Filter by 'start_date' and 'end_date'. Dates are stored without a time part, so compare dates only.
     if start_date:
-        query = query.filter(Flight.start_date >= start_date)
+        query = query.where(flights.c.start_date >= _as_date(start_date))
     if end_date:
-        query = query.filter(Flight.start_date <= end_date)
+        query = query.where(flights.c.start_date <= _as_date(end_date))
 
-    # Execute the query and return the result
-    paginated_flights = query.paginate(page=page, per_page=per_page, error_out=False)
-    return paginated_flights
+    # Execute the query for the requested page and return the result
+    query = query.order_by(flights.c.start_date, flights.c.id).limit(per_page).offset((page - 1) * per_page)
+    airports = get_airport_registry().by_id
+    return [FlightView.from_row(row, airports) for row in db.session.execute(query)]
+
+
+def _as_date(value):
+    """
+    Drop the time part of a datetime so it compares correctly against a `Date` column.
+    """
+    return value.date() if isinstance(value, datetime) else value
+
+
+def serialize_flights(flights, airports=None, fields=None):
+    """
+    Convert a list of flights (ORM objects or `FlightView` snapshots) to dictionaries, pricing them
+    all in a single batch instead of calling `cost()` and `duration()` for each one.
+
+    Args:
+        flights (iterable): The flights to serialize.
+        airports (dict, optional): Compact format: flights reference their airports by ID and the
+            airports are collected in this map (shared across calls for one response).
+        fields (set, optional): Only include these fields; flights are not priced unless cost or duration is requested.
+    """
+    flights = list(flights)
+    if wants_field(fields, 'cost', 'duration'):
+        pricings = price_flights(flights)
+    else:
+        pricings = [(None, None)] * len(flights)
+    return [flight.to_dict(pricing=pricing, airports=airports, fields=fields)
+            for flight, pricing in zip(flights, pricings)]
 
 
 def get_recent_searches(user_id):
+    """
+    Get the user's 5 most recent searches, read newest first from the (user_id, searched_at) index.
+    """
     searches = SearchHistory.query.filter_by(user_id=user_id).order_by(SearchHistory.searched_at.desc()).limit(5).all()
     return searches
+
+
+def record_search(user_id, departure_city=None, arrival_city=None, departure_date=None, return_date=None,
+                  trip_type=None, guests=None, searched_at=None):
+    """
+    Save a flight search to the search history.
+
+    Runs as the `record_search` background job, so dates arrive as the ISO strings written by
+    `SearchParams.to_history`.
+    """
+    search = SearchHistory(
+        user_id=user_id,
+        departure_city=departure_city,
+        arrival_city=arrival_city,
+        departure_date=date.fromisoformat(departure_date) if departure_date else None,
+        return_date=date.fromisoformat(return_date) if return_date else None,
+        trip_type=trip_type,
+        guests=int(guests or 1),
+        searched_at=datetime.fromisoformat(searched_at) if searched_at else datetime.utcnow()
+    )
+    try:
+        db.session.add(search)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+    return search
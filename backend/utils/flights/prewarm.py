@@ -0,0 +1,127 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import DepartureDemand, SearchHistory, db
+from utils.flights.airports import get_airport_registry
+from utils.flights.flights import get_close_flights, serialize_flights
+
+# Most popular searches replayed when a worker starts
+DEFAULT_SEARCHES = 50
+
+# Seconds a worker spends prewarming at most
+DEFAULT_BUDGET_SECONDS = 5.0
+
+# Days of raw search history read when no rollups exist yet (e.g. before the first rollup ran)
+HISTORY_DAYS = 7
+
+
+def get_popular_searches(limit=DEFAULT_SEARCHES, today=None):
+    """
+    Get the most searched `(departure_city, arrival_city, departure_date)` tuples for upcoming travel dates.
+
+    They are read from the `departure_demand` rollup (see utils/analytics/rollups.py), or from the last
+    `HISTORY_DAYS` of search history until the rollup has run.
+
+    Args:
+        limit (int): Number of tuples to return.
+        today (date, optional): Only travel dates from this day on.
+
+    Returns:
+        list of tuple: `(departure code, arrival code, departure date)`, most searched first.
+    """
+    today = today or datetime.utcnow().date()
+    rows = (
+        db.session.query(DepartureDemand.departure_city, DepartureDemand.arrival_city, DepartureDemand.departure_date)
+        .filter(DepartureDemand.departure_date >= today)
+        .order_by(DepartureDemand.searches.desc(), DepartureDemand.departure_date)
+        .limit(limit)
+        .all()
+    )
+    if rows:
+        return [tuple(row) for row in rows]
+
+    searches = func.count(SearchHistory.id)
+    rows = (
+        db.session.query(SearchHistory.departure_city, SearchHistory.arrival_city, SearchHistory.departure_date)
+        .filter(SearchHistory.searched_at >= datetime.utcnow() - timedelta(days=HISTORY_DAYS),
+                SearchHistory.departure_date >= today)
+        .group_by(SearchHistory.departure_city, SearchHistory.arrival_city, SearchHistory.departure_date)
+        .order_by(searches.desc())
+        .limit(limit)
+        .all()
+    )
+    return [tuple(row) for row in rows]
+
+
+def prewarm_searches(limit=None, budget_seconds=None):
+    """
+    Run the most popular searches once, so the first real ones find warm caches.
+
+    Loads the airport registry, then searches each popular route and date the way `/search_flights`
+    does, which reads their flights and index pages into the database caches, compiles the search
+    statements and fills the pricing cache. Stops once `budget_seconds` have passed.
+
+    Args:
+        limit (int, optional): Number of searches (default: `PREWARM_SEARCHES`).
+        budget_seconds (float, optional): Time budget (default: `PREWARM_BUDGET_SECONDS`).
+
+    Returns:
+        int: The number of searches run.
+    """
+    config = current_app.config
+    limit = config.get('PREWARM_SEARCHES', DEFAULT_SEARCHES) if limit is None else limit
+    budget_seconds = config.get('PREWARM_BUDGET_SECONDS', DEFAULT_BUDGET_SECONDS) if budget_seconds is None \
+        else budget_seconds
+    started = time.monotonic()
+    deadline = started + budget_seconds
+
+    get_airport_registry()
+    searches = get_popular_searches(limit)
+    done = 0
+    for departure_city, arrival_city, departure_date in searches:
+        if time.monotonic() >= deadline:
+            break
+        flights, _, _ = get_close_flights(arrival_city, departure_city, departure_date)
+        if flights:
+            serialize_flights(flights)
+        done += 1
+
+    current_app.logger.info("Prewarmed %d of %d popular searches in %.0f ms", done, len(searches),
+                            (time.monotonic() - started) * 1000)
+    return done
+
+
+def _prewarm_in_app_context(flask_app):
+    """
+    Prewarm on a background thread; a failure is logged, never raised.
+    """
+    with flask_app.app_context():
+        try:
+            prewarm_searches()
+        except SQLAlchemyError as e:
+            flask_app.logger.warning("Skipping prewarm, the database is not ready: %s", e)
+            db.session.rollback()
+        except Exception:
+            flask_app.logger.exception("Prewarm failed")
+
+
+def start_prewarm(flask_app):
+    """
+    Prewarm a worker in the background: it serves requests meanwhile, so readiness isn't delayed.
+
+    Args:
+        flask_app (Flask): The application.
+
+    Returns:
+        threading.Thread: The prewarm thread, or None if `PREWARM_SEARCHES` is 0.
+    """
+    if not flask_app.config.get('PREWARM_SEARCHES', DEFAULT_SEARCHES):
+        return None
+    thread = threading.Thread(target=_prewarm_in_app_context, args=(flask_app,), name='prewarm', daemon=True)
+    thread.start()
+    return thread
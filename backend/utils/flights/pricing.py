@@ -0,0 +1,246 @@
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+# Fare charged per hour of flight time
+COST_PER_HOUR = 47
+
+# Duration (in hours) used to price a flight whose times cannot be parsed
+FALLBACK_DURATION_HOURS = 12
+
+# Seeded flights store a 12-hour clock time, older synthetic flights a full timestamp
+CLOCK_FORMAT = '%I:%M %p'
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Kinds of parsed time values
+INVALID, CLOCK, TIMESTAMP = 0, 1, 2
+
+
+@lru_cache(maxsize=4096)
+def parse_time(value):
+    """
+    Parse a stored departure/arrival time into minutes.
+
+    Clock times (e.g. '06:45 PM') are returned as minutes since midnight and are combined
+    with the flight's start/end dates. Full timestamps are returned as absolute minutes and
+    already carry their own date.
+
+    Args:
+        value (str): The time value as stored on the flight.
+
+    Returns:
+        tuple: (kind, minutes) where kind is one of CLOCK, TIMESTAMP or INVALID.
+    """
+    text = str(value).strip()
+
+    # Fast path for the canonical 'HH:MM AM' shape, which every seeded flight uses
+    if len(text) == 8 and text.isascii() and text[2] == ':' and text[5] == ' ' and text[:2].isdigit() \
+            and text[3:5].isdigit():
+        hour, minute, suffix = int(text[:2]), int(text[3:5]), text[6:].upper()
+        if 1 <= hour <= 12 and minute <= 59 and suffix in ('AM', 'PM'):
+            return CLOCK, (hour % 12 + (12 if suffix == 'PM' else 0)) * 60 + minute
+
+    try:
+        clock = datetime.strptime(text, CLOCK_FORMAT)
+        return CLOCK, clock.hour * 60 + clock.minute
+    except ValueError:
+        pass
+    try:
+        stamp = datetime.strptime(text[:19], TIMESTAMP_FORMAT)
+        return TIMESTAMP, stamp.toordinal() * 1440 + stamp.hour * 60 + stamp.minute
+    except ValueError:
+        return INVALID, 0
+
+
+def minutes_to_hours(minutes):
+    """
+    Round a duration in whole minutes to hours with one decimal place.
+
+    Uses Python's `round` on the float number of hours, as fares always have been: durations
+    such as 9 minutes (0.15 h, stored just below) round down, not half up.
+    """
+    return round(minutes / 60, 1)
+
+
+def _minutes_to_hours_column(minutes):
+    """
+    Apply `minutes_to_hours` to an integer array, with the same results.
+
+    Durations are rounded in integer tenths of an hour, half up. Only minutes that are exactly
+    halfway between two tenths (minutes % 6 == 3) can round differently: `round` compares the float
+    `minutes / 60` with the midpoint, so it follows the way that division was rounded. For those,
+    the sign of `float(minutes / 60) * 20 - minutes / 3` is computed exactly (an error-free sum,
+    then a subtraction exact by Sterbenz' lemma), and an exact tie rounds half to even.
+    """
+    minutes = np.asarray(minutes, dtype=np.int64)
+    tenths = (minutes + 3) // 6
+    tie = minutes % 6 == 3
+    if tie.any():
+        hours = minutes[tie] / 60
+        # hours * 20 as the unevaluated sum `total + error`, without rounding (TwoSum of 16x and 4x)
+        high, low = hours * 16, hours * 4
+        total = high + low
+        low_part = total - high
+        error = (high - (total - low_part)) + (low - low_part)
+        sign = np.sign((total - (minutes[tie] // 3)) + error)
+        below = (minutes[tie] - 3) // 6
+        tenths[tie] = np.where(sign > 0, below + 1, np.where(sign < 0, below, below + below % 2))
+    return tenths / 10
+
+
+def flight_duration(start_date, departure_time, end_date, arrival_time):
+    """
+    Compute the duration of a single flight in hours.
+
+    Args:
+        start_date (date): Date the flight departs.
+        departure_time (str): Departure time as stored on the flight.
+        end_date (date): Date the flight arrives.
+        arrival_time (str): Arrival time as stored on the flight.
+
+    Returns:
+        float or None: Duration in hours rounded to one decimal, or None if the times cannot be parsed.
+    """
+    departure_kind, departure_minutes = parse_time(departure_time)
+    arrival_kind, arrival_minutes = parse_time(arrival_time)
+
+    if departure_kind == arrival_kind == CLOCK:
+        if start_date is None or end_date is None:
+            return None
+        day_minutes = (end_date - start_date).days * 1440
+        return minutes_to_hours(day_minutes + arrival_minutes - departure_minutes)
+    if departure_kind == arrival_kind == TIMESTAMP:
+        return minutes_to_hours(arrival_minutes - departure_minutes)
+    return None
+
+
+def flight_cost(duration):
+    """
+    Price a flight from its duration.
+
+    Args:
+        duration (float or None): Duration in hours as returned by `flight_duration`.
+
+    Returns:
+        str: The fare formatted with a dollar sign (e.g. '$94.00').
+    """
+    if duration is None:
+        duration = FALLBACK_DURATION_HOURS
+    return format_cost(duration * COST_PER_HOUR)
+
+
+def format_cost(cost):
+    """
+    Format a numeric fare the way it is returned by the API.
+    """
+    return f'${cost:.2f}'
+
+
+def _parse_time_column(values):
+    """
+    Parse a column of time strings into `(kinds, minutes)` arrays.
+
+    Values in the canonical 'HH:MM AM' shape, which every seeded flight uses, are parsed together
+    from their code points; the others go through `parse_time`, once per distinct value.
+    """
+    text = np.array(values, dtype=str)
+    if text.dtype.itemsize < 8 * 4:
+        text = text.astype('U8')
+    lengths = np.char.str_len(text)
+    chars = text.view(np.uint32).reshape(len(text), -1)[:, :8].astype(np.int64)
+    digits = chars - ord('0')
+
+    hour = digits[:, 0] * 10 + digits[:, 1]
+    minute = digits[:, 3] * 10 + digits[:, 4]
+    suffix = chars[:, 6] | 0x20  # Lower case
+    canonical = (
+        (lengths == 8) & (chars[:, 2] == ord(':')) & (chars[:, 5] == ord(' '))
+        & ((digits[:, [0, 1, 3, 4]] >= 0) & (digits[:, [0, 1, 3, 4]] <= 9)).all(axis=1)
+        & ((suffix == ord('a')) | (suffix == ord('p'))) & ((chars[:, 7] | 0x20) == ord('m'))
+        & (hour >= 1) & (hour <= 12) & (minute <= 59)
+    )
+    kinds = np.where(canonical, CLOCK, INVALID)
+    minutes = np.where(canonical, (hour % 12 + np.where(suffix == ord('p'), 12, 0)) * 60 + minute, 0)
+
+    others = np.flatnonzero(~canonical)
+    if len(others):
+        parsed = {}
+        for index in others.tolist():
+            value = values[index]
+            if value not in parsed:
+                parsed[value] = parse_time(value)
+            kinds[index], minutes[index] = parsed[value]
+    return kinds, minutes
+
+
+def _date_column(values):
+    """
+    Convert a column of dates into day numbers, with a mask of the missing entries (day -1).
+
+    NumPy converts `date` objects to datetime64 element by element, which is much slower than
+    reading their ordinals in one pass.
+    """
+    days = np.fromiter((value.toordinal() if value is not None else -1 for value in values), dtype=np.int64,
+                       count=len(values))
+    return days, days < 0
+
+
+def price_columns(departure_times, arrival_times, start_dates, end_dates):
+    """
+    Compute durations and fares for a column-oriented set of flights in one pass.
+
+    Applies exactly the same rules as `flight_duration` and `flight_cost`, but parses every
+    distinct time string only once and does the date arithmetic with NumPy.
+
+    Args:
+        departure_times (sequence of str): Departure times as stored on the flights.
+        arrival_times (sequence of str): Arrival times as stored on the flights.
+        start_dates (sequence of date): Departure dates.
+        end_dates (sequence of date): Arrival dates.
+
+    Returns:
+        tuple: (durations, costs) as float arrays. Durations are NaN where the times cannot be
+        parsed; the matching costs use the fallback duration.
+    """
+    if len(departure_times) == 0:
+        return np.empty(0), np.empty(0)
+
+    departure_kind, departure_minutes = _parse_time_column(departure_times)
+    arrival_kind, arrival_minutes = _parse_time_column(arrival_times)
+    start_days, start_missing = _date_column(start_dates)
+    end_days, end_missing = _date_column(end_dates)
+
+    clock = (departure_kind == CLOCK) & (arrival_kind == CLOCK) & ~start_missing & ~end_missing
+    timestamp = (departure_kind == TIMESTAMP) & (arrival_kind == TIMESTAMP)
+
+    # Clock times only carry the time of day, so add the days between start and end date
+    minutes = arrival_minutes - departure_minutes
+    minutes = np.where(clock, minutes + (end_days - start_days) * 1440, minutes)
+
+    durations = np.where(clock | timestamp, _minutes_to_hours_column(minutes), np.nan)
+    costs = np.where(np.isnan(durations), FALLBACK_DURATION_HOURS, durations) * COST_PER_HOUR
+    return durations, costs
+
+
+def price_flights(flights):
+    """
+    Compute `(duration, cost)` pairs for a list of flights in one pass.
+
+    Args:
+        flights (list): Objects exposing `departure_time`, `arrival_time`, `start_date` and `end_date`.
+
+    Returns:
+        list of tuple: One `(duration, cost)` pair per flight, matching `Flight.duration()`
+        and `Flight.cost()`.
+    """
+    durations, costs = price_columns(
+        [flight.departure_time for flight in flights],
+        [flight.arrival_time for flight in flights],
+        [flight.start_date for flight in flights],
+        [flight.end_date for flight in flights],
+    )
+    return [
+        (None if np.isnan(duration) else duration, format_cost(cost))
+        for duration, cost in zip(durations.tolist(), costs.tolist())
+    ]
@@ -0,0 +1,115 @@
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert, or_, update
+
+from models import Flight, Route, db
+from utils.cache.versions import bump_data_version
+
+# Number of days ahead of today that searchable flights are kept materialized
+DEFAULT_HORIZON_DAYS = 60
+
+# Number of routes expanded and committed together
+DEFAULT_CHUNK_SIZE = 200
+
+
+def materialize_schedules(through_date=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Expand recurring routes into one dated flight per operating day.
+
+    Routes are processed in chunks ordered by ID. Each chunk's flights are bulk inserted and the
+    routes' `materialized_through` watermarks are advanced in the same transaction, so the job is
+    incremental (a route is only expanded past its watermark) and resumable (an interrupted run
+    loses at most the chunk in progress). Memory is bounded by one chunk of rows.
+
+    Args:
+        through_date (date, optional): Last day to materialize. Defaults to `SCHEDULE_HORIZON_DAYS`
+            (or `DEFAULT_HORIZON_DAYS`) from today.
+        chunk_size (int): Number of routes expanded per transaction.
+
+    Returns:
+        int: The number of flights created.
+    """
+    if through_date is None:
+        horizon = current_app.config.get('SCHEDULE_HORIZON_DAYS', DEFAULT_HORIZON_DAYS)
+        through_date = datetime.utcnow().date() + timedelta(days=horizon)
+
+    created = 0
+    last_route_id = ''
+    while True:
+        routes = (
+            Route.query
+            .filter(Route.id > last_route_id)
+            .filter(Route.valid_from <= through_date)
+            .filter(or_(Route.materialized_through.is_(None),
+                        (Route.materialized_through < through_date) & (Route.materialized_through < Route.valid_to)))
+            .order_by(Route.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not routes:
+            break
+
+        rows, watermarks = [], []
+        for route in routes:
+            route_rows, materialized_through = expand_route(route, through_date)
+            rows.extend(route_rows)
+            watermarks.append({'id': route.id, 'materialized_through': materialized_through,
+                               'updated_at': datetime.utcnow()})
+
+        try:
+            if rows:
+                db.session.execute(insert(Flight), rows)
+                bump_data_version('flights')  # Bulk inserts bypass the flush-time tracking
+            db.session.execute(update(Route), watermarks)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        created += len(rows)
+        last_route_id = routes[-1].id
+        db.session.expunge_all()  # Keep the identity map from growing across chunks
+        current_app.logger.info("Materialized %s flights for %s routes (through %s)", len(rows), len(routes), through_date)
+
+    return created
+
+
+def expand_route(route, through_date):
+    """
+    Build the flight rows for a route between its watermark and `through_date`.
+
+    Args:
+        route (Route): The route to expand.
+        through_date (date): Last day to materialize.
+
+    Returns:
+        tuple: (rows, materialized_through) where rows are dictionaries ready for a bulk insert.
+    """
+    first_day = route.valid_from
+    if route.materialized_through is not None:
+        first_day = max(first_day, route.materialized_through + timedelta(days=1))
+    last_day = min(route.valid_to, through_date)
+
+    now = datetime.utcnow()
+    rows = []
+    day = first_day
+    while day <= last_day:
+        if route.operates_on(day):
+            rows.append({
+                'id': str(uuid.uuid4()),
+                'flight_num': f"{route.route_num}-{day:%Y%m%d}",
+                'route_id': route.id,
+                'departure_airport_id': route.departure_airport_id,
+                'arrival_airport_id': route.arrival_airport_id,
+                'departure_time': route.departure_time,
+                'arrival_time': route.arrival_time,
+                'start_date': day,
+                'end_date': day + timedelta(days=route.arrival_day_offset),
+                'created_at': now,
+                'updated_at': now,
+            })
+        day += timedelta(days=1)
+
+    return rows, max(last_day, route.materialized_through or last_day)
@@ -0,0 +1,186 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import NamedTuple, Optional
+
+from flask import current_app
+
+from utils.flights.flights import get_close_flights
+from utils.metrics.metrics import counting_sql, current_sql_counter
+
+# Most guests a single search can be for
+MAX_GUESTS = 9
+
+# Longest airport code or trip type accepted, matching the search_history columns
+MAX_CITY_LENGTH = 100
+MAX_TRIP_TYPE_LENGTH = 20
+
+
+class SearchParams(NamedTuple):
+    """
+    The parameters of a flight search, validated and parsed once from the query string.
+
+    Dates are `date` objects and guests an int from here on, so the search, the search history
+    and the analytics never parse them again.
+    """
+    departure_city: Optional[str]
+    arrival_city: Optional[str]
+    departure_date: Optional[date]
+    return_date: Optional[date]
+    trip_type: Optional[str]
+    guests: int
+    recent: bool
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Parse the search parameters of a request.
+
+        Args:
+            args (MultiDict): The query string: `from`, `to`, `depart`, `return` (YYYY-MM-DD),
+                `type` ('Roundtrip' searches the return leg too), `guests` and `recent`.
+
+        Returns:
+            SearchParams: The parsed parameters.
+
+        Raises:
+            ValueError: If a parameter is malformed, with a message for the client.
+        """
+        def text(name, max_length):
+            value = (args.get(name) or '').strip()
+            if len(value) > max_length:
+                raise ValueError(f"'{name}' must be at most {max_length} characters")
+            return value or None
+
+        def parse_date(name):
+            value = (args.get(name) or '').strip()
+            if not value:
+                return None
+            try:
+                # Only the date part counts, so full timestamps from date pickers are accepted too
+                return datetime.strptime(value[:10], '%Y-%m-%d').date()
+            except ValueError:
+                raise ValueError(f"Invalid '{name}' date, use YYYY-MM-DD") from None
+
+        guests = (args.get('guests') or '').strip()
+        if guests:
+            # isdigit() also accepts digits like '²', which int() rejects
+            if not (guests.isascii() and guests.isdecimal()) or not 1 <= int(guests) <= MAX_GUESTS:
+                raise ValueError(f"'guests' must be a number from 1 to {MAX_GUESTS}")
+            guests = int(guests)
+
+        params = cls(
+            departure_city=text('from', MAX_CITY_LENGTH),
+            arrival_city=text('to', MAX_CITY_LENGTH),
+            departure_date=parse_date('depart'),
+            return_date=parse_date('return'),
+            trip_type=text('type', MAX_TRIP_TYPE_LENGTH),
+            guests=guests or 1,
+            recent=bool(args.get('recent')),
+        )
+        if params.roundtrip and params.departure_date and params.return_date \
+                and params.return_date < params.departure_date:
+            raise ValueError("'return' must not be before 'depart'")
+        return params
+
+    @property
+    def roundtrip(self):
+        """
+        Whether the return leg is searched too.
+        """
+        return self.trip_type == 'Roundtrip'
+
+    def legs(self):
+        """
+        Get the legs to search, as `(destination, departure, date)` for `get_close_flights`: the
+        outgoing leg, plus the returning leg for round trips.
+        """
+        legs = [(self.arrival_city, self.departure_city, self.departure_date)]
+        if self.roundtrip:
+            legs.append((self.departure_city, self.arrival_city, self.return_date))
+        return legs
+
+    def to_history(self, user_id, searched_at):
+        """
+        Build the payload of the `record_search` job, which saves the search to the history.
+        Dates are sent as ISO strings (job payloads are JSON).
+        """
+        return {
+            'user_id': user_id,
+            'departure_city': self.departure_city,
+            'arrival_city': self.arrival_city,
+            'departure_date': self.departure_date.isoformat() if self.departure_date else None,
+            'return_date': self.return_date.isoformat() if self.return_date else None,
+            'trip_type': self.trip_type,
+            'guests': self.guests,
+            'searched_at': searched_at.isoformat(),
+        }
+
+# Thread pool shared by the searches of this process, created on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_search_executor():
+    """
+    Get the thread pool that runs search queries concurrently, or None if `SEARCH_CONCURRENCY`
+    is below 2 (searches then run one query at a time).
+    """
+    global _executor
+    size = current_app.config.get('SEARCH_CONCURRENCY', 0)
+    if size < 2:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='search')
+        return _executor
+
+
+def _reset_after_fork():
+    """
+    Drop the parent's pool in a forked child (its threads don't survive fork); the next search starts a new one.
+    """
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _close_flights_in_app_context(flask_app, sql_counter, leg, fields):
+    """
+    Search one leg on a pool thread, in its own app context and therefore with its own session.
+    Its queries are counted toward the request's SQL metrics through `sql_counter`.
+    """
+    with flask_app.app_context(), counting_sql(sql_counter):
+        return get_close_flights(*leg, fields=fields)
+
+
+def get_close_flights_concurrently(legs, fields=None):
+    """
+    Run `get_close_flights` for several legs (e.g. the outbound and return legs of a round trip) at once.
+
+    Each leg runs on a pool thread, its exact-date query followed if needed by its fallback window,
+    so the search takes about as long as its slowest leg instead of the sum of all of them. SQLite
+    releases the GIL while it runs a query, so the legs overlap on multi-core machines.
+
+    Args:
+        legs (list of tuple): `(destination_airport, departure_airport, departure_date)` for each leg.
+        fields (set, optional): Only load the columns behind these flight fields.
+
+    Returns:
+        list of tuple: `(flights, error response, status code)` for each leg, as from `get_close_flights`.
+    """
+    executor = get_search_executor()
+    if executor is None or len(legs) < 2:
+        return [get_close_flights(*leg, fields=fields) for leg in legs]
+
+    flask_app = current_app._get_current_object()
+    sql_counter = current_sql_counter()
+    futures = [executor.submit(_close_flights_in_app_context, flask_app, sql_counter, leg, fields)
+               for leg in legs[1:]]
+    # The first leg runs on this thread, which would otherwise just wait
+    first = get_close_flights(*legs[0], fields=fields)
+    return [first] + [future.result() for future in futures]
@@ -0,0 +1,214 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response, abort, request, send_file
+
+try:
+    import brotli  # Optional: enables .br variants (pip install brotli)
+except ImportError:
+    brotli = None
+
+# Angular build output names bundles like 'main-4AC2B7YQ.js'; the hash changes whenever the content does
+FINGERPRINT_PATTERN = re.compile(r'[-.](?=[A-Za-z]*\d)[A-Za-z0-9]{8,20}\.[A-Za-z0-9]+$')
+
+# Suffixes of the precompressed variants, in order of preference, keyed by content coding
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Text formats worth compressing; images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = {'.js', '.mjs', '.css', '.html', '.json', '.map', '.svg', '.txt', '.xml', '.ico',
+                           '.webmanifest'}
+
+# Files smaller than this are sent as they are
+MIN_COMPRESS_SIZE = 1024
+
+# Cache policies: fingerprinted files never change, everything else is revalidated with its ETag
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class Asset:
+    """
+    A file of the frontend build, with its precompressed variants.
+    """
+    __slots__ = ('path', 'mimetype', 'etag', 'immutable', 'variants')
+
+    def __init__(self, path, mimetype, etag, immutable, variants):
+        self.path = path
+        self.mimetype = mimetype
+        self.etag = etag
+        self.immutable = immutable
+        self.variants = variants  # {content coding: path of the precompressed file}
+
+
+class StaticAssets:
+    """
+    Serve the Angular build from an in-memory manifest.
+
+    The build directory is scanned once: every file is listed with its precompressed `.br`/`.gz`
+    variants, so a request for an unknown path never touches the filesystem. Fingerprinted bundles
+    are cached by browsers for a year; other files (and the index page, which is kept in memory)
+    are revalidated with their ETag.
+    """
+
+    def __init__(self, root, index='index.csr.html', auto_reload=False):
+        self.root = root
+        self.index = index
+        self.auto_reload = auto_reload  # Rescan on every request, for development builds
+        self.scan()
+
+    def scan(self):
+        """
+        Build the manifest of the build directory and load the index page.
+        """
+        manifest = {}
+        if os.path.isdir(self.root):
+            for directory, _, filenames in os.walk(self.root):
+                names = set(filenames)
+                for filename in filenames:
+                    if filename.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+                        continue
+                    path = os.path.join(directory, filename)
+                    stat = os.stat(path)
+                    variants = {coding: os.path.join(directory, filename + suffix)
+                                for coding, suffix in ENCODINGS if filename + suffix in names}
+                    relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+                    manifest[relative] = Asset(
+                        path,
+                        mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                        f'{stat.st_mtime_ns:x}-{stat.st_size:x}',
+                        bool(FINGERPRINT_PATTERN.search(filename)),
+                        variants,
+                    )
+        self.manifest = manifest
+
+        # The index page is small and requested on every visit: keep it, and its compressed forms, in memory
+        self.index_body = None
+        self.index_etag = None
+        self.index_variants = {}
+        if self.index in manifest:
+            with open(manifest[self.index].path, 'rb') as f:
+                self.index_body = f.read()
+            self.index_etag = hashlib.sha256(self.index_body).hexdigest()[:32]
+            self.index_variants['gzip'] = gzip.compress(self.index_body, 9, mtime=0)
+            if brotli is not None:
+                self.index_variants['br'] = brotli.compress(self.index_body)
+
+    def serve(self, path):
+        """
+        Serve a file of the build, or the index page for client-side routes.
+
+        Args:
+            path (str): The requested path, relative to the build directory.
+
+        Returns:
+            Response: The file, a 304 if the client's copy is current, or a 404.
+        """
+        if self.auto_reload:
+            self.scan()
+        asset = self.manifest.get(path)
+        if asset is None or path == self.index:
+            # Paths without an extension are Angular routes; missing files are a 404
+            if path == self.index or '.' not in path.rsplit('/', 1)[-1]:
+                return self.serve_index()
+            abort(404)
+
+        coding = _negotiate(asset.variants)
+        response = send_file(
+            asset.variants[coding] if coding else asset.path,
+            mimetype=asset.mimetype,
+            etag=f'{asset.etag}-{coding}' if coding else asset.etag,
+            max_age=IMMUTABLE_MAX_AGE if asset.immutable else None,
+            conditional=True,
+        )
+        if asset.immutable:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        if coding:
+            response.content_encoding = coding
+        return response
+
+    def serve_index(self):
+        """
+        Serve the index page from memory, revalidated with its ETag.
+        """
+        if self.index_body is None:
+            abort(404)
+        coding = _negotiate(self.index_variants)
+        response = Response(self.index_variants[coding] if coding else self.index_body, mimetype='text/html')
+        response.set_etag(f'{self.index_etag}-{coding}' if coding else self.index_etag)
+        response.cache_control.no_cache = True
+        response.vary.add('Accept-Encoding')
+        if coding:
+            response.content_encoding = coding
+        return response.make_conditional(request)
+
+
+def _negotiate(variants):
+    """
+    Pick the preferred content coding that both the client accepts and a variant exists for.
+    """
+    if not variants:
+        return None
+    accepted = request.accept_encodings
+    for coding, _ in ENCODINGS:
+        if coding in variants and accepted[coding]:
+            return coding
+    return None
+
+
+def precompress(root, min_size=MIN_COMPRESS_SIZE):
+    """
+    Write `.gz` (and, if the brotli package is installed, `.br`) variants next to every compressible
+    file of the build. Up-to-date variants are left alone.
+
+    Args:
+        root (str): The build directory.
+        min_size (int): Files smaller than this many bytes are skipped.
+
+    Returns:
+        int: The number of variant files written.
+    """
+    written = 0
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(directory, filename)
+            stat = os.stat(path)
+            if stat.st_size < min_size:
+                continue
+            data = None
+            for coding, suffix in ENCODINGS:
+                if coding == 'br' and brotli is None:
+                    continue
+                target = path + suffix
+                if os.path.exists(target) and os.stat(target).st_mtime >= stat.st_mtime:
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                compressed = brotli.compress(data) if coding == 'br' else gzip.compress(data, 9, mtime=0)
+                if len(compressed) >= len(data):
+                    continue  # Not worth it, serve the original
+                with open(target, 'wb') as f:
+                    f.write(compressed)
+                written += 1
+    return written
+
+
+def init_static_assets(flask_app):
+    """
+    Serve the Angular build through a `StaticAssets` manifest.
+
+    The build directory is the `STATIC_ROOT` config value; in debug mode it is rescanned on
+    every request so rebuilt bundles show up without a restart.
+    """
+    assets = StaticAssets(flask_app.config['STATIC_ROOT'], auto_reload=flask_app.debug)
+    flask_app.extensions['static_assets'] = assets
+    return assets
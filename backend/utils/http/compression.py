@@ -0,0 +1,131 @@
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli  # Optional: enables Content-Encoding: br (pip install brotli)
+except ImportError:
+    brotli = None
+
+# Content codings, in order of preference
+CODINGS = ('br', 'gzip')
+
+# Media types worth compressing; images, fonts and archives are compressed already
+COMPRESSIBLE_TYPES = {'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'}
+
+# Defaults for the COMPRESS_* config values
+DEFAULT_MIN_SIZE = 500  # Bytes; smaller bodies fit in a packet anyway
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 4  # Higher qualities cost far more CPU for a few percent, fine for static files only
+
+
+def encoded_etags(etag):
+    """
+    Get every ETag a representation of `etag` may have been sent with: compressing a response
+    appends the coding to its ETag, since the bytes differ.
+    """
+    return (etag,) + tuple(f'{etag}-{coding}' for coding in CODINGS)
+
+
+def _is_compressible(response):
+    if response.status_code != 200 or response.direct_passthrough:
+        return False  # Files are served precompressed by utils/frontend/assets.py
+    if 'Content-Encoding' in response.headers or 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    return response.mimetype.startswith('text/') or response.mimetype in COMPRESSIBLE_TYPES
+
+
+def _negotiate():
+    accepted = request.accept_encodings
+    for coding in CODINGS:
+        if accepted[coding] and (coding != 'br' or brotli is not None):
+            return coding
+    return None
+
+
+class _Compressor:
+    """
+    Incremental gzip or brotli compressor with a common interface.
+    """
+
+    def __init__(self, coding, config):
+        self.coding = coding
+        if coding == 'br':
+            self._compressor = brotli.Compressor(quality=config.get('COMPRESS_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY))
+        else:
+            # wbits=31 writes a gzip header and trailer
+            self._compressor = zlib.compressobj(config.get('COMPRESS_LEVEL', DEFAULT_GZIP_LEVEL), zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.coding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self):
+        """
+        Emit everything compressed so far, so a streamed chunk reaches the client without waiting.
+        """
+        if self.coding == 'br':
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.coding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def _stream(chunks, compressor):
+    for chunk in chunks:
+        if chunk:
+            data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk) + compressor.flush()
+            if data:
+                yield data
+    yield compressor.finish()
+
+
+def compress_response(response):
+    """
+    Compress a response body with the best coding the client accepts.
+
+    Buffered bodies smaller than `COMPRESS_MIN_SIZE` or that don't shrink are sent as they are.
+    Streamed bodies are compressed chunk by chunk, flushing after each one, so they stay streamed.
+    """
+    if not _is_compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    coding = _negotiate()
+    if coding is None:
+        return response
+
+    compressor = _Compressor(coding, current_app.config)
+    if response.is_streamed:
+        response.response = _stream(response.response, compressor)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE):
+            return response
+        compressed = compressor.compress(data) + compressor.finish()
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+
+    response.content_encoding = coding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{coding}', weak)
+    return response
+
+
+def init_compression(flask_app):
+    """
+    Compress the application's responses. Disable with the `COMPRESS_ENABLED` config value.
+
+    Config values:
+        COMPRESS_MIN_SIZE: Smallest body, in bytes, worth compressing (default 500).
+        COMPRESS_LEVEL: gzip level, 1 (fastest) to 9 (smallest) (default 6).
+        COMPRESS_BROTLI_QUALITY: brotli quality, 0 to 11 (default 4); brotli is used only if installed.
+    """
+    if flask_app.config.get('COMPRESS_ENABLED', True):
+        flask_app.after_request(compress_response)
@@ -0,0 +1,41 @@
+from flask import request
+
+# Media type clients can ask for (in Accept) to get the compact format without the query flag
+COMPACT_MIMETYPE = 'application/vnd.skyway.compact+json'
+
+
+def wants_compact():
+    """
+    Check whether the client asked for the compact response format, in which related objects
+    (airports, users) are sent once in top-level maps keyed by ID and referenced by ID elsewhere.
+
+    Negotiated with `?format=compact` (or `?format=full`), or else with `Accept: application/vnd.skyway.compact+json`.
+    """
+    requested = request.args.get('format')
+    if requested:
+        return requested == 'compact'
+    return request.accept_mimetypes.best_match(['application/json', COMPACT_MIMETYPE]) == COMPACT_MIMETYPE
+
+
+def requested_fields(allowed):
+    """
+    Parse the `fields` query parameter (sparse fieldset): a comma-separated list of the fields to
+    include in each object, e.g. `?fields=reference_number,created_at`.
+
+    Args:
+        allowed (iterable of str): The fields the endpoint can serialize.
+
+    Returns:
+        frozenset or None: The requested fields, or None (every field) if the parameter is absent.
+
+    Raises:
+        ValueError: If a requested field is unknown.
+    """
+    value = request.args.get('fields')
+    if not value:
+        return None
+    fields = frozenset(name.strip() for name in value.split(',') if name.strip())
+    unknown = fields.difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}")
+    return fields
@@ -0,0 +1,277 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+
+# Registered job handlers, keyed by job name
+JOB_HANDLERS = {}
+
+# Retry policy defaults
+DEFAULT_MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    dedupe_key TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_ready ON jobs (status, run_at);
+CREATE INDEX IF NOT EXISTS ix_jobs_dedupe_key ON jobs (dedupe_key, status);
+CREATE INDEX IF NOT EXISTS ix_jobs_finished ON jobs (status, finished_at);
+"""
+
+
+def job(name, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Register a function as the handler for a job name.
+
+    The handler is called with the job payload as keyword arguments, inside an application context.
+
+    Args:
+        name (str): The job name used when enqueueing.
+        max_attempts (int): How many times the job is tried before it is marked as failed.
+    """
+    def decorator(func):
+        func.max_attempts = max_attempts
+        JOB_HANDLERS[name] = func
+        return func
+    return decorator
+
+
+class JobQueue:
+    """
+    Persistent job queue stored in a local SQLite file.
+
+    Jobs survive restarts of both the web and the worker processes. Every thread uses its own
+    connection; claiming a job is done in an immediate transaction so concurrent workers
+    (threads or processes) never pick up the same job.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._schema_ready = False
+        # SQLite connections must not be shared with forked children (e.g. gunicorn workers)
+        os.register_at_fork(after_in_child=self._reset_connections)
+
+    def _reset_connections(self):
+        self._local = threading.local()
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            if not self._schema_ready:
+                # Created on first use rather than at startup, so booting the app does no I/O here
+                connection.executescript(SCHEMA)
+                self._schema_ready = True
+            self._local.connection = connection
+        return connection
+
+    def enqueue(self, name, payload=None, delay=0, dedupe_key=None, max_attempts=None, dedupe_running=True):
+        """
+        Add a job to the queue.
+
+        Args:
+            name (str): Name of a registered job handler.
+            payload (dict, optional): JSON-serializable keyword arguments for the handler.
+            delay (float): Seconds to wait before the job may run.
+            dedupe_key (str, optional): If a queued or running job has the same key, no new job is added.
+            dedupe_running (bool): Also deduplicate against a running job. Pass False for jobs that
+                must run again when asked while running, e.g. to pick up work added meanwhile.
+            max_attempts (int, optional): Overrides the handler's retry limit (the handler must be
+                registered in this process for its own limit to apply; `create_app` imports them all).
+
+        Returns:
+            int or None: The ID of the new job, or None if it was deduplicated.
+        """
+        if max_attempts is None:
+            handler = JOB_HANDLERS.get(name)
+            max_attempts = getattr(handler, 'max_attempts', DEFAULT_MAX_ATTEMPTS)
+
+        now = time.time()
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if dedupe_key is not None:
+                statuses = ('queued', 'running') if dedupe_running else ('queued',)
+                existing = connection.execute(
+                    f"SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ({', '.join('?' * len(statuses))}) LIMIT 1",
+                    (dedupe_key, *statuses)
+                ).fetchone()
+                if existing:
+                    connection.execute('COMMIT')
+                    return None
+            cursor = connection.execute(
+                'INSERT INTO jobs (name, payload, dedupe_key, max_attempts, run_at, enqueued_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (name, json.dumps(payload or {}), dedupe_key, max_attempts, now + delay, now)
+            )
+            connection.execute('COMMIT')
+            return cursor.lastrowid
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def claim(self):
+        """
+        Claim the next job that is due, marking it as running.
+
+        Returns:
+            sqlite3.Row or None: The claimed job, or None if nothing is due.
+        """
+        now = time.time()
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND run_at <= ? ORDER BY run_at, id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ?",
+                    (now, row['id'])
+                )
+            connection.execute('COMMIT')
+            return row
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def complete(self, job_id):
+        """
+        Mark a job as done.
+        """
+        self._connect().execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, last_error = NULL WHERE id = ?",
+            (time.time(), job_id)
+        )
+
+    def fail(self, job_id, attempts, max_attempts, error):
+        """
+        Record a failed attempt: the job is retried with exponential backoff until it runs out of attempts.
+
+        Returns:
+            bool: True if the job will be retried.
+        """
+        now = time.time()
+        if attempts < max_attempts:
+            backoff = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+            backoff *= random.uniform(0.5, 1.5)  # Jitter so failing jobs don't retry in lockstep
+            self._connect().execute(
+                "UPDATE jobs SET status = 'queued', run_at = ?, finished_at = ?, last_error = ? WHERE id = ?",
+                (now + backoff, now, error, job_id)
+            )
+            return True
+        self._connect().execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, last_error = ? WHERE id = ?",
+            (now, error, job_id)
+        )
+        return False
+
+    def requeue_stale(self, timeout):
+        """
+        Put back jobs left running for longer than `timeout` seconds (e.g. by a killed worker).
+
+        Returns:
+            int: The number of jobs requeued.
+        """
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND started_at < ?",
+            (time.time() - timeout,)
+        )
+        return cursor.rowcount
+
+    def stats(self, window=None):
+        """
+        Summarize jobs per name and status, with timing metrics.
+
+        Args:
+            window (float, optional): Only count the queued and running jobs and the ones finished
+                in the last `window` seconds, which the indexes find without scanning the history.
+
+        Returns:
+            list of dict: One entry per (name, status) with the job count, the total attempts, the
+            average wait between enqueue and last start and the average/max run time in seconds.
+        """
+        where, params = '', ()
+        if window is not None:
+            where = "WHERE status IN ('queued', 'running') OR (status IN ('done', 'failed') AND finished_at >= ?) "
+            params = (time.time() - window,)
+        rows = self._connect().execute(
+            'SELECT name, status, COUNT(*) AS jobs, SUM(attempts) AS attempts, '
+            'AVG(started_at - enqueued_at) AS avg_wait, '
+            'AVG(finished_at - started_at) AS avg_runtime, '
+            'MAX(finished_at - started_at) AS max_runtime '
+            f'FROM jobs {where}GROUP BY name, status ORDER BY name, status',
+            params
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def purge(self, older_than, batch_size=1000):
+        """
+        Delete finished jobs older than `older_than` seconds, `batch_size` at a time so enqueues
+        and claims aren't blocked for long.
+
+        Returns:
+            int: The number of jobs deleted.
+        """
+        cutoff = time.time() - older_than
+        deleted = 0
+        while True:
+            cursor = self._connect().execute(
+                "DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE status IN ('done', 'failed') "
+                "AND finished_at < ? LIMIT ?)",
+                (cutoff, batch_size)
+            )
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+
+
+def init_jobs(flask_app):
+    """
+    Attach a job queue to the Flask application.
+
+    The queue file defaults to `skyway_jobs.db` in the app's instance folder and can be changed
+    with the `JOBS_DATABASE` config value.
+    """
+    path = flask_app.config.get('JOBS_DATABASE') or os.path.join(flask_app.instance_path, 'skyway_jobs.db')
+    flask_app.extensions['jobs'] = JobQueue(path)
+    return flask_app.extensions['jobs']
+
+
+def get_queue():
+    """
+    Get the job queue of the current application.
+    """
+    return current_app.extensions['jobs']
+
+
+def enqueue(name, payload=None, **kwargs):
+    """
+    Enqueue a job on the current application's queue. See `JobQueue.enqueue`.
+    """
+    job_id = get_queue().enqueue(name, payload, **kwargs)
+    current_app.logger.debug("Enqueued job %s (id=%s)", name, job_id)
+    return job_id
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import Booking
+from seed_data import seed_data
+from utils.analytics.rollups import compact_search_analytics, roll_up_searches
+from utils.events.outbox import dispatch_events, prune_events
+from utils.flights.flights import record_search
+from utils.flights.schedules import materialize_schedules
+from utils.jobs.queue import enqueue, job
+
+
+@job('record_search')
+def record_search_job(**search):
+    """
+    Save a flight search to the user's search history, and schedule the analytics rollup.
+    """
+    record_search(**search)
+    # At most one pending rollup: searches recorded meanwhile are picked up by the same run
+    enqueue('roll_up_searches', delay=current_app.config.get('ROLLUP_INTERVAL_SECONDS', 300),
+            dedupe_key='roll_up_searches')
+
+
+@job('roll_up_searches', max_attempts=3)
+def roll_up_searches_job():
+    """
+    Aggregate new searches into the analytics rollups, then apply the retention policies.
+    """
+    roll_up_searches()
+    compact_search_analytics()
+
+
+@job('seed_database', max_attempts=3)
+def seed_database_job():
+    """
+    Populate the database with airports, routes and flights.
+    """
+    seed_data()
+
+
+@job('materialize_schedules', max_attempts=3)
+def materialize_schedules_job(days=None):
+    """
+    Expand recurring routes into dated flights, `days` ahead of today (default: the schedule horizon).
+    """
+    through_date = datetime.utcnow().date() + timedelta(days=days) if days is not None else None
+    materialize_schedules(through_date=through_date)
+
+
+@job('dispatch_outbox', max_attempts=10)
+def dispatch_outbox_job():
+    """
+    Deliver new booking events to the outbox sinks, then delete old delivered ones.
+    """
+    dispatch_events()
+    prune_events()
+
+
+@job('send_booking_confirmation')
+def send_booking_confirmation_job(booking_id):
+    """
+    Notify the owner of a booking that their payment was received.
+    """
+    booking = Booking.query.get(booking_id)
+    if booking is None:
+        current_app.logger.warning("Booking %s no longer exists, skipping confirmation", booking_id)
+        return
+    recipient = booking.owner.email if booking.owner else None
+    current_app.logger.info("Sending booking confirmation for %s to %s", booking.reference_number, recipient)
@@ -0,0 +1,164 @@
+"""
+Background job worker.
+
+Run it next to the web server, from the backend directory:
+    python -m utils.jobs.worker --threads 2
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+import traceback
+
+from utils.jobs.queue import JOB_HANDLERS
+
+# Jobs still marked running after this many seconds are assumed to belong to a dead worker
+DEFAULT_STALE_TIMEOUT = 15 * 60
+
+# Seconds between two purges of the finished jobs
+PURGE_INTERVAL = 60 * 60
+
+logger = logging.getLogger('skyway.jobs')
+
+
+class Worker(threading.Thread):
+    """
+    A worker thread that claims jobs from the queue and runs them inside an application context.
+    """
+
+    def __init__(self, flask_app, queue, poll_interval=0.5, stop_event=None, name=None):
+        super().__init__(name=name, daemon=True)
+        self.app = flask_app
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self.stop_event = stop_event or threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                ran = self.run_once()
+            except Exception:
+                logger.exception("Job worker error")
+                ran = False
+            if not ran:
+                self.stop_event.wait(self.poll_interval)
+
+    def run_once(self):
+        """
+        Claim and run a single job.
+
+        Returns:
+            bool: True if a job was run, False if the queue had nothing due.
+        """
+        row = self.queue.claim()
+        if row is None:
+            return False
+
+        handler = JOB_HANDLERS.get(row['name'])
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job {row['name']}")
+            with self.app.app_context():
+                handler(**json.loads(row['payload']))
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            retry = self.queue.fail(row['id'], row['attempts'] + 1, row['max_attempts'],
+                                    ''.join(traceback.format_exception_only(type(e), e)).strip())
+            logger.error("Job %s (id=%s) failed after %.1f ms (attempt %d/%d, %s): %s", row['name'], row['id'],
+                         elapsed * 1000, row['attempts'] + 1, row['max_attempts'],
+                         'retrying' if retry else 'giving up', e)
+            return True
+
+        elapsed = time.perf_counter() - started
+        self.queue.complete(row['id'])
+        logger.info("Job %s (id=%s) done in %.1f ms", row['name'], row['id'], elapsed * 1000)
+        return True
+
+
+class Purger(threading.Thread):
+    """
+    A thread that deletes the jobs finished more than `JOBS_RETENTION_DAYS` ago, every `interval` seconds.
+    """
+
+    def __init__(self, flask_app, queue, interval=PURGE_INTERVAL, stop_event=None):
+        super().__init__(name='job-purger', daemon=True)
+        self.queue = queue
+        self.retention_days = flask_app.config.get('JOBS_RETENTION_DAYS', 7)
+        self.interval = interval
+        self.stop_event = stop_event or threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                deleted = self.queue.purge(self.retention_days * 86400)
+                if deleted:
+                    logger.info("Purged %d finished job(s)", deleted)
+            except Exception:
+                logger.exception("Job purge error")
+            self.stop_event.wait(self.interval)
+
+
+def start_workers(flask_app, threads=1, poll_interval=0.5, stale_timeout=DEFAULT_STALE_TIMEOUT):
+    """
+    Start worker threads for the application's job queue.
+
+    Args:
+        flask_app (Flask): The application whose queue and context the jobs use.
+        threads (int): Number of worker threads.
+        poll_interval (float): Seconds an idle worker waits before polling again.
+        stale_timeout (float): Running jobs older than this are requeued before starting.
+
+    Returns:
+        tuple: (workers, stop_event). Set the event to stop the workers. Unless `JOBS_RETENTION_DAYS`
+        is None, the workers include a `Purger` that keeps the queue from growing without bound.
+    """
+    # Register the job handlers
+    import utils.jobs.tasks  # noqa: F401
+
+    queue = flask_app.extensions['jobs']
+    requeued = queue.requeue_stale(stale_timeout)
+    if requeued:
+        logger.warning("Requeued %s stale job(s)", requeued)
+
+    stop_event = threading.Event()
+    workers = [Worker(flask_app, queue, poll_interval, stop_event, name=f'job-worker-{index}')
+               for index in range(threads)]
+    if flask_app.config.get('JOBS_RETENTION_DAYS', 7) is not None:
+        workers.append(Purger(flask_app, queue, stop_event=stop_event))
+    for worker in workers:
+        worker.start()
+    return workers, stop_event
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run SkyWay background job workers.')
+    parser.add_argument('--threads', type=int, default=2, help='Number of worker threads')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='Seconds between polls when idle')
+    parser.add_argument('--stats', action='store_true', help='Print job metrics and exit')
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()  # Also configures logging
+
+    if args.stats:
+        for row in app.extensions['jobs'].stats():
+            print(row)
+        return
+
+    workers, stop_event = start_workers(app, threads=args.threads, poll_interval=args.poll_interval)
+    logger.info("Started %s job worker(s)", sum(isinstance(worker, Worker) for worker in workers))
+    try:
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("Stopping job workers")
+        stop_event.set()
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import atexit
+import copy
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+# Default format of the text log lines; structured fields are appended as key=value pairs
+TEXT_FORMAT = '[%(asctime)s] [%(levelname)s] %(name)s: %(message)s'
+
+# Records buffered between request threads and the writer thread before new ones are dropped
+DEFAULT_QUEUE_SIZE = 10000
+
+_listener = None
+_queue_handler = None
+
+
+def log_event(logger, level, event, **fields):
+    """
+    Log a structured event without doing any work when `level` is disabled.
+
+    The fields are attached to the record (not interpolated into the message) and rendered by the
+    formatter on the writer thread, e.g. `log_event(logger, logging.DEBUG, 'booking.created', reference=ref)`.
+
+    Args:
+        logger (logging.Logger): The logger to write to.
+        level (int): The logging level, e.g. `logging.DEBUG`.
+        event (str): A short, constant event name.
+        **fields: Values describing the event.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'fields': fields}, stacklevel=2)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Human-readable formatter: the usual log line followed by the record's structured fields.
+    """
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value!r}' for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, for log shippers.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only one in every `every` DEBUG records for each message template.
+
+    Records at INFO and above always pass. Sampling by template (the unformatted message) keeps rare
+    debug events visible while high-volume ones are thinned out.
+    """
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, int(every))
+        self.counters = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        counter = self.counters.get(record.msg)
+        if counter is None:
+            counter = self.counters.setdefault(record.msg, itertools.count())
+        return next(counter) % self.every == 0
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queue handler that drops records instead of blocking when the queue is full.
+
+    Records are queued unformatted: the stdlib `QueueHandler.prepare` builds the message and the
+    traceback text on the calling thread, so that records can be pickled, which an in-process queue
+    doesn't need. The listener thread does all the formatting. Arguments are formatted when the
+    record is written, so log values, not objects that change afterwards.
+    """
+
+    dropped = 0
+
+    def prepare(self, record):
+        # A copy, so formatting on the listener (which caches exc_text) never touches a record
+        # other handlers of the calling thread may still be using
+        return copy.copy(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+def configure_logging(flask_app):
+    """
+    Configure logging for the Flask application and everything it imports.
+
+    Request threads only put records on an in-memory queue; a `QueueListener` thread formats them
+    and writes them to stderr, so slow terminals or pipes never stall a request. Records below
+    `LOG_LEVEL` are discarded before any message is built.
+
+    Config values:
+        LOG_LEVEL: Minimum level, e.g. 'INFO' (default) or 'DEBUG'.
+        LOG_FORMAT: 'text' (default) or 'json'.
+        LOG_DEBUG_SAMPLE_RATE: Keep one in N DEBUG records per message (default 1, i.e. all).
+        LOG_QUEUE_SIZE: Records buffered before new ones are dropped.
+    """
+    global _listener, _queue_handler
+
+    level = getattr(logging, str(flask_app.config.get('LOG_LEVEL', 'INFO')).upper(), logging.INFO)
+
+    if _listener is None:
+        stream_handler = logging.StreamHandler(sys.stderr)
+        if flask_app.config.get('LOG_FORMAT', 'text') == 'json':
+            stream_handler.setFormatter(JsonFormatter())
+        else:
+            stream_handler.setFormatter(TextFormatter(TEXT_FORMAT))
+
+        queue_handler = NonBlockingQueueHandler(queue.Queue(flask_app.config.get('LOG_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)))
+        queue_handler.addFilter(SamplingFilter(flask_app.config.get('LOG_DEBUG_SAMPLE_RATE', 1)))
+
+        # Route everything through the root logger, replacing any handler installed earlier
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+
+        _queue_handler = queue_handler
+        _listener = QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        # Threads don't survive fork(): give server worker processes their own writer thread
+        os.register_at_fork(after_in_child=_restart_after_fork)
+
+    logging.getLogger().setLevel(level)
+    logging.getLogger('werkzeug').setLevel(max(level, logging.INFO))
+
+    # Let the app logger propagate to the root queue handler instead of Flask's default stderr handler
+    flask_app.logger.handlers.clear()
+    flask_app.logger.setLevel(level)
+    flask_app.logger.propagate = True
+
+
+def _restart_after_fork():
+    """
+    Start a new writer thread in a forked child, e.g. a gunicorn worker of a preloaded app.
+    """
+    global _listener
+    if _listener is None:
+        return
+    # The parent's queue may have been locked mid-put when it forked, so start from a fresh one
+    _queue_handler.queue = queue.Queue(_queue_handler.queue.maxsize)
+    _listener = QueueListener(_queue_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """
+    Flush queued records and stop the writer thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
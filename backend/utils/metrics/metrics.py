@@ -0,0 +1,368 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils.flights.pricing import parse_time
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds of the "SQL statements per request" histogram buckets
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# Finished jobs counted in the job metrics; queued and running ones are always counted
+JOB_STATS_WINDOW_SECONDS = 3600
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets, in the Prometheus style.
+    Not thread-safe on its own: updates are done under the registry lock.
+    """
+
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is the +Inf bucket
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def dump(self):
+        return [list(self.counts), self.total, self.count]
+
+    def merge(self, counts, total, count):
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.total += total
+        self.count += count
+
+
+class MetricsRegistry:
+    """
+    In-process store for request, SQL and cache metrics.
+
+    Recording is a couple of dictionary lookups under a lock, cheap enough to leave on in production.
+    Each process keeps its own registry; server workers add theirs up through snapshots (see
+    utils/metrics/multiprocess.py).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.collectors = []  # Callables returning extra (name, labels, value) gauge samples
+        self.process_collectors = []  # The same, for samples of this process only (summed across workers)
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything recorded so far; the collectors stay.
+        """
+        with self.lock:
+            self.request_latency = {}  # (method, endpoint, status) -> Histogram of seconds
+            self.request_sql_count = {}  # endpoint -> Histogram of statements per request
+            self.request_sql_seconds = {}  # endpoint -> total seconds spent in SQL
+            self.sql_latency = Histogram(LATENCY_BUCKETS)
+            self.cache_requests = {}  # (cache, 'hit' | 'miss') -> count
+            self.samples = {}  # (name, labels as sorted pairs) -> value merged from snapshots
+
+    def observe_request(self, method, endpoint, status, seconds, sql_count, sql_seconds):
+        with self.lock:
+            key = (method, endpoint, status)
+            histogram = self.request_latency.get(key)
+            if histogram is None:
+                histogram = self.request_latency[key] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+
+            histogram = self.request_sql_count.get(endpoint)
+            if histogram is None:
+                histogram = self.request_sql_count[endpoint] = Histogram(SQL_COUNT_BUCKETS)
+            histogram.observe(sql_count)
+            self.request_sql_seconds[endpoint] = self.request_sql_seconds.get(endpoint, 0.0) + sql_seconds
+
+    def observe_sql(self, seconds):
+        with self.lock:
+            self.sql_latency.observe(seconds)
+
+    def record_cache(self, cache, hit):
+        key = (cache, 'hit' if hit else 'miss')
+        with self.lock:
+            self.cache_requests[key] = self.cache_requests.get(key, 0) + 1
+
+    def snapshot(self):
+        """
+        Get everything recorded by this registry as JSON-serializable data, for `merge`.
+        Process collectors are evaluated into it; the others aren't included.
+        """
+        samples = self._process_samples()
+        with self.lock:
+            return {
+                'request_latency': [[method, endpoint, status, *histogram.dump()]
+                                    for (method, endpoint, status), histogram in self.request_latency.items()],
+                'request_sql_count': [[endpoint, *histogram.dump()]
+                                      for endpoint, histogram in self.request_sql_count.items()],
+                'request_sql_seconds': self.request_sql_seconds.copy(),
+                'sql_latency': self.sql_latency.dump(),
+                'cache_requests': [[cache, result, count] for (cache, result), count in self.cache_requests.items()],
+                'samples': [[name, dict(labels), value] for (name, labels), value in samples.items()],
+            }
+
+    def merge(self, snapshot):
+        """
+        Add a snapshot (e.g. another process's) to this registry's metrics.
+        """
+        with self.lock:
+            for method, endpoint, status, counts, total, count in snapshot['request_latency']:
+                key = (method, endpoint, status)
+                histogram = self.request_latency.get(key)
+                if histogram is None:
+                    histogram = self.request_latency[key] = Histogram(LATENCY_BUCKETS)
+                histogram.merge(counts, total, count)
+            for endpoint, counts, total, count in snapshot['request_sql_count']:
+                histogram = self.request_sql_count.get(endpoint)
+                if histogram is None:
+                    histogram = self.request_sql_count[endpoint] = Histogram(SQL_COUNT_BUCKETS)
+                histogram.merge(counts, total, count)
+            for endpoint, seconds in snapshot['request_sql_seconds'].items():
+                self.request_sql_seconds[endpoint] = self.request_sql_seconds.get(endpoint, 0.0) + seconds
+            self.sql_latency.merge(*snapshot['sql_latency'])
+            for cache, result, count in snapshot['cache_requests']:
+                self.cache_requests[(cache, result)] = self.cache_requests.get((cache, result), 0) + count
+            for name, labels, value in snapshot['samples']:
+                key = (name, tuple(sorted(labels.items())))
+                self.samples[key] = self.samples.get(key, 0) + value
+
+    def _process_samples(self):
+        with self.lock:
+            samples = self.samples.copy()
+            collectors = list(self.process_collectors)
+        for collector in collectors:
+            for name, labels, value in collector():
+                key = (name, tuple(sorted(labels.items())))
+                samples[key] = samples.get(key, 0) + value
+        return samples
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+        """
+        samples = self._process_samples()
+        lines = []
+        with self.lock:
+            lines.append('# HELP skyway_request_duration_seconds Request latency by endpoint.')
+            lines.append('# TYPE skyway_request_duration_seconds histogram')
+            for (method, endpoint, status), histogram in sorted(self.request_latency.items()):
+                _render_histogram(lines, 'skyway_request_duration_seconds', histogram,
+                                  {'method': method, 'endpoint': endpoint, 'status': status})
+
+            lines.append('# HELP skyway_request_sql_statements SQL statements executed per request.')
+            lines.append('# TYPE skyway_request_sql_statements histogram')
+            for endpoint, histogram in sorted(self.request_sql_count.items()):
+                _render_histogram(lines, 'skyway_request_sql_statements', histogram, {'endpoint': endpoint})
+
+            lines.append('# HELP skyway_request_sql_seconds_total Time spent in SQL by endpoint.')
+            lines.append('# TYPE skyway_request_sql_seconds_total counter')
+            for endpoint, seconds in sorted(self.request_sql_seconds.items()):
+                lines.append(f'skyway_request_sql_seconds_total{_labels({"endpoint": endpoint})} {seconds!r}')
+
+            lines.append('# HELP skyway_sql_duration_seconds Latency of individual SQL statements.')
+            lines.append('# TYPE skyway_sql_duration_seconds histogram')
+            _render_histogram(lines, 'skyway_sql_duration_seconds', self.sql_latency, {})
+
+            lines.append('# HELP skyway_cache_requests_total Cache lookups by result.')
+            lines.append('# TYPE skyway_cache_requests_total counter')
+            for (cache, result), count in sorted(self.cache_requests.items()):
+                lines.append(f'skyway_cache_requests_total{_labels({"cache": cache, "result": result})} {count}')
+
+            collectors = list(self.collectors)
+
+        for (name, labels), value in sorted(samples.items()):
+            lines.append(f'{name}{_labels(dict(labels))} {value!r}')
+        for collector in collectors:
+            for name, labels, value in collector():
+                lines.append(f'{name}{_labels(labels)} {value!r}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _render_histogram(lines, name, histogram, labels):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{_labels({**labels, "le": bound})} {cumulative}')
+    lines.append(f'{name}_bucket{_labels({**labels, "le": "+Inf"})} {histogram.count}')
+    lines.append(f'{name}_sum{_labels(labels)} {histogram.total!r}')
+    lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+
+
+# Process-wide registry
+registry = MetricsRegistry()
+
+
+class SqlCounter:
+    """
+    SQL statements run for one request and the time spent in them. A request can run queries
+    on other threads too (e.g. the search pool), so updates are done under a lock.
+    """
+
+    __slots__ = ('lock', 'count', 'seconds')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.seconds = 0.0
+
+    def add(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.seconds += seconds
+
+
+# Counter of the request a thread outside the request context is running queries for
+_sql_counter = ContextVar('metrics_sql_counter', default=None)
+
+
+def current_sql_counter():
+    """
+    Get the SQL counter of the current request, to hand over to threads running queries for it,
+    or None if there is no request or metrics are disabled.
+    """
+    if has_request_context():
+        return g.get('metrics_sql')
+    return _sql_counter.get()
+
+
+@contextmanager
+def counting_sql(counter):
+    """
+    Count the SQL statements run on this thread inside the block toward `counter`
+    (from `current_sql_counter`, None counts them toward no request).
+    """
+    token = _sql_counter.set(counter)
+    try:
+        yield
+    finally:
+        _sql_counter.reset(token)
+
+
+def record_cache(cache, hit):
+    """
+    Record a cache lookup, so the hit rate of `cache` shows up on the metrics endpoint.
+    """
+    registry.record_cache(cache, hit)
+
+
+def register_collector(collector, per_process=False):
+    """
+    Register a callable returning `(name, labels, value)` gauge samples, evaluated on every scrape.
+    Samples of `per_process` collectors (e.g. in-memory cache stats) are summed across server workers;
+    the others (e.g. database counts) are the same in every process and evaluated once.
+    """
+    (registry.process_collectors if per_process else registry.collectors).append(collector)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+    registry.observe_sql(elapsed)
+    counter = current_sql_counter()
+    if counter is not None:
+        counter.add(elapsed)
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute, so drop its start time here
+    stack = context.connection.info.get('query_start_time') if context.connection is not None else None
+    if stack:
+        stack.pop()
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_sql = SqlCounter()
+
+
+def _observe_request(status):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return  # Already recorded, or the request started before instrumentation
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    counter = g.get('metrics_sql') or SqlCounter()
+    registry.observe_request(request.method, endpoint, status, time.perf_counter() - start,
+                             counter.count, counter.seconds)
+
+
+def _after_request(response):
+    _observe_request(response.status_code)
+    return response
+
+
+def _teardown_request(exception):
+    # Only reached with a pending start time when the view raised and no response was produced
+    if exception is not None:
+        _observe_request(500)
+
+
+def init_metrics(flask_app):
+    """
+    Instrument a Flask application: request latency per endpoint, SQL count and time per request,
+    and SQL statement latency. Disable with the `METRICS_ENABLED` config value.
+    """
+    if not flask_app.config.get('METRICS_ENABLED', True):
+        return
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+    flask_app.before_request(_before_request)
+    flask_app.after_request(_after_request)
+    flask_app.teardown_request(_teardown_request)
+
+    # Collectors are process-wide: replace the ones of a previously created app instead of adding to them
+    registry.collectors[:] = [collector for collector in registry.collectors
+                              if getattr(collector, 'func', None) is not _jobs_collector]
+    registry.process_collectors[:] = [collector for collector in registry.process_collectors
+                                      if collector is not _pricing_cache_collector]
+    register_collector(_pricing_cache_collector, per_process=True)
+    if 'jobs' in flask_app.extensions:
+        register_collector(partial(_jobs_collector, flask_app.extensions['jobs']))
+
+
+def _pricing_cache_collector():
+    info = parse_time.cache_info()
+    yield 'skyway_lru_cache_hits_total', {'cache': 'pricing_parse_time'}, info.hits
+    yield 'skyway_lru_cache_misses_total', {'cache': 'pricing_parse_time'}, info.misses
+    yield 'skyway_lru_cache_size', {'cache': 'pricing_parse_time'}, info.currsize
+
+
+def _jobs_collector(queue):
+    # Pending jobs, and the ones finished recently: scrapes never read the whole job history
+    for row in queue.stats(window=JOB_STATS_WINDOW_SECONDS):
+        labels = {'job': row['name'], 'status': row['status']}
+        yield 'skyway_jobs', labels, row['jobs']
+        if row['avg_runtime'] is not None:
+            yield 'skyway_job_avg_runtime_seconds', labels, row['avg_runtime']
@@ -0,0 +1,179 @@
+"""
+Metrics of all server workers, merged on every scrape.
+
+Gunicorn runs several worker processes, each with its own registry, so a scrape served by one of
+them would only see its share, and a recycled worker would take its counts with it. With
+`METRICS_MULTIPROC_DIR` set, each worker writes a snapshot of its registry to its own file in that
+folder every few seconds (and when it exits), and `/api/_metrics` adds up all the files. The master
+folds the file of an exited worker into an archive, so counters never go back (see gunicorn.conf.py).
+"""
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.metrics.metrics import MetricsRegistry, registry
+
+# Seconds between the snapshots a worker writes, unless `METRICS_SNAPSHOT_SECONDS` is set
+DEFAULT_SNAPSHOT_SECONDS = 5
+
+# Counts of the workers that exited, added up
+ARCHIVE_FILE = 'archive.json'
+
+
+def get_multiprocess_dir(flask_app):
+    """
+    Get the folder the workers write their snapshots to, or None if metrics are per process.
+    """
+    directory = flask_app.config.get('METRICS_MULTIPROC_DIR')
+    if not directory or not flask_app.config.get('METRICS_ENABLED', True):
+        return None
+    return os.path.join(flask_app.instance_path, directory)
+
+
+def _worker_file(directory, pid):
+    return os.path.join(directory, f'worker-{pid}.json')
+
+
+@contextmanager
+def _folder_lock(directory, operation):
+    """
+    Lock the folder: scrapes read it under a shared lock, while the master moves a worker's
+    counts to the archive under an exclusive one, so no scrape counts them twice or not at all.
+    """
+    with open(os.path.join(directory, '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write(path, snapshot):
+    # Written aside then renamed, so readers never see half a file
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(temp_path, path)
+
+
+def write_snapshot(directory):
+    """
+    Write this process's metrics to its file in `directory`.
+    """
+    os.makedirs(directory, exist_ok=True)
+    _write(_worker_file(directory, os.getpid()), registry.snapshot())
+
+
+def collect(directory):
+    """
+    Add up the metrics of all workers, running and exited.
+
+    Returns:
+        MetricsRegistry: The merged metrics, with this process's database collectors.
+    """
+    merged = MetricsRegistry()
+    merged.collectors = list(registry.collectors)
+    with _folder_lock(directory, fcntl.LOCK_SH):
+        paths = [os.path.join(directory, ARCHIVE_FILE)] + sorted(glob.glob(_worker_file(directory, '*')))
+        for path in paths:
+            snapshot = _read(path)
+            if snapshot is not None:
+                merged.merge(snapshot)
+    return merged
+
+
+def render_metrics(flask_app):
+    """
+    Render the metrics of all workers in the Prometheus text format, or of this process only if
+    `METRICS_MULTIPROC_DIR` isn't set.
+    """
+    directory = get_multiprocess_dir(flask_app)
+    if directory is None:
+        return registry.render()
+    write_snapshot(directory)  # So this worker's share is up to date
+    return collect(directory).render()
+
+
+def archive_worker(directory, pid):
+    """
+    Move the counts of an exited worker to the archive. Its in-memory gauges (e.g. cache sizes)
+    are dropped: they went away with the process.
+    """
+    path = _worker_file(directory, pid)
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    with _folder_lock(directory, fcntl.LOCK_EX):
+        snapshot = _read(path)
+        if snapshot is None:
+            return
+        archive = MetricsRegistry()
+        archived = _read(archive_path)
+        if archived is not None:
+            archive.merge(archived)
+        archive.merge({**snapshot, 'samples': []})
+        _write(archive_path, archive.snapshot())
+        os.remove(path)
+
+
+def reset_multiprocess_dir(directory):
+    """
+    Create the folder, or empty it of the files of a previous server run.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.json')) + glob.glob(os.path.join(directory, '*.tmp')):
+        os.remove(path)
+
+
+def _write_snapshots(flask_app, directory, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_snapshot(directory)
+        except OSError:
+            flask_app.logger.exception("Could not write the metrics snapshot")
+
+
+def start_snapshots(flask_app):
+    """
+    Write this worker's metrics to the multiprocess folder every `METRICS_SNAPSHOT_SECONDS`, in the background.
+
+    Args:
+        flask_app (Flask): The application.
+
+    Returns:
+        threading.Thread: The snapshot thread, or None if `METRICS_MULTIPROC_DIR` isn't set.
+    """
+    directory = get_multiprocess_dir(flask_app)
+    if directory is None:
+        return None
+    # Drop what the master recorded before forking (its warm-up), or every worker would report it
+    registry.reset()
+    interval = flask_app.config.get('METRICS_SNAPSHOT_SECONDS', DEFAULT_SNAPSHOT_SECONDS)
+    thread = threading.Thread(target=_write_snapshots, args=(flask_app, directory, interval),
+                              name='metrics-snapshots', daemon=True)
+    thread.start()
+    return thread
+
+
+def flush_snapshot(flask_app):
+    """
+    Write this worker's final metrics before it exits.
+    """
+    directory = get_multiprocess_dir(flask_app)
+    if directory is None:
+        return
+    try:
+        write_snapshot(directory)
+    except OSError:
+        flask_app.logger.exception("Could not write the metrics snapshot")
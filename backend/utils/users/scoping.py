@@ -0,0 +1,35 @@
+"""
+Default scoping of user queries: soft-deleted users (with a `deleted_at`) are left out.
+
+Importing this module installs it (db_config.py does). To see deleted users too, run a query
+with `.execution_options(include_deleted=True)`.
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import with_loader_criteria
+
+from models import User, db
+
+
+def _exclude_deleted_users(state):
+    """
+    Add `deleted_at IS NULL` to every ORM SELECT of users (by entity, column or `session.get`),
+    including one wrapped in a subquery, as `Query.count()` does.
+
+    Queries of other entities are left alone, as are relationship loads, so a deleted user still
+    shows as the owner or a passenger of their existing bookings. The condition matches the partial
+    unique index on active emails, so email lookups use it.
+    """
+    mappers = state.all_mappers
+    if (
+        state.is_select
+        and not state.is_column_load
+        and not state.is_relationship_load
+        and not state.execution_options.get('include_deleted', False)
+        and (not mappers or any(mapper.class_ is User for mapper in mappers))
+    ):
+        state.statement = state.statement.options(
+            with_loader_criteria(User, User.deleted_at.is_(None), include_aliases=True)
+        )
+
+
+event.listen(db.session, 'do_orm_execute', _exclude_deleted_users)
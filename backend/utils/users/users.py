@@ -30,7 +30,7 @@ def get_user_by_id(user_id):
 
         # If no user is found, log an error and return None
         if not user:
-            current_app.logger.error(f"User with ID {user_id} not found")
+            current_app.logger.error("User with ID %s not found", user_id)
             return None
 
         # Return the user object if found
@@ -38,12 +38,12 @@ def get_user_by_id(user_id):
 
     except SQLAlchemyError as e:
         # Log database-specific errors
-        current_app.logger.error(f"Database error fetching user by ID {user_id}: {str(e)}")
+        current_app.logger.error("Database error fetching user by ID %s: %s", user_id, e)
         return None
 
     except Exception as e:
         # Log any unexpected errors
-        current_app.logger.error(f"Unexpected error fetching user by ID {user_id}: {str(e)}")
+        current_app.logger.error("Unexpected error fetching user by ID %s: %s", user_id, e)
         return None
 
 
@@ -72,7 +72,7 @@ def get_user_by_email(email):
 
         # If no user is found, log an error and return None
         if user is None:
-            current_app.logger.error(f"User with email {email} not found")
+            current_app.logger.error("User with email %s not found", email)
             return None
 
         # Return the user object if found
@@ -80,17 +80,17 @@ def get_user_by_email(email):
 
     except NoResultFound:
         # Log the case where no user matches the query
-        current_app.logger.error(f"No result found for email {email}")
+        current_app.logger.error("No result found for email %s", email)
         return None
 
     except SQLAlchemyError as e:
         # Log any database-related errors
-        current_app.logger.error(f"Database error fetching user by email {email}: {str(e)}")
+        current_app.logger.error("Database error fetching user by email %s: %s", email, e)
         return None
 
     except Exception as e:
         # Log any unexpected errors
-        current_app.logger.error(f"Unexpected error fetching user by email {email}: {str(e)}")
+        current_app.logger.error("Unexpected error fetching user by email %s: %s", email, e)
         return None
 
 
@@ -121,7 +121,7 @@ def create_user(first_name, last_name, gender, email, password):
         # Check if email is already in use
         existing_user = User.query.filter_by(email=email).first()
         if existing_user:
-            current_app.logger.error(f"Email {email} is already in use.")
+            current_app.logger.error("Email %s is already in use.", email)
             return None  # Return None or raise an exception for existing email
 
         # Create a new user instance
@@ -139,19 +139,19 @@ def create_user(first_name, last_name, gender, email, password):
         db.session.add(new_user)
         db.session.commit()  # Commit the transaction to save the new user
 
-        current_app.logger.info(f"User {email} created successfully.")
+        current_app.logger.info("User %s created successfully.", email)
         return new_user  # Return the created user object
 
     except SQLAlchemyError as e:
         # Rollback the session if a database error occurs
         db.session.rollback()
-        current_app.logger.error(f"Database error during user creation: {str(e)}")
+        current_app.logger.error("Database error during user creation: %s", e)
         return None
 
     except Exception as e:
         # Rollback the session and log any unexpected errors
         db.session.rollback()
-        current_app.logger.error(f"Unexpected error during user creation: {str(e)}")
+        current_app.logger.error("Unexpected error during user creation: %s", e)
         return None
 
 
@@ -179,7 +179,7 @@ def delete_user(user_id):
         user = User.query.filter_by(id=user_id, deleted_at=None).first()
 
         if user is None:
-            current_app.logger.error(f"User with ID {user_id} not found or already deleted.")
+            current_app.logger.error("User with ID %s not found or already deleted.", user_id)
             return None  # Return None or raise an exception if preferred
 
         # Mark the user as deleted by setting the 'deleted_at' field to the current time
@@ -187,20 +187,20 @@ def delete_user(user_id):
 
         # Commit the change to the database
         db.session.commit()
-        current_app.logger.info(f"User with ID {user_id} successfully soft-deleted.")
+        current_app.logger.info("User with ID %s successfully soft-deleted.", user_id)
 
         return user  # Return the updated user object
 
     except SQLAlchemyError as e:
         # Rollback the session in case of a database error
         db.session.rollback()
-        current_app.logger.error(f"Database error during soft deletion of user ID {user_id}: {str(e)}")
+        current_app.logger.error("Database error during soft deletion of user ID %s: %s", user_id, e)
         return None
 
     except Exception as e:
         # Rollback the session and log any unexpected errors
         db.session.rollback()
-        current_app.logger.error(f"Unexpected error during soft deletion of user ID {user_id}: {str(e)}")
+        current_app.logger.error("Unexpected error during soft deletion of user ID %s: %s", user_id, e)
         return None
 
 
@@ -233,7 +233,7 @@ def update_user(user_id, first_name=None, last_name=None, gender=None, email=Non
         user = User.query.filter_by(id=user_id, deleted_at=None).first()
 
         if user is None:
-            current_app.logger.error(f"User with ID {user_id} not found or already deleted.")
+            current_app.logger.error("User with ID %s not found or already deleted.", user_id)
             return None  # Return None or raise an exception if preferred
 
         # Update fields if new values are provided
@@ -250,18 +250,18 @@ def update_user(user_id, first_name=None, last_name=None, gender=None, email=Non
 
         # Commit the changes to the database
         db.session.commit()
-        current_app.logger.info(f"User with ID {user_id} successfully updated.")
+        current_app.logger.info("User with ID %s successfully updated.", user_id)
 
         return user  # Return the updated user object
 
     except SQLAlchemyError as e:
         # Rollback the session if a database error occurs
         db.session.rollback()
-        current_app.logger.error(f"Database error during update of user ID {user_id}: {str(e)}")
+        current_app.logger.error("Database error during update of user ID %s: %s", user_id, e)
         return None
 
     except Exception as e:
         # Rollback the session and log any unexpected errors
         db.session.rollback()
-        current_app.logger.error(f"Unexpected error during update of user ID {user_id}: {str(e)}")
+        current_app.logger.error("Unexpected error during update of user ID %s: %s", user_id, e)
         return None
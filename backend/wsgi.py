@@ -0,0 +1,47 @@
+"""
+WSGI entry point for production servers.
+
+Run it from the backend directory with:
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from datetime import date
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import create_app
+from models import db
+from utils.flights.airports import get_airport_registry
+from utils.flights.flights import get_all_flights
+
+
+def warm_up(flask_app):
+    """
+    Load shared, read-only state before the server forks its workers.
+
+    With `preload_app` the workers inherit the airport registry and the engine's compiled statement
+    cache from the master process, so their first requests skip the loading and SQL compilation.
+
+    Args:
+        flask_app (Flask): The application to warm up.
+    """
+    with flask_app.app_context():
+        try:
+            registry = get_airport_registry()
+            if registry:
+                # Compile the search statements (airport and date filters, with and without a return window)
+                code = next(iter(registry.by_code))
+                today = date.today()
+                get_all_flights(code, code, today, today, per_page=1)
+                get_all_flights(code, code, today, None, per_page=1)
+                get_all_flights(None, None, today, today, per_page=1)
+        except SQLAlchemyError as e:
+            flask_app.logger.warning("Skipping warm-up, the database is not ready (run `flask migrate`): %s", e)
+            db.session.rollback()
+        finally:
+            # Don't hand open SQLite connections to the forked workers
+            db.session.remove()
+            db.engine.dispose()
+
+
+app = create_app()
+warm_up(app)
@@ -51,6 +51,39 @@ export class BookingService {
     return this.http.get<any>(`${this.apiUrl}/booking`, { params, headers });
   }
 
+  // Fetch several bookings in one request; results are keyed by the id or reference they were asked for
+  viewBookingsBatch(bookingIds: string[], references: string[] = []): Observable<BookingBatchResponse> {
+    let params = new HttpParams();
+
+    if (bookingIds.length) {
+      params = params.set('ids', bookingIds.join(','));
+    }
+    if (references.length) {
+      params = params.set('reference_numbers', references.join(','));
+    }
+
+    // Include token in headers
+    const token = localStorage.getItem('token');
+    let headers = new HttpHeaders();
+    if (token) {
+      headers = headers.set('Authorization', `Bearer ${token}`);
+    }
+
+    return this.http.get<BookingBatchResponse>(`${this.apiUrl}/booking/batch`, { params, headers });
+  }
+
+  // Change a booking; with the version last read, a 409 means someone else changed it first
+  updateBooking(bookingId: string, changes: any, version?: number): Observable<any> {
+    const token = localStorage.getItem('token');
+    let headers = new HttpHeaders();
+    if (token) {
+      headers = headers.set('Authorization', `Bearer ${token}`);
+    }
+
+    const body = version === undefined ? changes : { ...changes, version };
+    return this.http.put<any>(`${this.apiUrl}/booking/${bookingId}`, body, { headers });
+  }
+
 
   payBookings(booking_id: string): Observable<any> {
     // Get token from local storage
@@ -126,6 +159,11 @@ export interface Booking {
   trip_type: string;
 }
 
+export interface BookingBatchResponse {
+  bookings: { [identifier: string]: Booking };
+  errors: { [identifier: string]: { code: number; message: string } };
+}
+
 export interface BookingResponse {
   booking_id: string;
   departing_flight: Flight;